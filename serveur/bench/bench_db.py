@@ -0,0 +1,69 @@
+"""Débit d'insertion et de lecture de ScanResult : réglages SQLite par défaut vs database.py.
+
+Usage (depuis serveur/) : python bench/bench_db.py --rows 2000
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import Session, SQLModel, select
+
+from database import SQLITE_PRAGMAS, make_engine
+from models.resultats_scans import ScanResult
+
+PROFILES = {
+    # Comportement historique : journal rollback, synchronous=FULL
+    "default": {},
+    "tuned": SQLITE_PRAGMAS,
+}
+
+
+def bench_profile(name, pragmas, rows, batch):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", echo=False, pragmas=pragmas)
+        SQLModel.metadata.create_all(engine)
+        now = datetime.datetime.now()
+        results = {}
+
+        t0 = time.perf_counter()
+        for i in range(rows):
+            with Session(engine) as session:
+                session.add(ScanResult(host_id=i % 50, date=now, open_ports={"ports": [22, 80]}))
+                session.commit()
+        results["insert_commit_per_row"] = rows / (time.perf_counter() - t0)
+
+        table = ScanResult.__table__
+        t0 = time.perf_counter()
+        for start in range(0, rows, batch):
+            with engine.begin() as conn:
+                conn.execute(table.insert(), [{"host_id": i % 50, "date": now, "open_ports": {"ports": [22]}}
+                                              for i in range(start, min(rows, start + batch))])
+        results["insert_batched"] = rows / (time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        reads = 200
+        for i in range(reads):
+            with Session(engine) as session:
+                session.exec(select(ScanResult).where(ScanResult.host_id == i % 50)).all()
+        results["read_queries"] = reads / (time.perf_counter() - t0)
+        engine.dispose()
+    print(f"{name:8s} " + "  ".join(f"{k}={v:,.0f}/s" for k, v in results.items()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    for name, pragmas in PROFILES.items():
+        bench_profile(name, pragmas, args.rows, args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Test de charge HTTP : trafic mixte CRUD + scans contre une instance uvicorn réelle.
+
+Usage (depuis serveur/) : python bench/bench_load.py --duration 10 --concurrency 64 [--json report.json]
+
+Pour comparer avec une version antérieure de l'API (handlers synchrones), pointer --app-dir
+sur une autre copie de serveur/, par exemple :
+    git worktree add /tmp/api-sync <commit> && python bench/bench_load.py --app-dir /tmp/api-sync/serveur
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from fixtures import ListenerFarm, free_port
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(app_dir: str, port: int, db_path: str) -> subprocess.Popen:
+    env = dict(os.environ, SQLITE_FILE=db_path, RECURRING_SCANS="false")
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                             "--log-level", "warning"], cwd=app_dir, env=env)
+
+
+class Connection:
+    """Client HTTP/1.1 keep-alive minimal : le générateur de charge doit coûter moins cher que le serveur."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(payload)}\r\n"
+        if body is not None:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(head.encode() + b"\r\n" + payload)
+        try:
+            status_line = await self.reader.readuntil(b"\r\n")
+            length = 0
+            while True:
+                line = await self.reader.readuntil(b"\r\n")
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            data = await self.reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.close()
+            raise
+        return int(status_line.split()[1]), data
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def wait_ready(port: int, timeout: float = 30):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        conn = Connection(port)
+        try:
+            if (await conn.request("GET", "/health"))[0] == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        await asyncio.sleep(0.2)
+    raise RuntimeError("le serveur n'a pas démarré")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(args) -> dict:
+    port = free_port()
+    own_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = start_server(args.app_dir, port, os.path.join(tmp, "load.db"))
+        try:
+            await wait_ready(port)
+            seed = Connection(port)
+            ids = []
+            for i in range(args.hosts):
+                _, data = await seed.request("POST", "/host", {"name": f"h{i}", "ip": f"10.50.{i // 256}.{i % 256}"})
+                ids.append(json.loads(data)["id"])
+            seed.close()
+
+            # Par défaut les scans visent des ports filtrés : lents, mais sans CPU
+            farm = ListenerFarm(open=0, closed=0, filtered=args.filtered if args.scan_ports is None else 0).start()
+            ports = args.scan_ports or farm.spec()
+            scan_path = f"/scan_ports/{args.scan_target}?ports={ports}&timeout={args.scan_timeout}"
+            requests = {
+                "list_hosts": lambda: ("GET", "/hosts?limit=50", None),
+                "read_host": lambda: ("GET", f"/host/{random.choice(ids)}", None),
+                "host_by_ip": lambda: ("GET", f"/hosts/by_ip/10.50.0.{random.randrange(min(args.hosts, 256))}", None),
+                "update_host": lambda: ("PUT", f"/host/{ids[0]}", {"name": "h0", "ip": "10.50.0.0"}),
+                "scan": lambda: ("GET", scan_path, None),
+            }
+            crud = [k for k in requests if k != "scan"]
+            latencies = {k: [] for k in requests}
+            errors = 0
+            deadline = time.monotonic() + args.duration
+
+            async def worker():
+                nonlocal errors
+                conn = Connection(port)
+                while time.monotonic() < deadline:
+                    kind = "scan" if random.random() < args.scan_ratio else random.choice(crud)
+                    t0 = time.perf_counter()
+                    try:
+                        status, _ = await conn.request(*requests[kind]())
+                    except OSError:
+                        errors += 1
+                        continue
+                    if status >= 400:
+                        errors += 1
+                    latencies[kind].append(time.perf_counter() - t0)
+                conn.close()
+
+            started = time.monotonic()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.monotonic() - started
+            farm.stop()
+        finally:
+            server.terminate()
+            server.wait(10)
+
+    total = sum(len(v) for v in latencies.values())
+    # Client et serveur partagent souvent la machine : le temps CPU de chacun situe le goulot
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    report = {
+        "requests": total,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 1),
+        "client_cpu_s": round(own.ru_utime + own.ru_stime - own_before.ru_utime - own_before.ru_stime, 2),
+        "server_cpu_s": round(children.ru_utime + children.ru_stime
+                              - children_before.ru_utime - children_before.ru_stime, 2),
+        "routes": {kind: {"n": len(values), "p50_ms": round(percentile(values, 0.5) * 1000, 2),
+                          "p99_ms": round(percentile(values, 0.99) * 1000, 2)}
+                   for kind, values in latencies.items()},
+    }
+    return report
+
+
+def print_report(args, report: dict):
+    print(f"{args.app_dir} — {args.concurrency} clients, {report['duration_s']:.1f}s, scans {args.scan_ratio:.0%}")
+    print(f"CPU client {report['client_cpu_s']:.1f}s, serveur {report['server_cpu_s']:.1f}s")
+    print(f"total {report['requests']} requêtes, {report['requests_per_s']:,.0f} req/s, {report['errors']} erreurs")
+    for kind, values in report["routes"].items():
+        print(f"  {kind:12s} n={values['n']:6d}  p50={values['p50_ms']:8.1f} ms  p99={values['p99_ms']:8.1f} ms")
+
+
+def add_arguments(parser, prefix: str = ""):
+    parser.add_argument(f"--{prefix}duration", type=float, default=10)
+    parser.add_argument(f"--{prefix}concurrency", type=int, default=64)
+    parser.add_argument(f"--{prefix}hosts", type=int, default=200)
+    parser.add_argument(f"--{prefix}scan-ratio", type=float, default=0.1)
+    parser.add_argument(f"--{prefix}scan-target", default="127.0.0.1")
+    # Par défaut : --filtered ports locaux qui ne répondent jamais (voir fixtures.ListenerFarm)
+    parser.add_argument(f"--{prefix}scan-ports", default=None)
+    parser.add_argument(f"--{prefix}filtered", type=int, default=16)
+    parser.add_argument(f"--{prefix}scan-timeout", type=float, default=0.3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=HERE)
+    parser.add_argument("--json", default=None, help="écrit aussi le rapport dans ce fichier")
+    add_arguments(parser)
+    args = parser.parse_args()
+    report = asyncio.run(run(args))
+    print_report(args, report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
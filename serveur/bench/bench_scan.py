@@ -0,0 +1,62 @@
+"""Compare la boucle connect_ex historique avec le moteur asyncio de scanner.py.
+
+Usage (depuis serveur/) : python bench/bench_scan.py --ports 1-4096
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scanner
+from fixtures import ListenerFarm
+
+
+def legacy_scan(ip, ports):
+    open_ports = []
+    for port in ports:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(0.3)
+        try:
+            if sock.connect_ex((ip, port)) == 0:
+                open_ports.append(port)
+        finally:
+            sock.close()
+    return open_ports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ports", default="1-4096")
+    parser.add_argument("--listeners", type=int, default=8)
+    parser.add_argument("--filtered", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=scanner.DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+
+    farm = ListenerFarm(open=args.listeners, closed=0, filtered=args.filtered).start()
+    expected = farm.open_ports
+    filtered_ports = set(farm.filtered_ports)
+    ports = sorted(set(scanner.parse_ports(args.ports)) | set(expected) | filtered_ports)
+    try:
+        t0 = time.perf_counter()
+        legacy = legacy_scan("127.0.0.1", ports)
+        t_legacy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        result = asyncio.run(scanner.PortScanner(concurrency=args.concurrency).scan("127.0.0.1", ports))
+        t_async = time.perf_counter() - t0
+    finally:
+        farm.stop()
+
+    assert set(expected) <= set(legacy), "legacy scan missed a listener"
+    assert set(expected) <= set(result["open_ports"]), "async scan missed a listener"
+    print(f"ports scannés : {len(ports)} (dont {len(filtered_ports)} filtrés)")
+    print(f"legacy  : {t_legacy:.3f}s ({len(ports) / t_legacy:.0f} ports/s)")
+    print(f"asyncio : {t_async:.3f}s ({len(ports) / t_async:.0f} ports/s) probes={result['probes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Suite de benchmarks hors ligne : scan_ports, /stats, /scans/recent, export et charge HTTP.
+
+Usage (depuis serveur/) :
+    python bench/bench_suite.py --out report.json
+    python bench/bench_suite.py --out new.json --baseline report.json   # code de sortie 1 si régression
+
+Les micro-benchmarks appellent l'application ASGI dans le processus (sans réseau) sur une base
+générée par seed_db.py ; la charge HTTP passe par bench_load.py (uvicorn réel). --app-dir permet
+de mesurer une autre copie de serveur/ avec les mêmes paramètres, pour comparer deux versions.
+"""
+import argparse
+import asyncio
+import datetime
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+HERE = os.path.dirname(BENCH_DIR)
+REPORT_VERSION = 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def summarize(durations, units: int = 1) -> dict:
+    # units : éléments traités par itération (ports, lignes) pour un débit comparable
+    total = sum(durations)
+    return {
+        "n": len(durations),
+        "mean_ms": round(total / len(durations) * 1000, 3),
+        "p50_ms": round(percentile(durations, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+        "per_s": round(len(durations) * units / total, 1) if total else None,
+    }
+
+
+async def asgi_get(app, url: str):
+    # Requête GET directe sur l'application ASGI : mesure le handler et la base, pas la pile réseau
+    parts = urlsplit(url)
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": parts.path, "raw_path": parts.path.encode(), "query_string": parts.query.encode(),
+        "root_path": "", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    status, size, received = [0], [0], asyncio.Event()
+
+    async def receive():
+        # Corps vide, puis aucune déconnexion : StreamingResponse écoute receive() pendant l'envoi
+        if not received.is_set():
+            received.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status[0] = message["status"]
+        elif message["type"] == "http.response.body":
+            size[0] += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    if status[0] != 200:
+        raise RuntimeError(f"{url} : statut {status[0]}")
+    return size[0]
+
+
+async def measure(fn, iterations: int, warmup: int = 2):
+    for _ in range(warmup):
+        await fn()
+    durations, last = [], None
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        last = await fn()
+        durations.append(time.perf_counter() - t0)
+    return durations, last
+
+
+async def bench_scan(scanner, ListenerFarm, args) -> dict:
+    results = {}
+    # Rapide : ports ouverts et fermés uniquement ; lent : avec une part de ports filtrés (délais)
+    for name, filtered in (("scan_ports.open_closed", 0), ("scan_ports.filtered", args.scan_filtered)):
+        with ListenerFarm(open=args.scan_open, closed=max(0, args.scan_ports - args.scan_open - filtered),
+                          filtered=filtered) as farm:
+            ports = farm.ports()
+
+            async def run():
+                return await scanner.PortScanner(timeout=args.scan_timeout).scan("127.0.0.1", ports)
+
+            durations, last = await measure(run, args.scan_iterations, warmup=1)
+        if sorted(last["open_ports"]) != sorted(farm.open_ports):
+            raise RuntimeError(f"{name} : ports ouverts inattendus {last['open_ports']}")
+        summary = summarize(durations, len(ports))
+        summary["per_1000_ports_ms"] = round(summary["mean_ms"] * 1000 / len(ports), 3)
+        summary["ports"] = len(ports)
+        results[name] = summary
+    return results
+
+
+async def bench_http(app, args) -> dict:
+    cases = {
+        "http.stats": ("/stats", args.iterations),
+        "http.scans_recent": ("/scans/recent?n=50", args.iterations),
+        "http.scans_recent_host": ("/scans/recent?n=50&host_id=1", args.iterations),
+        "http.hosts": ("/hosts?limit=100", args.iterations),
+        "http.export_csv": ("/export/scans?format=csv", args.export_iterations),
+        "http.export_ndjson": ("/export/scans?format=ndjson", args.export_iterations),
+    }
+    results = {}
+    for name, (url, iterations) in cases.items():
+        durations, size = await measure(lambda: asgi_get(app, url), iterations)
+        export = name.startswith("http.export")
+        summary = summarize(durations, args.scans if export else 1)
+        summary["bytes"] = size
+        results[name] = summary
+    return results
+
+
+def git_commit(path: str):
+    try:
+        return subprocess.run(["git", "-C", path, "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def run_suite(args, tmp: str) -> dict:
+    # L'application et la base se configurent à l'import : variables posées avant
+    db_path = os.path.join(tmp, "supervision.db")
+    os.environ.update(SQLITE_FILE=db_path, RECURRING_SCANS="false", TASK_BACKEND="local")
+    os.environ.pop("DATABASE_URL", None)
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    sys.path[:0] = [args.app_dir, BENCH_DIR]
+    os.chdir(tmp)
+
+    from fixtures import ListenerFarm
+    from seed_db import seed
+    import main
+    import scanner
+
+    results = {}
+    seeded = seed(f"sqlite:///{db_path}", args.hosts, args.scans, seed=args.seed)
+    results["seed"] = {"insert_per_s": round(args.scans / seeded["insert_s"], 1) if seeded["insert_s"] else None,
+                       "total_s": seeded["total_s"]}
+    started = main.on_start_up()
+    if inspect.isawaitable(started):
+        await started
+    try:
+        results.update(await bench_http(main.app, args))
+        results.update(await bench_scan(scanner, ListenerFarm, args))
+    finally:
+        stopped = main.on_shut_down()
+        if inspect.isawaitable(stopped):
+            await stopped
+    return results
+
+
+def load_benchmark(args) -> dict:
+    import bench_load
+
+    load_args = argparse.Namespace(app_dir=args.app_dir, duration=args.load_duration,
+                                   concurrency=args.load_concurrency, hosts=200, scan_ratio=args.load_scan_ratio,
+                                   scan_target="127.0.0.1", scan_ports=None, filtered=16, scan_timeout=0.3)
+    report = asyncio.run(bench_load.run(load_args))
+    results = {"load.total": {key: report[key] for key in ("requests_per_s", "errors", "server_cpu_s")}}
+    for kind, values in report["routes"].items():
+        results[f"load.{kind}"] = values
+    return results
+
+
+def direction(metric: str):
+    # +1 : plus grand est meilleur ; -1 : plus petit est meilleur ; None : informatif
+    if metric.endswith("per_s"):
+        return 1
+    if metric.endswith("_ms") or metric.endswith("_s") or metric == "errors":
+        return -1
+    return None
+
+
+def compare(baseline: dict, report: dict, threshold: float) -> list:
+    regressions = []
+    print(f"\ncomparaison avec {baseline.get('git') or '?'} ({baseline.get('created')}), seuil {threshold:.0%}")
+    for name, metrics in report["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        for metric, value in metrics.items():
+            sign, before = direction(metric), old.get(metric)
+            if sign is None or not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            if not before:
+                continue
+            change = (value - before) / before
+            worse = -change * sign > threshold
+            flag = "RÉGRESSION" if worse else ""
+            print(f"  {name:28s} {metric:18s} {before:12.3f} -> {value:12.3f}  {change:+7.1%} {flag}")
+            if worse:
+                regressions.append((name, metric, before, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", default=HERE)
+    parser.add_argument("--out", default=None, help="fichier JSON du rapport")
+    parser.add_argument("--baseline", default=None, help="rapport de référence à comparer")
+    parser.add_argument("--threshold", type=float, default=0.15, help="dégradation tolérée (0.15 = 15 %%)")
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--scans", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--export-iterations", type=int, default=3)
+    parser.add_argument("--scan-ports", type=int, default=1000)
+    parser.add_argument("--scan-open", type=int, default=20)
+    parser.add_argument("--scan-filtered", type=int, default=20)
+    parser.add_argument("--scan-timeout", type=float, default=0.3)
+    parser.add_argument("--scan-iterations", type=int, default=5)
+    parser.add_argument("--load-duration", type=float, default=10, help="0 pour ne pas lancer la charge HTTP")
+    parser.add_argument("--load-concurrency", type=int, default=64)
+    parser.add_argument("--load-scan-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+    args.app_dir = os.path.abspath(args.app_dir)
+    out = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            results = asyncio.run(run_suite(args, tmp))
+        finally:
+            os.chdir(cwd)
+    if args.load_duration > 0:
+        results.update(load_benchmark(args))
+
+    report = {
+        "report_version": REPORT_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git": git_commit(args.app_dir),
+        "app_dir": args.app_dir,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "app_dir")},
+        "results": results,
+    }
+    for name, metrics in results.items():
+        print(f"{name:28s} " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"rapport : {out}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != report["params"]:
+            print("attention : paramètres différents de la référence, comparaison indicative")
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Ferme de ports TCP locaux aux états connus, partagée par les benchmarks.
+
+- ouvert : socket en écoute, connexions acceptées puis fermées par un thread
+- fermé : port libéré juste après réservation, le noyau répond RST
+- filtré : backlog 0 rempli par une connexion jamais acceptée, les SYN suivants sont ignorés
+"""
+import selectors
+import socket
+import threading
+from typing import List
+
+
+def free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class ListenerFarm:
+    """Ports locaux ouverts, fermés et filtrés ; à utiliser comme gestionnaire de contexte."""
+
+    def __init__(self, open: int = 8, closed: int = 8, filtered: int = 8, host: str = "127.0.0.1"):
+        self.host = host
+        self.counts = (open, closed, filtered)
+        self.listeners: List[socket.socket] = []
+        self.fillers: List[socket.socket] = []
+        self.open_ports: List[int] = []
+        self.closed_ports: List[int] = []
+        self.filtered_ports: List[int] = []
+        self.selector = selectors.DefaultSelector()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _listen(self, backlog: int) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.host, 0))
+        sock.listen(backlog)
+        self.listeners.append(sock)
+        return sock
+
+    def start(self) -> "ListenerFarm":
+        open, closed, filtered = self.counts
+        for _ in range(open):
+            sock = self._listen(512)
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+            self.open_ports.append(sock.getsockname()[1])
+        for _ in range(filtered):
+            sock = self._listen(0)
+            self.fillers.append(socket.create_connection(sock.getsockname()))
+            self.filtered_ports.append(sock.getsockname()[1])
+        # Réservés ensemble puis libérés : pas de doublon avec les ports ouverts ou filtrés
+        reserved = []
+        for _ in range(closed):
+            sock = socket.socket()
+            sock.bind((self.host, 0))
+            reserved.append(sock)
+        self.closed_ports = [s.getsockname()[1] for s in reserved]
+        for sock in reserved:
+            sock.close()
+        if open:
+            # Sans accept(), la file d'attente se remplit et les ports ouverts finiraient « filtrés »
+            self.thread = threading.Thread(target=self._accept, name="listener-farm", daemon=True)
+            self.thread.start()
+        return self
+
+    def _accept(self):
+        while not self.stop_event.is_set():
+            for key, _ in self.selector.select(0.1):
+                try:
+                    conn, _ = key.fileobj.accept()
+                    conn.close()
+                except OSError:
+                    pass
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.selector.close()
+        for sock in self.fillers + self.listeners:
+            sock.close()
+
+    def ports(self) -> List[int]:
+        return sorted(self.open_ports + self.closed_ports + self.filtered_ports)
+
+    def spec(self) -> str:
+        # Format accepté par scanner.parse_ports / le paramètre `ports` de l'API
+        return ",".join(map(str, self.ports()))
+
+    def __enter__(self) -> "ListenerFarm":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,90 @@
+"""Génère une base de supervision reproductible (hosts + historique de ScanResult) pour les benchmarks.
+
+Usage (depuis serveur/) : python bench/seed_db.py --out /tmp/bench.db --hosts 1000 --scans 100000 --seed 42
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import SQLModel
+
+from database import make_engine
+# Importe aussi les modèles des tables dérivées (porthit, compteurs, portchange) pour create_all
+from migrations import run_migrations
+from models.host import Host
+from models.resultats_scans import ScanResult
+
+# Ports fréquents et leur probabilité d'être ouverts sur un host
+COMMON_PORTS = {22: 0.8, 80: 0.5, 443: 0.5, 3389: 0.2, 445: 0.2, 8080: 0.15, 3306: 0.1, 5432: 0.1, 25: 0.05,
+                21: 0.05, 139: 0.15, 8443: 0.1, 6379: 0.05, 9100: 0.1, 161: 0.05}
+# Probabilité qu'un scan diffère de l'état habituel du host (port ouvert ou fermé entre-temps)
+FLIP_RATE = 0.1
+BATCH = 5000
+
+
+def host_ip(index: int) -> str:
+    return f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+
+def seed(url: str, hosts: int = 1000, scans: int = 50000, days: int = 30, seed: int = 42,
+         migrate: bool = True) -> dict:
+    rng = random.Random(seed)
+    engine = make_engine(url, echo=False)
+    SQLModel.metadata.create_all(engine)
+    started = time.perf_counter()
+    baselines = [sorted(p for p, rate in COMMON_PORTS.items() if rng.random() < rate) for _ in range(hosts)]
+    with engine.begin() as conn:
+        for start in range(0, hosts, BATCH):
+            conn.execute(Host.__table__.insert(), [{"name": f"host-{i}", "ip": host_ip(i)}
+                                                   for i in range(start, min(hosts, start + BATCH))])
+    # Dates croissantes : l'historique ressemble à celui qu'écrit le scan_writer
+    end = datetime.datetime.now()
+    step = datetime.timedelta(days=days) / max(1, scans)
+    date = end - datetime.timedelta(days=days)
+    table = ScanResult.__table__
+    for start in range(0, scans, BATCH):
+        rows = []
+        for _ in range(start, min(scans, start + BATCH)):
+            host = rng.randrange(hosts) if hosts else None
+            ports = set(baselines[host]) if host is not None else set()
+            if rng.random() < FLIP_RATE:
+                ports ^= {rng.choice(list(COMMON_PORTS))}
+            date += step
+            rows.append({"host_id": host + 1 if host is not None else None, "date": date,
+                         "open_ports": {"ports": sorted(ports)}})
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+    inserted = time.perf_counter() - started
+    if migrate:
+        # Tables dérivées remplies comme au démarrage de l'API
+        run_migrations(engine)
+    engine.dispose()
+    return {"hosts": hosts, "scans": scans, "insert_s": round(inserted, 3),
+            "total_s": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default="supervision.db")
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--scans", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="remplace un fichier existant")
+    args = parser.parse_args()
+    if os.path.exists(args.out):
+        if not args.force:
+            parser.error(f"{args.out} existe déjà (--force pour le remplacer)")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.out + suffix):
+                os.remove(args.out + suffix)
+    print(seed(f"sqlite:///{args.out}", args.hosts, args.scans, args.days, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import bindparam, delete, select, update
+
+from config import env_int
+
+BULK_MAX_ROWS = env_int("BULK_MAX_ROWS", 50000)
+# Taille des IN (...) : sous la limite de variables de SQLite
+CHUNK = 500
+
+
+class BulkSpec:
+    """Table cible d'un import en masse ; `key` est la colonne de rapprochement (upsert)."""
+
+    def __init__(self, model, key: str = "id", prepare: Optional[Callable[[dict], dict]] = None,
+                 normalize: Optional[Callable[[Any], Any]] = None):
+        self.model = model
+        self.key = key
+        self.table = model.__table__
+        # Colonnes calculées que les événements ORM ne remplissent pas pour les écritures Core
+        self.prepare = prepare
+        # Forme canonique de la clé (ValueError si invalide), comme la validation du modèle à l'écriture
+        self.normalize = normalize
+
+
+async def read_rows(request: Request) -> List[Any]:
+    # Tableau JSON ou NDJSON (une ligne par objet) ; une ligne NDJSON illisible devient une erreur de ligne
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    text = body.decode("utf-8-sig", errors="replace").strip()
+    if not text:
+        raise HTTPException(status_code=400, detail="Corps vide")
+    if "ndjson" not in content_type and "jsonlines" not in content_type and text.startswith("["):
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"JSON invalide : {e}")
+    else:
+        rows = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                rows.append(ValueError(f"JSON invalide : {e}"))
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Au plus {BULK_MAX_ROWS} lignes par requête")
+    return rows
+
+
+def _error(error) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+
+def validate(spec: BulkSpec, rows: Sequence[Any]) -> Tuple[List[Tuple[int, dict]], Dict[int, dict]]:
+    # Une seule passe : lignes valides (index, valeurs fournies) et résultats d'erreur par index
+    valid, results, seen = [], {}, {}
+    for index, row in enumerate(rows):
+        try:
+            if isinstance(row, Exception):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError("objet JSON attendu")
+            obj = spec.model.model_validate(row)
+        except (ValidationError, ValueError) as e:
+            results[index] = {"index": index, "status": "error", "error": _error(e)}
+            continue
+        values = obj.model_dump(include=set(row) & set(spec.table.c.keys()))
+        if spec.prepare:
+            values = spec.prepare(values)
+        key = values.get(spec.key)
+        if key is not None:
+            if key in seen:
+                results[index] = {"index": index, "status": "error",
+                                  "error": f"{spec.key} en double dans le lot (ligne {seen[key]})"}
+                continue
+            seen[key] = index
+        valid.append((index, values))
+    return valid, results
+
+
+def _existing(conn, spec: BulkSpec, keys: List[Any]) -> Dict[Any, int]:
+    column = spec.table.c[spec.key]
+    found = {}
+    for i in range(0, len(keys), CHUNK):
+        stmt = select(column, spec.table.c.id).where(column.in_(keys[i:i + CHUNK]))
+        for key, row_id in conn.execute(stmt):
+            # Colonne non unique (Serveur.ip) : la première ligne existante fait foi
+            found.setdefault(key, row_id)
+    return found
+
+
+def _insert(conn, spec: BulkSpec, rows: List[dict]) -> List[int]:
+    table = spec.table
+    if not rows:
+        return []
+    # executemany exige les mêmes colonnes partout : les absentes prennent la valeur par défaut du modèle
+    columns = sorted({c for row in rows for c in row})
+    defaults = {c: spec.model.model_fields[c].default for c in columns if c in spec.model.model_fields}
+    params = [{c: row.get(c, defaults.get(c)) for c in columns} for row in rows]
+    if conn.dialect.insert_executemany_returning_sort_by_parameter_order:
+        stmt = table.insert().returning(table.c.id, sort_by_parameter_order=True)
+        return list(conn.execute(stmt, params).scalars())
+    return [conn.execute(table.insert(), p).inserted_primary_key[0] for p in params]
+
+
+def _update(conn, spec: BulkSpec, rows: List[Tuple[int, dict]]):
+    # Seuls les champs fournis sont modifiés ; regroupement par jeu de colonnes pour executemany
+    groups: Dict[frozenset, List[dict]] = {}
+    for row_id, values in rows:
+        values = {c: v for c, v in values.items() if c != "id"}
+        if values:
+            groups.setdefault(frozenset(values), []).append(dict(values, _id=row_id))
+    stmt = update(spec.table).where(spec.table.c.id == bindparam("_id"))
+    for params in groups.values():
+        # Clause SET déduite des clés des paramètres
+        conn.execute(stmt, params)
+
+
+def upsert(engine, spec: BulkSpec, rows: Sequence[Any], all_or_nothing: bool = False) -> dict:
+    valid, results = validate(spec, rows)
+    if all_or_nothing and results:
+        raise HTTPException(status_code=422, detail=sorted(results.values(), key=lambda r: r["index"]))
+    with engine.begin() as conn:
+        keys = [values[spec.key] for _, values in valid if values.get(spec.key) is not None]
+        existing = _existing(conn, spec, keys) if keys else {}
+        inserts, updates = [], []
+        for index, values in valid:
+            row_id = existing.get(values.get(spec.key))
+            if row_id is None:
+                inserts.append((index, values))
+            else:
+                updates.append((index, row_id, values))
+        # Identifiants explicites d'abord : l'auto-incrément des autres lignes ne peut plus les prendre
+        inserts.sort(key=lambda item: item[1].get("id") is None)
+        ids = _insert(conn, spec, [values for _, values in inserts])
+        _update(conn, spec, [(row_id, values) for _, row_id, values in updates])
+    for (index, _), row_id in zip(inserts, ids):
+        results[index] = {"index": index, "status": "created", "id": row_id}
+    for index, row_id, _ in updates:
+        results[index] = {"index": index, "status": "updated", "id": row_id}
+    ordered = [results[i] for i in sorted(results)]
+    counts = {"created": len(inserts), "updated": len(updates), "errors": len(ordered) - len(inserts) - len(updates)}
+    return dict(counts, results=ordered)
+
+
+def normalize_keys(spec: BulkSpec, keys: Sequence[Any]) -> Tuple[List[Any], List[dict]]:
+    # Clés sous la forme stockée ; les invalides sont signalées au lieu de ne rien supprimer en silence
+    if spec.normalize is None:
+        return list(keys), []
+    valid, errors = [], []
+    for key in keys:
+        try:
+            valid.append(spec.normalize(key))
+        except ValueError as e:
+            errors.append({spec.key: key, "status": "error", "error": str(e)})
+    return valid, errors
+
+
+def delete_rows(engine, spec: BulkSpec, ids: Optional[List[int]] = None, keys: Optional[List[Any]] = None) -> dict:
+    table = spec.table
+    keys, errors = normalize_keys(spec, keys or [])
+    deleted = 0
+    with engine.begin() as conn:
+        for column, values in ((table.c.id, ids or []), (table.c[spec.key], keys or [])):
+            for i in range(0, len(values), CHUNK):
+                deleted += conn.execute(delete(table).where(column.in_(values[i:i + CHUNK]))).rowcount
+    return {"deleted": deleted, "errors": len(errors), "results": errors}
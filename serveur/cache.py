@@ -0,0 +1,217 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import event, select, update
+from sqlalchemy.sql.dml import UpdateBase
+
+import metrics
+from config import env_float, env_int
+from models.table_version import TableVersion
+
+CACHE_TTL = env_float("CACHE_TTL", 60)
+CACHE_MAX = env_int("CACHE_MAX", 10000)
+# Intervalle (s) entre deux relectures de tableversion par table ; 0 = à chaque lecture du cache
+CACHE_VERSION_CHECK = env_float("CACHE_VERSION_CHECK", 1.0)
+
+_MISSING = object()
+# Moteurs où lire les versions (track_writes) : asynchrone pour l'API, synchrone pour les threads et workers
+_VERSIONS_ENGINE = None
+_SYNC_VERSIONS_ENGINE = None
+
+CACHE_LOOKUPS = metrics.counter("cache_lookups_total", "Lectures du cache par table", ("table", "result"))
+
+
+class TTLCache:
+    """LRU borné dont les entrées expirent après `ttl` secondes."""
+
+    def __init__(self, maxsize: int = CACHE_MAX, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] > now:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+class TableCache:
+    """Cache de lecture d'une table d'inventaire. `version` est locale au processus (entrées
+    et index en mémoire) ; les entrées sont aussi validées contre la version en base (tableversion),
+    qui porte les écritures des autres processus, et l'ETag des listes en dérive."""
+
+    def __init__(self, name: str, maxsize: int = CACHE_MAX, ttl: float = CACHE_TTL,
+                 version_check: float = CACHE_VERSION_CHECK):
+        self.name = name
+        self.entries = TTLCache(maxsize, ttl)
+        self.version = 0
+        self.db_version: Optional[int] = None
+        self.version_check = version_check
+        self.checked = None
+        self.lock = threading.Lock()
+
+    def _check_due(self) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            if self.checked is not None and now - self.checked < self.version_check:
+                return False
+            self.checked = now
+            return True
+
+    def sync_version(self, db_version: int):
+        # Écriture vue en base (worker.py, autre processus API, imports en masse) : entrées périmées
+        with self.lock:
+            if self.db_version is not None and db_version != self.db_version:
+                self.version += 1
+                self.entries.clear()
+            self.db_version = db_version
+
+    def _lookup(self, key: Hashable):
+        with self.lock:
+            version = self.version
+        value = self.entries.get(key, _MISSING)
+        CACHE_LOOKUPS.inc(table=self.name, result="miss" if value is _MISSING else "hit")
+        return version, value
+
+    def _store(self, version: int, key: Hashable, value: Any):
+        with self.lock:
+            # Une écriture survenue pendant le chargement rend la valeur douteuse
+            if version == self.version:
+                self.entries.set(key, value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        # None est mis en cache aussi : une IP inconnue ne coûte qu'une requête par TTL
+        if _SYNC_VERSIONS_ENGINE is not None and self._check_due():
+            self.sync_version(read_version_sync(self.name))
+        version, value = self._lookup(key)
+        if value is _MISSING:
+            value = loader()
+            self._store(version, key, value)
+        return value
+
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        if _VERSIONS_ENGINE is not None and self._check_due():
+            self.sync_version(await read_version(self.name))
+        version, value = self._lookup(key)
+        if value is _MISSING:
+            value = await loader()
+            self._store(version, key, value)
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+    def etag(self, version: int, *parts) -> str:
+        # Même version en base, même ETag : valable d'un processus à l'autre et après un redémarrage
+        raw = ":".join(str(p) for p in (self.name, version) + parts)
+        return f'W/"{hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()}"'
+
+    def stats(self) -> dict:
+        return dict(self.entries.stats(), version=self.version, db_version=self.db_version)
+
+
+tables: Dict[str, TableCache] = {name: TableCache(name) for name in ("host", "serveur", "entreprise", "action")}
+
+
+def table(name: str) -> TableCache:
+    return tables[name]
+
+
+def invalidate(name: str):
+    tables[name].invalidate()
+
+
+def bump_version(conn, name: str):
+    # Dans la transaction de l'écriture : la version ne change qu'avec les données
+    versions = TableVersion.__table__
+    if conn.execute(update(versions).where(versions.c.name == name)
+                    .values(version=versions.c.version + 1)).rowcount == 0:
+        conn.execute(versions.insert(), {"name": name, "version": 1})
+
+
+def _on_write(conn, clauseelement, multiparams, params, execution_options, result):
+    # INSERT/UPDATE/DELETE sur une table d'inventaire, par l'ORM comme par bulk.py ou les migrations
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    table = getattr(clauseelement, "table", None)
+    if table is not None and table.name in tables and result.rowcount != 0:
+        bump_version(conn, table.name)
+
+
+def track_writes(engine, async_engine=None):
+    global _VERSIONS_ENGINE, _SYNC_VERSIONS_ENGINE
+    for db_engine in (engine, async_engine.sync_engine if async_engine is not None else None):
+        if db_engine is not None and not event.contains(db_engine, "after_execute", _on_write):
+            event.listen(db_engine, "after_execute", _on_write)
+    _SYNC_VERSIONS_ENGINE = engine
+    if async_engine is not None:
+        _VERSIONS_ENGINE = async_engine
+
+
+def read_version_sync(name: str) -> int:
+    versions = TableVersion.__table__
+    with _SYNC_VERSIONS_ENGINE.connect() as conn:
+        version = conn.execute(select(versions.c.version).where(versions.c.name == name)).scalar()
+    return version or 0
+
+
+async def read_version(name: str) -> int:
+    versions = TableVersion.__table__
+    async with _VERSIONS_ENGINE.connect() as conn:
+        version = (await conn.execute(select(versions.c.version).where(versions.c.name == name))).scalar()
+    return version or 0
+
+
+async def not_modified(request: Request, response: Response, name: str, *parts) -> Optional[Response]:
+    # Renvoie une réponse 304 si le client possède déjà cette version de la liste
+    tag = tables[name].etag(await read_version(name), *parts)
+    candidates = {t.strip() for t in request.headers.get("if-none-match", "").split(",")}
+    if tag in candidates or "*" in candidates:
+        return Response(status_code=304, headers={"ETag": tag, "Cache-Control": "no-cache"})
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = "no-cache"
+    return None
+
+
+def stats() -> dict:
+    return {name: t.stats() for name, t in tables.items()}
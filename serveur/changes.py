@@ -0,0 +1,46 @@
+from typing import Any, Dict, Iterable, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.port_change import CLOSED, OPENED, HostPortState, PortChange
+from stats import extract_ports
+
+
+def _save_states(conn, states: Dict[int, dict]):
+    table = HostPortState.__table__
+    rows = list(states.values())
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(conn.dialect.name)
+    if dialect:
+        stmt = dialect.insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.host_id],
+                                          set_={c: stmt.excluded[c] for c in ("ports", "scan_id", "updated")})
+        conn.execute(stmt, rows)
+    else:
+        conn.execute(delete(table).where(table.c.host_id.in_(list(states))))
+        conn.execute(table.insert(), rows)
+
+
+def record_changes(conn, scans: Iterable[Tuple[int, Any, Any, Any]]):
+    # scans : (scan_id, host_id, date, open_ports) dans l'ordre d'écriture ;
+    # les deltas sont calculés contre le dernier état connu de chaque host.
+    scans = [s for s in scans if s[1] is not None]
+    if not scans:
+        return
+    table = HostPortState.__table__
+    host_ids = {host_id for _, host_id, _, _ in scans}
+    known = {row.host_id: set(row.ports or [])
+             for row in conn.execute(select(table.c.host_id, table.c.ports).where(table.c.host_id.in_(host_ids)))}
+    events, states = [], {}
+    for scan_id, host_id, date, open_ports in scans:
+        current = set(extract_ports(open_ports))
+        previous = known.get(host_id, set())
+        events.extend({"host_id": host_id, "scan_id": scan_id, "date": date, "port": p, "change": OPENED}
+                      for p in sorted(current - previous))
+        events.extend({"host_id": host_id, "scan_id": scan_id, "date": date, "port": p, "change": CLOSED}
+                      for p in sorted(previous - current))
+        known[host_id] = current
+        states[host_id] = {"host_id": host_id, "ports": sorted(current), "scan_id": scan_id, "updated": date}
+    if events:
+        conn.execute(PortChange.__table__.insert(), events)
+    _save_states(conn, states)
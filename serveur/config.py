@@ -0,0 +1,28 @@
+import os
+
+from dotenv import load_dotenv
+
+# Les variables déjà présentes dans l'environnement restent prioritaires sur .env
+load_dotenv()
+
+
+def env_str(name: str, default: str = None) -> str:
+    value = os.environ.get(name)
+    return default if value is None or value == "" else value
+
+
+def env_int(name: str, default: int = None) -> int:
+    value = env_str(name)
+    return default if value is None else int(value)
+
+
+def env_float(name: str, default: float = None) -> float:
+    value = env_str(name)
+    return default if value is None else float(value)
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    value = env_str(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
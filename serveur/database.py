@@ -1,10 +1,155 @@
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.pool import NullPool, QueuePool, SingletonThreadPool, StaticPool
 from sqlmodel import SQLModel, create_engine
 
-sqlite_file_name = "supervision.db"
+import metrics
+from config import env_bool, env_int, env_str
+
+sqlite_file_name = env_str("SQLITE_FILE", "supervision.db")
 
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-engine = create_engine(sqlite_url, echo=True)
+database_url = env_str("DATABASE_URL", sqlite_url)
+
+# Pilote asynchrone correspondant au pilote synchrone (handlers async def de l'API)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+POOLS = {
+    "queue": QueuePool,
+    "null": NullPool,
+    "static": StaticPool,
+    "singleton": SingletonThreadPool,
+}
+
+SQLITE_PRAGMAS = {
+    "journal_mode": env_str("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": env_str("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    # Valeur négative = taille en KiB (64 Mo)
+    "cache_size": env_int("SQLITE_CACHE_SIZE", -64 * 1024),
+    "busy_timeout": env_int("SQLITE_BUSY_TIMEOUT", 5000),
+    "temp_store": env_str("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def _pool_options(url: str, pool: str) -> dict:
+    options = {}
+    if pool:
+        if pool not in POOLS:
+            raise ValueError(f"DB_POOL inconnu : {pool} (choix : {', '.join(POOLS)})")
+        options["poolclass"] = POOLS[pool]
+    if pool in (None, "queue"):
+        options["pool_size"] = env_int("DB_POOL_SIZE", 10)
+        options["max_overflow"] = env_int("DB_MAX_OVERFLOW", 20)
+        options["pool_timeout"] = env_int("DB_POOL_TIMEOUT", 30)
+    if not url.startswith("sqlite"):
+        options["pool_pre_ping"] = env_bool("DB_POOL_PRE_PING", True)
+        options["pool_recycle"] = env_int("DB_POOL_RECYCLE", 1800)
+    return options
+
+
+def make_engine(url: str = None, echo: bool = None, pool: str = None, pragmas: dict = None):
+    url = url or database_url
+    pool = pool or env_str("DB_POOL")
+    if echo is None:
+        echo = env_bool("DB_ECHO", False)
+    connect_args = {}
+    if url.startswith("sqlite"):
+        # Sessions ouvertes depuis les threads de FastAPI et de l'écriture différée
+        connect_args["check_same_thread"] = False
+        if pool is None and ":memory:" not in url and "mode=memory" not in url:
+            pool = "queue"
+    db_engine = create_engine(url, echo=echo, connect_args=connect_args, **_pool_options(url, pool))
+    if db_engine.dialect.name == "sqlite":
+        _install_sqlite_pragmas(db_engine, SQLITE_PRAGMAS if pragmas is None else pragmas)
+    _install_metrics(db_engine)
+    return db_engine
+
+
+def _install_sqlite_pragmas(db_engine, pragmas: dict):
+    @event.listens_for(db_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if value is not None:
+                cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def _install_metrics(db_engine):
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def statement_start(conn, cursor, statement, parameters, context, executemany):
+        conn.info["statement_start"] = time.perf_counter()
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def statement_end(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("statement_start", None)
+        if started is not None:
+            # Premier mot-clé seulement : cardinalité bornée
+            operation = (statement.lstrip()[:8].split(None, 1) or [""])[0].upper()
+            metrics.DB_STATEMENT.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(db_engine, "begin")
+    def transaction_start(conn):
+        conn.info["transaction_start"] = time.perf_counter()
+
+    def transaction_end(outcome):
+        def listener(conn):
+            started = conn.info.pop("transaction_start", None)
+            if started is not None:
+                metrics.DB_TRANSACTION.observe(time.perf_counter() - started, outcome=outcome)
+        return listener
+
+    event.listen(db_engine, "commit", transaction_end("commit"))
+    event.listen(db_engine, "rollback", transaction_end("rollback"))
+
+
+@event.listens_for(OrmSession, "before_commit")
+def _session_commit_start(session):
+    session.info["commit_start"] = time.perf_counter()
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _session_commit_end(session):
+    started = session.info.pop("commit_start", None)
+    if started is not None:
+        metrics.DB_COMMIT.observe(time.perf_counter() - started)
+
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    if scheme in ("postgresql+psycopg", "postgresql+asyncpg", "sqlite+aiosqlite"):
+        # psycopg 3 gère déjà l'asynchrone
+        return url
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+def make_async_engine(url: str = None, echo: bool = None, pragmas: dict = None):
+    url = url or env_str("ASYNC_DATABASE_URL") or async_url(database_url)
+    if echo is None:
+        echo = env_bool("DB_ECHO", False)
+    memory = ":memory:" in url or "mode=memory" in url
+    db_engine = create_async_engine(url, echo=echo, **({} if memory else _pool_options(url, None)))
+    # Les événements se posent sur le moteur synchrone sous-jacent
+    if db_engine.dialect.name == "sqlite":
+        _install_sqlite_pragmas(db_engine.sync_engine, SQLITE_PRAGMAS if pragmas is None else pragmas)
+    _install_metrics(db_engine.sync_engine)
+    return db_engine
+
+
+engine = make_engine()
+async_engine = make_async_engine()
 
 def configure_db():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+    from migrations import run_migrations
+
+    SQLModel.metadata.create_all(engine)
+    run_migrations(engine)
@@ -0,0 +1,139 @@
+import csv
+import datetime
+import heapq
+import io
+import itertools
+import json
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+
+from models.port_hit import PortHit
+from models.resultats_scans import ScanResult
+from retention import iter_archived
+from stats import extract_ports
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "columnar": ("application/x-ndjson", "columnar.ndjson"),
+}
+FETCH_SIZE = 1000
+COLUMNAR_BATCH = 10000
+COLUMNS = ("scan_id", "host_id", "date", "ports")
+
+
+class ExportFilters:
+    def __init__(self, host_id: Optional[int] = None, since: Optional[datetime.datetime] = None,
+                 until: Optional[datetime.datetime] = None, port: Optional[int] = None, archives: bool = True):
+        self.host_id = host_id
+        # Ramenées à l'heure locale sans fuseau, comme les dates stockées : la base et les archives
+        # comparent alors les mêmes instants (SQLite compare les dates comme du texte)
+        self.since = _naive(since) if since is not None else None
+        self.until = _naive(until) if until is not None else None
+        self.port = port
+        self.archives = archives
+
+    def query(self):
+        table = ScanResult.__table__
+        query = select(table.c.id, table.c.host_id, table.c.date, table.c.open_ports)
+        if self.host_id is not None:
+            query = query.where(table.c.host_id == self.host_id)
+        if self.since is not None:
+            query = query.where(table.c.date >= self.since)
+        if self.until is not None:
+            query = query.where(table.c.date < self.until)
+        if self.port is not None:
+            query = query.where(table.c.id.in_(select(PortHit.scan_id).where(PortHit.port == self.port)))
+        return query.order_by(table.c.id)
+
+
+    def matches(self, host_id, date: datetime.datetime, ports) -> bool:
+        # Mêmes filtres que query(), appliqués aux lignes relues dans les archives
+        if self.host_id is not None and host_id != self.host_id:
+            return False
+        if self.since is not None and date < self.since:
+            return False
+        if self.until is not None and date >= self.until:
+            return False
+        return self.port is None or self.port in ports
+
+
+def _naive(date: datetime.datetime) -> datetime.datetime:
+    # Les dates des scans sont stockées en heure locale sans fuseau
+    return date.astimezone().replace(tzinfo=None) if date.tzinfo else date
+
+
+def _iter_database(engine, filters: ExportFilters) -> Iterator[tuple]:
+    # Curseur côté serveur quand le backend le permet, lots de FETCH_SIZE lignes sinon
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(filters.query())
+        for row in result:
+            yield row.id, row.host_id, row.date.isoformat() if row.date else "", extract_ports(row.open_ports)
+
+
+def _iter_archives(engine, filters: ExportFilters) -> Iterator[tuple]:
+    for scan_id, host_id, date, open_ports in iter_archived(engine, filters.since, filters.until):
+        ports = extract_ports(open_ports)
+        if filters.matches(host_id, date, ports):
+            yield scan_id, host_id, date.isoformat(), ports
+
+
+def iter_scans(engine, filters: ExportFilters) -> Iterator[tuple]:
+    if not filters.archives:
+        return _iter_database(engine, filters)
+    # Scans archivés par la rétention fusionnés par id ; un scan archivé sans avoir encore été
+    # supprimé (passe interrompue) apparaît deux fois de suite et n'est émis qu'une fois
+    merged = heapq.merge(_iter_database(engine, filters), _iter_archives(engine, filters), key=lambda row: row[0])
+    return (next(group) for _, group in itertools.groupby(merged, key=lambda row: row[0]))
+
+
+def _csv_chunks(rows: Iterator[tuple]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["scan_id", "host_id", "date", "port"])
+    count = 0
+    for scan_id, host_id, date, ports in rows:
+        for port in ports or [""]:
+            writer.writerow([scan_id, host_id if host_id is not None else "", date, port])
+        count += 1
+        if count % FETCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows: Iterator[tuple]) -> Iterator[str]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(COLUMNS, row))))
+        if len(lines) >= FETCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _columnar_chunks(rows: Iterator[tuple]) -> Iterator[str]:
+    # Un bloc par ligne : {"columns": [...], "rows": n, "data": {colonne: [valeurs]}}
+    def block(columns):
+        return json.dumps({"columns": list(COLUMNS), "rows": len(columns[0]),
+                           "data": dict(zip(COLUMNS, columns))}) + "\n"
+
+    columns = [[] for _ in COLUMNS]
+    for row in rows:
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) >= COLUMNAR_BATCH:
+            yield block(columns)
+            columns = [[] for _ in COLUMNS]
+    if columns[0]:
+        yield block(columns)
+
+
+WRITERS = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "columnar": _columnar_chunks}
+
+
+def export_stream(engine, filters: ExportFilters, format: str) -> Iterator[str]:
+    return WRITERS[format](iter_scans(engine, filters))
@@ -0,0 +1,365 @@
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import env_int, env_str
+from models.task import FINISHED, INTERRUPTED
+from scheduler import QueueFull
+
+ACTION_LOG_DIR = env_str("ACTION_LOG_DIR", "logs/actions")
+ACTION_TIMEOUT = env_int("ACTION_TIMEOUT", 60)
+OUTPUT_TAIL = 4096
+POLL_INTERVAL = 0.2
+# Fréquence de consultation de l'état des tâches pendant un /stream (une requête pour toutes les cibles)
+STATE_INTERVAL = 1.0
+# Exécutions sur un seul host (/action/{id}/run_on_host), un fichier par exécution
+SINGLE_DIR = "single"
+# Au plus un parcours de ACTION_LOG_DIR par intervalle, même si evict() est appelé à chaque tâche
+PURGE_INTERVAL = 60
+_last_purge = None
+
+# Exécutions locales qui ont encore des cibles à lancer, pour rendre le créneau d'une tâche annulée
+_ACTIVE: Dict[str, "ActionRun"] = {}
+_ACTIVE_LOCK = threading.Lock()
+
+
+class RunNotFound(KeyError):
+    pass
+
+
+def run_dir(run_id: str) -> str:
+    try:
+        run_id = str(uuid.UUID(run_id))
+    except ValueError:
+        raise RunNotFound(run_id)
+    return os.path.join(ACTION_LOG_DIR, run_id)
+
+
+def single_log_path(host_id: int) -> str:
+    return os.path.join(ACTION_LOG_DIR, SINGLE_DIR, f"{uuid.uuid4()}-{host_id}.log")
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def purge_logs(ttl: float, force: bool = False) -> int:
+    # Logs plus anciens que ttl (TASK_TTL, comme les tâches terminées) : fichier par fichier pour
+    # single/, répertoire entier pour une exécution groupée dont le dernier fichier est assez ancien
+    global _last_purge
+    with _ACTIVE_LOCK:
+        if not force and _last_purge is not None and time.monotonic() - _last_purge < PURGE_INTERVAL:
+            return 0
+        _last_purge = time.monotonic()
+        active = set(_ACTIVE)
+    limit = time.time() - ttl
+    removed = 0
+    try:
+        entries = list(os.scandir(ACTION_LOG_DIR))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        try:
+            files = [f.path for f in os.scandir(entry.path)]
+        except OSError:
+            continue
+        if entry.name == SINGLE_DIR:
+            for path in files:
+                mtime = _mtime(path)
+                if mtime is not None and mtime < limit:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+            continue
+        try:
+            run_dir(entry.name)
+        except RunNotFound:
+            continue
+        mtimes = [m for m in map(_mtime, files) if m is not None] or [_mtime(entry.path) or time.time()]
+        if entry.name not in active and max(mtimes) < limit:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _kill_tree(proc: subprocess.Popen):
+    # Le script tourne dans son propre groupe : ses sous-processus partent avec lui
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+            return
+        except OSError:
+            pass
+    proc.kill()
+
+
+def run_script(script: str, ip: str, log_path: str, timeout: int = ACTION_TIMEOUT) -> dict:
+    # La sortie part directement dans le fichier de log, ligne par ligne
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    exit_path = log_path[:-len(".log")] + ".exit" if log_path.endswith(".log") else log_path + ".exit"
+    result = {"log": log_path}
+    try:
+        with open(log_path, "w", buffering=1, errors="replace") as log:
+            proc = subprocess.Popen([script, ip], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    text=True, errors="replace", bufsize=1, start_new_session=True)
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                _kill_tree(proc)
+
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+            try:
+                for line in proc.stdout:
+                    log.write(line)
+                proc.wait()
+            finally:
+                timer.cancel()
+            result["returncode"] = proc.returncode
+            if timed_out.is_set():
+                result["error"] = f"timeout après {timeout}s"
+    except Exception as e:
+        result["error"] = str(e)
+    result["output"] = read_tail(log_path)
+    _write_json(exit_path, result)
+    return result
+
+
+def _exit_path(directory: str, host_id) -> str:
+    return os.path.join(directory, f"{host_id}.exit")
+
+
+def _task_path(directory: str, host_id) -> str:
+    return os.path.join(directory, f"{host_id}.task")
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def target_aborted(meta: dict, status: str, error: Optional[str]):
+    # Tâche terminée sans exécuter le script (annulée, interrompue, abandonnée) : marqueur .exit
+    # écrit à sa place, puis le créneau passe à la cible suivante si l'exécution vit dans ce processus
+    run_id, host_id = meta.get("run_id"), meta.get("host_id")
+    if not run_id or host_id is None:
+        return
+    try:
+        directory = run_dir(run_id)
+    except RunNotFound:
+        return
+    result = {"status": status, "error": error or status}
+    if not os.path.exists(_exit_path(directory, host_id)):
+        _write_json(_exit_path(directory, host_id), result)
+    with _ACTIVE_LOCK:
+        run = _ACTIVE.get(run_id)
+    if run is not None:
+        run._next()
+    elif status == INTERRUPTED:
+        # Redémarrage : les cibles jamais soumises de cette exécution ne partiront plus
+        manifest = _read_json(os.path.join(directory, "manifest.json")) or {"targets": []}
+        for target in manifest["targets"]:
+            other = target["host_id"]
+            if not os.path.exists(_exit_path(directory, other)) and not os.path.exists(_task_path(directory, other)):
+                _write_json(_exit_path(directory, other), result)
+
+
+def read_tail(path: str, size: int = OUTPUT_TAIL) -> str:
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - size))
+            return f.read().decode(errors="replace")
+    except OSError:
+        return ""
+
+
+class ActionRun:
+    """Exécute une action sur plusieurs hôtes, au plus `concurrency` à la fois,
+    chaque exécution étant une tâche du pool action_run."""
+
+    def __init__(self, tasks, action_id: int, script: str, targets: List[Tuple[int, str]],
+                 concurrency: int = 10, timeout: int = ACTION_TIMEOUT, caller: Optional[str] = None,
+                 priority: int = 0):
+        self.tasks = tasks
+        self.run_id = str(uuid.uuid4())
+        self.dir = run_dir(self.run_id)
+        self.action_id = action_id
+        self.script = script
+        self.timeout = timeout
+        self.caller = caller
+        self.priority = priority
+        self.targets = targets
+        self.pending = deque(targets)
+        self.concurrency = max(1, concurrency)
+        self.lock = threading.Lock()
+
+    def log_path(self, host_id: int) -> str:
+        return os.path.join(self.dir, f"{host_id}.log")
+
+    def start(self) -> dict:
+        os.makedirs(self.dir, exist_ok=True)
+        manifest = {
+            "run_id": self.run_id,
+            "action_id": self.action_id,
+            "script": self.script,
+            "timeout": self.timeout,
+            "concurrency": self.concurrency,
+            "targets": [{"host_id": h, "ip": ip} for h, ip in self.targets],
+        }
+        _write_json(os.path.join(self.dir, "manifest.json"), manifest)
+        # En mode db, pas d'enchaînement entre processus : tout part en file, les workers bornent la concurrence
+        slots = len(self.targets) if self.tasks.distributed else min(self.concurrency, len(self.targets))
+        if slots < len(self.targets):
+            with _ACTIVE_LOCK:
+                _ACTIVE[self.run_id] = self
+        for _ in range(slots):
+            self._next()
+        return manifest
+
+    def _next(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    with _ACTIVE_LOCK:
+                        _ACTIVE.pop(self.run_id, None)
+                    return
+                host_id, ip = self.pending.popleft()
+            meta = {"run_id": self.run_id, "action_id": self.action_id, "host_id": host_id}
+            try:
+                if self.tasks.distributed:
+                    # Tâche nommée exécutée par un worker.py ; ACTION_LOG_DIR doit être partagé entre machines
+                    task_id = self.tasks.submit("action_run", "action_run", self.script, ip, self.log_path(host_id),
+                                                self.timeout, host=ip, caller=self.caller, priority=self.priority,
+                                                meta=meta)
+                else:
+                    task_id = self.tasks.submit("action_run", self._run_one, host_id, ip, host=ip, caller=self.caller,
+                                                priority=self.priority, meta=meta)
+                # Lien cible -> tâche : /runs suit l'état de la tâche si le script ne laisse pas de .exit
+                _write_json(_task_path(self.dir, host_id), {"task_id": task_id})
+                return
+            except QueueFull:
+                _write_json(os.path.join(self.dir, f"{host_id}.exit"), {"error": "file action_run pleine"})
+
+    def _run_one(self, host_id: int, ip: str) -> dict:
+        try:
+            return run_script(self.script, ip, self.log_path(host_id), self.timeout)
+        finally:
+            self._next()
+
+
+def _task_ids(directory: str, host_ids) -> Dict[int, str]:
+    ids = {}
+    for host_id in host_ids:
+        data = _read_json(_task_path(directory, host_id))
+        if data:
+            ids[host_id] = data["task_id"]
+    return ids
+
+
+def _ended(directory: str, host_ids, task_states: Optional[Callable]) -> Dict[int, dict]:
+    # Cibles terminées : .exit écrit par le script, ou tâche dans un état final sans .exit
+    ended, waiting = {}, []
+    for host_id in host_ids:
+        result = _read_json(_exit_path(directory, host_id))
+        if result is not None:
+            ended[host_id] = result
+        else:
+            waiting.append(host_id)
+    if waiting and task_states is not None:
+        task_ids = _task_ids(directory, waiting)
+        states = task_states(list(task_ids.values())) if task_ids else {}
+        for host_id, task_id in task_ids.items():
+            # Tâche purgée (TTL) : elle est terminée depuis longtemps
+            status, error = states.get(task_id, ("failed", "tâche introuvable"))
+            if status in FINISHED and not os.path.exists(_exit_path(directory, host_id)):
+                ended[host_id] = {"status": status, "error": error or status}
+    return ended
+
+
+def run_status(run_id: str, task_states: Optional[Callable] = None) -> dict:
+    # task_states(ids) -> {task_id: (status, error)} ; sans elle, seuls les .exit comptent
+    directory = run_dir(run_id)
+    manifest = _read_json(os.path.join(directory, "manifest.json"))
+    if manifest is None:
+        raise RunNotFound(run_id)
+    ended = _ended(directory, [t["host_id"] for t in manifest["targets"]], task_states)
+    for target in manifest["targets"]:
+        result = ended.get(target["host_id"])
+        if result is not None:
+            target.update(result)
+            target.pop("output", None)
+        target["done"] = result is not None
+    manifest["done"] = len(ended) == len(manifest["targets"])
+    manifest["completed"] = len(ended)
+    return manifest
+
+
+async def stream_run(run_id: str, task_states: Optional[Callable] = None):
+    # Suit les fichiers de log sur disque (comme tail -f) jusqu'à la fin de toutes les exécutions
+    manifest = run_status(run_id)
+    directory = run_dir(run_id)
+    offsets = {t["host_id"]: 0 for t in manifest["targets"]}
+    partial = {t["host_id"]: "" for t in manifest["targets"]}
+    ips = {t["host_id"]: t["ip"] for t in manifest["targets"]}
+    finished = set()
+    checked = 0.0
+    while len(finished) < len(offsets):
+        progressed = False
+        waiting = [host_id for host_id in offsets if host_id not in finished]
+        # État des tâches consulté au plus toutes les STATE_INTERVAL secondes, hors de la boucle d'événements
+        states = None
+        if task_states is not None and time.monotonic() - checked >= STATE_INTERVAL:
+            states, checked = task_states, time.monotonic()
+        ended = await asyncio.to_thread(_ended, directory, waiting, states)
+        for host_id in waiting:
+            try:
+                with open(os.path.join(directory, f"{host_id}.log"), "rb") as f:
+                    f.seek(offsets[host_id])
+                    chunk = f.read()
+            except OSError:
+                chunk = b""
+            if chunk:
+                progressed = True
+                offsets[host_id] += len(chunk)
+                lines = (partial[host_id] + chunk.decode(errors="replace")).split("\n")
+                partial[host_id] = lines.pop()
+                for line in lines:
+                    yield {"host_id": host_id, "ip": ips[host_id], "line": line}
+            if host_id in ended:
+                if partial[host_id]:
+                    yield {"host_id": host_id, "ip": ips[host_id], "line": partial[host_id]}
+                result = dict(ended[host_id])
+                result.pop("output", None)
+                yield dict(result, host_id=host_id, ip=ips[host_id], event="exit")
+                finished.add(host_id)
+                progressed = True
+        if not progressed:
+            await asyncio.sleep(POLL_INTERVAL)
+    yield {"event": "done", "run_id": run_id}
@@ -0,0 +1,221 @@
+import asyncio
+import re
+import ssl
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from cache import TTLCache
+from config import env_float, env_int
+
+FINGERPRINT_TIMEOUT = env_float("FINGERPRINT_TIMEOUT", 1.0)
+FINGERPRINT_BANNER_WAIT = env_float("FINGERPRINT_BANNER_WAIT", 0.5)
+FINGERPRINT_CONCURRENCY = env_int("FINGERPRINT_CONCURRENCY", 64)
+FINGERPRINT_TTL = env_float("FINGERPRINT_TTL", 3600)
+FINGERPRINT_CACHE_MAX = env_int("FINGERPRINT_CACHE_MAX", 50000)
+READ_SIZE = 2048
+BANNER_CHARS = 128
+# Ports où le handshake TLS est tenté en premier (HTTPS, SMTPS, LDAPS, IMAPS, POP3S...)
+TLS_PORTS = {443, 465, 636, 853, 990, 992, 993, 994, 995, 5061, 6443, 8443, 9443}
+
+FINGERPRINT_PROBES = metrics.counter("fingerprint_probes_total", "Sondes d'identification par étape et résultat",
+                                     ("step", "result"))
+FINGERPRINT_LOOKUPS = metrics.counter("fingerprint_cache_lookups_total", "Lectures du cache d'empreintes",
+                                      ("result",))
+
+# (sonde, service, produit, préfixe littéral, motif) ; groupes nommés `version` et `product` facultatifs.
+# Le préfixe sert d'index : seules les signatures dont il correspond au début de la réponse sont testées.
+SIGNATURES = [
+    ("banner", "ssh", "OpenSSH", b"SSH-", rb"^SSH-[\d.]+-OpenSSH_(?P<version>[\w.]+)"),
+    ("banner", "ssh", "Dropbear", b"SSH-", rb"^SSH-[\d.]+-dropbear_(?P<version>[\w.]+)"),
+    ("banner", "ssh", None, b"SSH-", rb"^SSH-[\d.]+-(?P<product>[^\s_]+)(?:_(?P<version>\S+))?"),
+    ("banner", "ftp", "vsftpd", b"220", rb"^220[ -].*?vsFTPd (?P<version>[\w.]+)"),
+    ("banner", "ftp", "ProFTPD", b"220", rb"^220[ -].*?ProFTPD (?P<version>[\w.]+)"),
+    ("banner", "ftp", "FileZilla Server", b"220", rb"^220[ -].*?FileZilla Server(?: version)? (?P<version>[\w.]+)"),
+    ("banner", "ftp", "Pure-FTPd", b"220", rb"^220[ -].*?Pure-FTPd"),
+    ("banner", "smtp", "Postfix", b"220", rb"^220[ -]\S+ E?SMTP Postfix"),
+    ("banner", "smtp", "Exim", b"220", rb"^220[ -]\S+ E?SMTP Exim (?P<version>[\w.]+)"),
+    ("banner", "smtp", "Microsoft ESMTP", b"220", rb"^220[ -]\S+ Microsoft ESMTP MAIL Service"),
+    ("banner", "smtp", "Sendmail", b"220", rb"^220[ -]\S+ E?SMTP Sendmail (?P<version>[\w./]+)"),
+    ("banner", "smtp", None, b"220", rb"^220[ -].*E?SMTP"),
+    ("banner", "ftp", None, b"220", rb"^220[ -].*FTP"),
+    ("banner", "pop3", "Dovecot", b"+OK", rb"^\+OK.*Dovecot"),
+    ("banner", "pop3", None, b"+OK", rb"^\+OK"),
+    ("banner", "imap", "Dovecot", b"* OK", rb"^\* OK.*Dovecot"),
+    ("banner", "imap", None, b"* OK", rb"^\* OK"),
+    ("banner", "vnc", None, b"RFB ", rb"^RFB (?P<version>\d{3}\.\d{3})"),
+    ("banner", "mysql", "MariaDB", b"", rb"^.{4}\x0a(?:5\.5\.5-)?(?P<version>[\d.]+)-MariaDB"),
+    ("banner", "mysql", "MySQL", b"", rb"^.{4}\x0a(?P<version>\d+\.\d+\.\d+)[^\x00]*\x00"),
+    ("http", "http", "nginx", b"HTTP/", rb"\r\nServer: nginx(?:/(?P<version>[\w.]+))?"),
+    ("http", "http", "Apache httpd", b"HTTP/", rb"\r\nServer: Apache(?:/(?P<version>[\w.]+))?"),
+    ("http", "http", "Microsoft IIS", b"HTTP/", rb"\r\nServer: Microsoft-IIS/(?P<version>[\w.]+)"),
+    ("http", "http", "lighttpd", b"HTTP/", rb"\r\nServer: lighttpd(?:/(?P<version>[\w.]+))?"),
+    ("http", "http", "Caddy", b"HTTP/", rb"\r\nServer: Caddy"),
+    ("http", "http", "uvicorn", b"HTTP/", rb"\r\nServer: uvicorn"),
+    ("http", "http", None, b"HTTP/", rb"\r\nServer: (?P<product>[^/\r\n]+?)(?:/(?P<version>[^\s\r\n]+))?[ \t]*\r\n"),
+    ("http", "http", None, b"HTTP/", rb"^HTTP/\d"),
+]
+
+
+class SignatureIndex:
+    """Signatures compilées une fois, regroupées par sonde puis par préfixe de réponse."""
+
+    def __init__(self, signatures=SIGNATURES):
+        self.index: Dict[str, List[Tuple[bytes, list]]] = {}
+        for probe, service, product, prefix, pattern in signatures:
+            groups = self.index.setdefault(probe, [])
+            for known, sigs in groups:
+                if known == prefix:
+                    break
+            else:
+                sigs = []
+                groups.append((prefix, sigs))
+            sigs.append((service, product, re.compile(pattern, re.DOTALL | re.IGNORECASE)))
+
+    def match(self, probe: str, data: bytes) -> Optional[dict]:
+        # Ordre de déclaration respecté : les signatures précises passent avant les génériques
+        for prefix, sigs in self.index.get(probe, ()):
+            if not data.startswith(prefix):
+                continue
+            for service, product, regex in sigs:
+                found = regex.search(data)
+                if found:
+                    groups = found.groupdict()
+                    return {
+                        "service": service,
+                        "product": product or _text(groups.get("product")),
+                        "version": _text(groups.get("version")),
+                    }
+        return None
+
+
+def _text(value: Optional[bytes]) -> Optional[str]:
+    return value.decode("latin-1").strip() if value else None
+
+
+def _banner(data: bytes) -> str:
+    return data[:BANNER_CHARS].decode("latin-1").split("\r\n\r\n")[0].strip()
+
+
+signatures = SignatureIndex()
+
+
+def _tls_context() -> ssl.SSLContext:
+    # On identifie, on ne valide pas : certificats auto-signés et vieux protocoles acceptés
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.set_alpn_protocols(["http/1.1"])
+    return context
+
+
+_TLS = _tls_context()
+
+
+async def exchange(ip: str, port: int, payload: Optional[bytes] = None, wait: float = FINGERPRINT_TIMEOUT,
+                   timeout: float = FINGERPRINT_TIMEOUT, tls: bool = False) -> Tuple[bytes, Optional[dict]]:
+    # Une connexion : envoi éventuel, puis lecture de la première réponse pendant `wait` secondes
+    async with asyncio.timeout(timeout):
+        reader, writer = await asyncio.open_connection(ip, port, ssl=_TLS if tls else None,
+                                                       server_hostname="" if tls else None)
+    try:
+        session = None
+        if tls:
+            obj = writer.get_extra_info("ssl_object")
+            session = {"version": obj.version(), "cipher": (obj.cipher() or (None,))[0],
+                       "alpn": obj.selected_alpn_protocol()}
+        if payload:
+            writer.write(payload)
+        data = b""
+        try:
+            async with asyncio.timeout(wait):
+                data = await reader.read(READ_SIZE)
+        except TimeoutError:
+            pass
+        return data, session
+    finally:
+        writer.close()
+
+
+def _http_probe(ip: str) -> bytes:
+    return f"HEAD / HTTP/1.0\r\nHost: {ip}\r\nUser-Agent: supervision\r\n\r\n".encode()
+
+
+async def _step(name: str, coro) -> Tuple[bytes, Optional[dict]]:
+    try:
+        data, session = await coro
+    except (OSError, TimeoutError, ssl.SSLError, EOFError):
+        FINGERPRINT_PROBES.inc(step=name, result="error")
+        return b"", None
+    FINGERPRINT_PROBES.inc(step=name, result="data" if data or session else "empty")
+    return data, session
+
+
+def _identify(data: bytes) -> Optional[dict]:
+    return signatures.match("http", data) if data.startswith(b"HTTP/") else signatures.match("banner", data)
+
+
+async def fingerprint_port(ip: str, port: int, timeout: float = FINGERPRINT_TIMEOUT,
+                           banner_wait: float = FINGERPRINT_BANNER_WAIT) -> dict:
+    started = time.monotonic()
+    result = {"service": None, "product": None, "version": None}
+    steps = ["tls", "banner", "http"] if port in TLS_PORTS else ["banner", "http", "tls"]
+    for step in steps:
+        if step == "banner":
+            # Services qui parlent en premier (SSH, SMTP, FTP, POP3, IMAP, MySQL, VNC)
+            data, _ = await _step(step, exchange(ip, port, wait=banner_wait, timeout=timeout))
+        elif step == "http":
+            data, _ = await _step(step, exchange(ip, port, _http_probe(ip), timeout=timeout))
+        else:
+            data, session = await _step(step, exchange(ip, port, _http_probe(ip), timeout=timeout, tls=True))
+            if session is None:
+                continue
+            result["tls"] = session
+            found = _identify(data) if data else None
+            if found:
+                result.update(found)
+                if found["service"] == "http":
+                    result["service"] = "https"
+            else:
+                result["service"] = "tls"
+            if data:
+                result["banner"] = _banner(data)
+            break
+        if data:
+            result.update(_identify(data) or {"service": "unknown"})
+            result["banner"] = _banner(data)
+            break
+    result["duration"] = round(time.monotonic() - started, 3)
+    return result
+
+
+_cache = TTLCache(FINGERPRINT_CACHE_MAX, FINGERPRINT_TTL)
+
+
+async def fingerprint_ports(ip: str, ports: Iterable[int], concurrency: int = FINGERPRINT_CONCURRENCY,
+                            use_cache: bool = True, **options) -> Dict[str, dict]:
+    # Clés en chaîne : le résultat est stocké tel quel dans ScanResult.open_ports (JSON)
+    ports = sorted(set(ports))
+    sem = asyncio.Semaphore(max(1, concurrency))
+    results: Dict[str, dict] = {}
+
+    async def one(port: int):
+        cached = _cache.get((ip, port)) if use_cache else None
+        FINGERPRINT_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+        if cached is not None:
+            results[str(port)] = dict(cached, cached=True)
+            return
+        async with sem:
+            found = await fingerprint_port(ip, port, **options)
+        # Échec ou silence à toutes les étapes (reset passager, délai dépassé) : pas mis en cache,
+        # sinon le vrai service resterait masqué pendant FINGERPRINT_TTL
+        if found["service"] is not None:
+            _cache.set((ip, port), found)
+        results[str(port)] = found
+
+    await asyncio.gather(*(one(p) for p in ports))
+    return {str(p): results[str(p)] for p in ports}
+
+
+def stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,159 @@
+"""Adresses IP de l'inventaire : validation, forme entière (IPv4) et index en mémoire.
+
+`Host.ip_int` / `Serveur.ip_int` portent l'adresse IPv4 sous forme d'entier, indexée :
+un CIDR devient une plage `ip_int BETWEEN début AND fin` évaluée par la base. Les adresses
+IPv6 gardent ip_int à NULL et sont filtrées en Python, avant le calcul du curseur de pagination.
+"""
+import bisect
+import ipaddress
+import threading
+import time
+from array import array
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import select
+
+import cache
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def normalize_ip(value: str) -> str:
+    # Forme canonique (IPv6 compressée) ; « 10.0.0.01 » ou un nom d'hôte sont refusés
+    try:
+        return str(ipaddress.ip_address(value.strip()))
+    except (AttributeError, ValueError):
+        raise ValueError(f"IP non valide : {value!r}")
+
+
+def ip_to_int(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        address = ipaddress.ip_address(str(value).strip())
+    except ValueError:
+        return None
+    return int(address) if address.version == 4 else None
+
+
+def with_ip_int(values: dict) -> dict:
+    # Colonne calculée pour les écritures hors ORM (bulk.py)
+    if "ip" in values:
+        values["ip_int"] = ip_to_int(values["ip"])
+    return values
+
+
+def parse_network(cidr: str) -> Network:
+    return ipaddress.ip_network(cidr.strip(), strict=False)
+
+
+def network_range(network: Network) -> Tuple[int, int]:
+    return int(network.network_address), int(network.broadcast_address)
+
+
+def in_network_clause(model, network: Network):
+    # Plage sur l'index ip_int en IPv4 ; en IPv6, seules les lignes sans ip_int sont candidates
+    if network.version == 4:
+        start, end = network_range(network)
+        return model.ip_int.between(start, end)
+    return model.ip_int.is_(None)
+
+
+def filter_network(rows: Iterable, network: Network) -> List:
+    # Complément Python de in_network_clause pour les adresses IPv6 (ou invalides)
+    if network.version == 4:
+        return list(rows)
+    result = []
+    for row in rows:
+        try:
+            if ipaddress.ip_address(row.ip) in network:
+                result.append(row)
+        except ValueError:
+            continue
+    return result
+
+
+def network_filter(network: Optional[Network]) -> Optional[Callable[[Iterable], List]]:
+    # Filtre à passer à la pagination (keep) ; None quand la clause SQL suffit (IPv4)
+    if network is None or network.version == 4:
+        return None
+    return lambda rows: filter_network(rows, network)
+
+
+class IPIndex:
+    """Adresses IPv4 triées et identifiants associés : recherche exacte et par plage en O(log n)."""
+
+    def __init__(self, pairs: Iterable[Tuple[int, int]] = ()):
+        pairs = sorted(pairs)
+        self.keys = array("L", (ip for ip, _ in pairs))
+        self.ids = array("q", (row_id for _, row_id in pairs))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, ip) -> bool:
+        return self.get(ip) is not None
+
+    def get(self, ip) -> Optional[int]:
+        key = ip if isinstance(ip, int) else ip_to_int(ip)
+        if key is None:
+            return None
+        i = bisect.bisect_left(self.keys, key)
+        return self.ids[i] if i < len(self.keys) and self.keys[i] == key else None
+
+    def _bounds(self, network: Network) -> Tuple[int, int]:
+        if network.version != 4:
+            return 0, 0
+        start, end = network_range(network)
+        return bisect.bisect_left(self.keys, start), bisect.bisect_right(self.keys, end)
+
+    def count(self, network: Network) -> int:
+        lo, hi = self._bounds(network)
+        return hi - lo
+
+    def items(self, network: Network) -> Iterator[Tuple[str, int]]:
+        # (ip, id) des adresses connues du réseau, dans l'ordre des adresses
+        lo, hi = self._bounds(network)
+        for i in range(lo, hi):
+            yield str(ipaddress.IPv4Address(self.keys[i])), self.ids[i]
+
+
+class InventoryIndex:
+    """IPIndex d'une table d'inventaire, reconstruit quand la table change (version du cache) ou après le TTL."""
+
+    def __init__(self, engine, model, table: str):
+        self.engine = engine
+        self.model = model
+        self.table = table
+        self.lock = threading.Lock()
+        self.index: Optional[IPIndex] = None
+        self.version = -1
+        self.built = 0.0
+        self.builds = 0
+
+    def _stale(self) -> bool:
+        table = cache.table(self.table)
+        return (self.index is None or self.version != table.version
+                or time.monotonic() - self.built > table.entries.ttl)
+
+    def get(self) -> IPIndex:
+        if not self._stale():
+            return self.index
+        with self.lock:
+            if self._stale():
+                version = cache.table(self.table).version
+                with self.engine.connect() as conn:
+                    rows = conn.execute(select(self.model.ip_int, self.model.id)
+                                        .where(self.model.ip_int.is_not(None))).all()
+                # Plusieurs lignes sur la même IP (Serveur.ip n'est pas unique) : la plus ancienne fait foi
+                pairs = {}
+                for ip, row_id in rows:
+                    pairs[ip] = min(row_id, pairs.get(ip, row_id))
+                self.index = IPIndex(pairs.items())
+                self.version, self.built = version, time.monotonic()
+                self.builds += 1
+            return self.index
+
+    def stats(self) -> dict:
+        return {"size": len(self.index) if self.index is not None else None, "builds": self.builds,
+                "version": self.version}
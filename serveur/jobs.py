@@ -0,0 +1,135 @@
+import asyncio
+import ipaddress
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from sqlmodel import Session, select
+
+import cache
+import fanout
+import fingerprint as fingerprints
+import recurring
+import scanner
+import sweep
+from config import env_int
+from database import engine
+from models.host import Host
+from persistence import scan_writer
+
+# Tâches de fond exécutables par nom : les arguments doivent rester sérialisables en JSON
+# pour passer par la table task (TASK_BACKEND=db, processus worker.py)
+HANDLERS: Dict[str, Callable] = {}
+# Appelés quand une tâche du type se termine sans que son handler ait tourné (annulée, interrompue, abandonnée)
+ABORT_HANDLERS: Dict[str, Callable] = {}
+
+SWEEP_SPLIT_PREFIX = env_int("SWEEP_SPLIT_PREFIX", 24)
+SWEEP_MAX_PARTS = env_int("SWEEP_MAX_PARTS", 1024)
+
+
+class UnknownHandler(KeyError):
+    pass
+
+
+def handler(name: str):
+    def register(fn: Callable) -> Callable:
+        HANDLERS[name] = fn
+        return fn
+    return register
+
+
+def on_abort(type: str):
+    def register(fn: Callable) -> Callable:
+        ABORT_HANDLERS[type] = fn
+        return fn
+    return register
+
+
+def aborted(type: str, meta: Optional[dict], status: str, error: Optional[str] = None):
+    fn = ABORT_HANDLERS.get(type)
+    if fn is not None:
+        fn(meta or {}, status, error)
+
+
+def purge_files(ttl: float):
+    # Fichiers laissés sur disque par les tâches (logs d'actions), conservés aussi longtemps qu'elles
+    fanout.purge_logs(ttl)
+
+
+def get(name: str) -> Callable:
+    try:
+        return HANDLERS[name]
+    except KeyError:
+        raise UnknownHandler(name)
+
+
+def run(name: str, args: Sequence[Any]) -> Any:
+    return get(name)(*args)
+
+
+def host_by_ip(ip: str) -> Optional[Host]:
+    # Version synchrone pour les threads (scan_writer, pools de tâches, workers)
+    def load():
+        with Session(engine) as session:
+            return session.exec(select(Host).where(Host.ip == ip)).first()
+    return cache.table("host").get_or_load(("ip", ip), load)
+
+
+def submit_scan(ip: str, ports: List[int], services: Optional[dict] = None):
+    host = host_by_ip(ip)
+    payload = {"ports": ports}
+    if services:
+        payload["services"] = services
+    return scan_writer.submit(host.id if host else None, payload)
+
+
+async def fingerprint_result(result: dict, enabled: bool) -> Optional[dict]:
+    if not enabled or not result["open_ports"]:
+        return None
+    return await fingerprints.fingerprint_ports(result["ip"], result["open_ports"])
+
+
+@handler("port_scan")
+def port_scan(ip: str, ports: str = "1-1024", fingerprint: bool = False) -> dict:
+    result = scanner.scan(ip, ports)
+    if fingerprint:
+        result["services"] = asyncio.run(fingerprints.fingerprint_ports(result["ip"], result["open_ports"]))
+    return result
+
+
+@handler("sweep")
+def sweep_network(network: str, ports: str = "1-1024", fingerprint: bool = False) -> dict:
+    async def record(result):
+        services = await fingerprint_result(result, fingerprint)
+        future = await asyncio.to_thread(submit_scan, result["ip"], result["open_ports"], services)
+        return {"scan_id": await asyncio.wrap_future(future), **({"services": services} if services else {})}
+
+    async def collect():
+        job = sweep.Sweep(ipaddress.ip_network(network), scanner.parse_ports(ports), on_result=record)
+        results = [item async for item in job.run()]
+        if "error" in results[-1]["summary"]:
+            raise RuntimeError(results[-1]["summary"]["error"])
+        return {"network": network, "results": results[:-1], "summary": results[-1]["summary"]}
+    return asyncio.run(collect())
+
+
+@handler("recurring_scan")
+def recurring_scan(host_id: int, mode: str, ports: str, slice_start: int, slice_size: int) -> dict:
+    return recurring.scan_host(engine, scan_writer, host_id, mode, ports, slice_start, slice_size)
+
+
+@handler("action_run")
+def action_run(script: str, ip: str, log_path: str, timeout: int = fanout.ACTION_TIMEOUT) -> dict:
+    return fanout.run_script(script, ip, log_path, timeout)
+
+
+@on_abort("action_run")
+def action_run_aborted(meta: dict, status: str, error: Optional[str]):
+    fanout.target_aborted(meta, status, error)
+
+
+def split_network(network: str, prefix: int = SWEEP_SPLIT_PREFIX, max_parts: int = SWEEP_MAX_PARTS) -> List[str]:
+    # Découpe un grand balayage en sous-réseaux répartis entre les workers (au plus max_parts)
+    net = ipaddress.ip_network(network, strict=False)
+    if net.prefixlen >= prefix:
+        return [str(net)]
+    limit = max(0, max_parts.bit_length() - 1)
+    return [str(sub) for sub in net.subnets(new_prefix=min(prefix, net.prefixlen + limit))]
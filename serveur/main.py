@@ -1,26 +1,53 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
-import json,os,subprocess,platform,re,ipaddress,datetime,socket
-import shutil
-import uuid
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+import asyncio,json,os,re,ipaddress,datetime,socket
 import io
 import csv
-import time
-from collections import Counter
-from concurrent.futures import ThreadPoolExecutor
 
-# Simple background executor and task registry for async scans/actions
-executor = ThreadPoolExecutor(max_workers=8)
-tasks = {}
 from typing import List, Optional
-from database import configure_db, engine
-from sqlmodel import Session, select
+from database import async_engine, configure_db, engine
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from models.host import Host
 from models.action import Action
 from models.indicator import Indicator
 from models.serveur import Serveur
 from models.entreprise import Entreprise
 from models.resultats_scans import ScanResult
+from models.task import Task
+from models.port_change import HostPortState, PortChange
+import pagination
+import probe
+import bulk
+import cache
+import export
+import metrics
+import recurring
+import retention
+import fanout
+import fingerprint as fingerprints
+import ipindex
+import jobs
+import scanner
+from scheduler import QueueFull, Scheduler
+from tasks import TaskNotCancellable, TaskNotFound, TaskRegistry, task_status
+import stats as scan_stats
+import sweep
+import telemetry
+from persistence import scan_writer
+
+# Pools de threads par type de tâche et registre persistant des tâches de fond
+scheduler = Scheduler()
+tasks = TaskRegistry(engine, scheduler)
+recurring_scans = recurring.RecurringScanner(engine, tasks)
+retention_job = retention.RetentionJob(engine)
+telemetry_sampler = telemetry.TelemetrySampler()
+host_index = ipindex.InventoryIndex(engine, Host, "host")
+# ETag des listes : version de chaque table d'inventaire tenue en base à chaque écriture
+cache.track_writes(engine, async_engine)
 
 regip = re.compile(r'^(?:25[0-5]|2[0-4]\d|1\d{2}|[1-9]?\d)(?:\.(?:25[0-5]|2[0-4]\d|1\d{2}|[1-9]?\d)){3}\/([0-9]|[12][0-9]|3[0-2])$')
 
@@ -28,149 +55,289 @@ regip = re.compile(r'^(?:25[0-5]|2[0-4]\d|1\d{2}|[1-9]?\d)(?:\.(?:25[0-5]|2[0-4]
 
 async def on_start_up():
     configure_db()
+    tasks.recover()
+    scan_writer.start()
+    if recurring.RECURRING_SCANS:
+        recurring_scans.start()
+    if retention.RETENTION_ENABLED:
+        retention_job.start()
+    if telemetry.TELEMETRY_ENABLED:
+        telemetry_sampler.start()
+
+async def on_shut_down():
+    recurring_scans.stop()
+    retention_job.stop()
+    telemetry_sampler.stop()
+    scheduler.shutdown()
+    scan_writer.stop()
+
+app = FastAPI(on_startup=[on_start_up], on_shutdown=[on_shut_down])
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Jauges lues à chaque collecte de /metrics
+metrics.SCHED_QUEUE.set_function(lambda: {(name,): p["queued"] for name, p in scheduler.stats().items()})
+metrics.SCHED_ACTIVE.set_function(lambda: {(name,): p["active"] for name, p in scheduler.stats().items()})
+metrics.WRITER_QUEUE.set_function(lambda: {(): scan_writer.queue.qsize()})
+
+async def _commit_unique_ip(session):
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="Un host avec cette IP existe déjà")
+
+def _valid_ip(ip: str) -> str:
+    # Les corps de requête des modèles table ne passent pas par leurs validateurs
+    try:
+        return ipindex.normalize_ip(ip)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="IP non valide")
+
+def _network(cidr: str) -> ipindex.Network:
+    try:
+        return ipindex.parse_network(cidr)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="CIDR non valide")
+
+async def _load(model, object_id):
+    async with AsyncSession(async_engine) as session:
+        return await session.get(model, object_id)
+
+
+async def _host_by_ip_async(ip: str) -> Optional[Host]:
+    async def load():
+        async with AsyncSession(async_engine) as session:
+            return (await session.exec(select(Host).where(Host.ip == ip))).first()
+    return await cache.table("host").get_or_load_async(("ip", ip), load)
 
-app = FastAPI(on_startup=[on_start_up])
 
 @app.get("/hosts")
-def read_hosts() -> List[Host]:
-    with Session(engine) as session:
-        hosts = session.exec(select(Host)).all()
-        return hosts
+async def read_hosts(request: Request, response: Response, limit: int = pagination.DEFAULT_LIMIT,
+                     after: Optional[int] = None, cidr: Optional[str] = None) -> List[Host]:
+    network = _network(cidr) if cidr else None
+    if cached := await cache.not_modified(request, response, "host", limit, after, network):
+        return cached
+    query = select(Host).where(ipindex.in_network_clause(Host, network)) if network else None
+    async with AsyncSession(async_engine) as session:
+        return await session.run_sync(pagination.page_by_id, Host, limit, after, response, request, query,
+                                      ipindex.network_filter(network))
     
 @app.get("/host/{host_id}")
-def read_host(host_id: int) -> Host:
-    with Session(engine) as session:
-        host = session.get(Host, host_id)
-        if not host: raise HTTPException(status_code=404, detail="Host not found")
-        return host
+async def read_host(host_id: int) -> Host:
+    host = await cache.table("host").get_or_load_async(("id", host_id), lambda: _load(Host, host_id))
+    if not host: raise HTTPException(status_code=404, detail="Host not found")
+    return host
     
 @app.post("/host")
-def create_host(host: Host) -> Host:
-    with Session(engine) as session:
+async def create_host(host: Host) -> Host:
+    host.ip = _valid_ip(host.ip)
+    async with AsyncSession(async_engine) as session:
         session.add(host)
-        session.commit()
-        session.refresh(host)
+        await _commit_unique_ip(session)
+        cache.invalidate("host")
+        await session.refresh(host)
         return host
     
 @app.delete("/host/{host_id}")
-def delete_host(host_id: int) -> dict:
-    with Session(engine) as session:
-        host = session.get(Host, host_id)
+async def delete_host(host_id: int) -> dict:
+    async with AsyncSession(async_engine) as session:
+        host = await session.get(Host, host_id)
         if not host: raise HTTPException(status_code=404, detail="Host not found")
-        session.delete(host)
-        session.commit()
+        await session.delete(host)
+        await session.commit()
+        cache.invalidate("host")
         return {"ok": True}
 
 @app.put("/host/{host_id}")
-def update_host(host_id: int, updated_host: Host) -> Host:
-    with Session(engine) as session:
-        host = session.get(Host, host_id)
+async def update_host(host_id: int, updated_host: Host) -> Host:
+    async with AsyncSession(async_engine) as session:
+        host = await session.get(Host, host_id)
         if not host: raise HTTPException(status_code=404, detail="Host not found")
         host.name = updated_host.name
-        host.ip = updated_host.ip
+        host.ip = _valid_ip(updated_host.ip)
         session.add(host)
-        session.commit()
-        session.refresh(host)
+        await _commit_unique_ip(session)
+        cache.invalidate("host")
+        await session.refresh(host)
         return host
 
 
+class BulkDelete(BaseModel):
+    ids: List[int] = []
+    ips: List[str] = []
+
+
+BULK_SPECS = {
+    "host": bulk.BulkSpec(Host, "ip", prepare=ipindex.with_ip_int, normalize=ipindex.normalize_ip),
+    "serveur": bulk.BulkSpec(Serveur, "ip", prepare=ipindex.with_ip_int, normalize=ipindex.normalize_ip),
+    "action": bulk.BulkSpec(Action),
+    "indicator": bulk.BulkSpec(Indicator),
+}
+
+
+async def _bulk_upsert(request: Request, name: str, all_or_nothing: bool) -> dict:
+    rows = await bulk.read_rows(request)
+    try:
+        result = await run_in_threadpool(bulk.upsert, engine, BULK_SPECS[name], rows, all_or_nothing)
+    except IntegrityError as e:
+        raise HTTPException(status_code=409, detail=f"Conflit à l'écriture, lot annulé : {e.orig}")
+    if name in cache.tables:
+        cache.invalidate(name)
+    return result
+
+
+async def _bulk_delete(name: str, targets: BulkDelete) -> dict:
+    spec = BULK_SPECS[name]
+    if targets.ips and spec.key != "ip":
+        raise HTTPException(status_code=400, detail="Suppression par IP non disponible pour cette table")
+    result = await run_in_threadpool(bulk.delete_rows, engine, spec, targets.ids, targets.ips)
+    if name in cache.tables:
+        cache.invalidate(name)
+    return result
+
+
+@app.post("/hosts/bulk")
+async def bulk_hosts(request: Request, all_or_nothing: bool = False) -> dict:
+    return await _bulk_upsert(request, "host", all_or_nothing)
+
+
+@app.delete("/hosts/bulk")
+async def bulk_delete_hosts(targets: BulkDelete) -> dict:
+    return await _bulk_delete("host", targets)
+
+
 @app.get("/actions")
-def get_actions() -> List[Action]:
-    with Session(engine) as session:
-        actions = session.exec(select(Action)).all()
-        return actions
+async def get_actions(request: Request, response: Response, limit: int = pagination.DEFAULT_LIMIT,
+                      after: Optional[int] = None) -> List[Action]:
+    if cached := await cache.not_modified(request, response, "action", limit, after):
+        return cached
+    async with AsyncSession(async_engine) as session:
+        return await session.run_sync(pagination.page_by_id, Action, limit, after, response, request)
     
 @app.get("/action/{action_id}")
-def get_action(action_id: int) -> Action:
-    with Session(engine) as session:
-        action = session.get(Action, action_id)
+async def get_action(action_id: int) -> Action:
+    async with AsyncSession(async_engine) as session:
+        action = await session.get(Action, action_id)
         if not action: raise HTTPException(status_code=404, detail="Action not found")
         return action
     
 @app.post("/action")
-def create_action(action: Action) -> Action:
-    with Session(engine) as session:
+async def create_action(action: Action) -> Action:
+    async with AsyncSession(async_engine) as session:
         session.add(action)
-        session.commit()
-        session.refresh(action)
+        await session.commit()
+        cache.invalidate("action")
+        await session.refresh(action)
         return action
     
 @app.delete("/action/{action_id}")
-def delete_action(action_id: int) -> dict:
-    with Session(engine) as session:
-        action = session.get(Action, action_id)
+async def delete_action(action_id: int) -> dict:
+    async with AsyncSession(async_engine) as session:
+        action = await session.get(Action, action_id)
         if not action: raise HTTPException(status_code=404, detail="Action not found")
-        session.delete(action)
-        session.commit()
+        await session.delete(action)
+        await session.commit()
+        cache.invalidate("action")
         return {"ok": True}
     
 @app.put("/action/{action_id}")
-def update_action(action_id: int, updated_action: Action) -> Action:
-    with Session(engine) as session:
-        action = session.get(Action, action_id)
+async def update_action(action_id: int, updated_action: Action) -> Action:
+    async with AsyncSession(async_engine) as session:
+        action = await session.get(Action, action_id)
         if not action: raise HTTPException(status_code=404, detail="Action not found")
         action.name = updated_action.name
         action.script_path = updated_action.script_path
         session.add(action)
-        session.commit()
-        session.refresh(action)
+        await session.commit()
+        cache.invalidate("action")
+        await session.refresh(action)
         return action
     
 
 
+@app.post("/actions/bulk")
+async def bulk_actions(request: Request, all_or_nothing: bool = False) -> dict:
+    return await _bulk_upsert(request, "action", all_or_nothing)
+
+
+@app.delete("/actions/bulk")
+async def bulk_delete_actions(targets: BulkDelete) -> dict:
+    return await _bulk_delete("action", targets)
+
+
 @app.get("/serveurs")
-def read_serveurs() -> List[Serveur]:
-    with Session(engine) as session:
-        serveurs = session.exec(select(Serveur)).all()
-        return serveurs
+async def read_serveurs(request: Request, response: Response, limit: int = pagination.DEFAULT_LIMIT,
+                        after: Optional[int] = None, cidr: Optional[str] = None) -> List[Serveur]:
+    network = _network(cidr) if cidr else None
+    if cached := await cache.not_modified(request, response, "serveur", limit, after, network):
+        return cached
+    query = select(Serveur).where(ipindex.in_network_clause(Serveur, network)) if network else None
+    async with AsyncSession(async_engine) as session:
+        return await session.run_sync(pagination.page_by_id, Serveur, limit, after, response, request, query,
+                                      ipindex.network_filter(network))
     
 @app.get("/serveurs/{serveur_id}")
-def read_serveur(serveur_id: int) -> Serveur:
-    with Session(engine) as session:
-        serveur = session.get(Serveur, serveur_id)
-        if not serveur: 
-            raise HTTPException(status_code=404, detail="Serveur not found")
-        return serveur
+async def read_serveur(serveur_id: int) -> Serveur:
+    serveur = await cache.table("serveur").get_or_load_async(serveur_id, lambda: _load(Serveur, serveur_id))
+    if not serveur: 
+        raise HTTPException(status_code=404, detail="Serveur not found")
+    return serveur
     
 @app.post("/serveur")
-def create_serveur(serveur: Serveur) -> Serveur:
-    with Session(engine) as session:
+async def create_serveur(serveur: Serveur) -> Serveur:
+    serveur.ip = _valid_ip(serveur.ip)
+    async with AsyncSession(async_engine) as session:
         session.add(serveur)
-        session.commit()
-        session.refresh(serveur)
+        await session.commit()
+        cache.invalidate("serveur")
+        await session.refresh(serveur)
         return serveur
     
 @app.delete("/serveur/{serveur_id}")
-def delete_serveur(serveur_id: int) -> dict:
-    with Session(engine) as session:
-        serveur = session.get(Serveur, serveur_id)
+async def delete_serveur(serveur_id: int) -> dict:
+    async with AsyncSession(async_engine) as session:
+        serveur = await session.get(Serveur, serveur_id)
         if not serveur: 
             raise HTTPException(status_code=404, detail="Serveur not found")
-        session.delete(serveur)
-        session.commit()
+        await session.delete(serveur)
+        await session.commit()
+        cache.invalidate("serveur")
         return {"ok": True}
 
 
+@app.post("/serveurs/bulk")
+async def bulk_serveurs(request: Request, all_or_nothing: bool = False) -> dict:
+    return await _bulk_upsert(request, "serveur", all_or_nothing)
+
+
+@app.delete("/serveurs/bulk")
+async def bulk_delete_serveurs(targets: BulkDelete) -> dict:
+    return await _bulk_delete("serveur", targets)
+
+
 @app.get("/entreprises")
-def read_entreprises() -> List[Entreprise]:
-    with Session(engine) as session:
-        entreprises = session.exec(select(Entreprise)).all()
-        return entreprises
+async def read_entreprises(request: Request, response: Response, limit: int = pagination.DEFAULT_LIMIT,
+                           after: Optional[int] = None) -> List[Entreprise]:
+    if cached := await cache.not_modified(request, response, "entreprise", limit, after):
+        return cached
+    async with AsyncSession(async_engine) as session:
+        return await session.run_sync(pagination.page_by_id, Entreprise, limit, after, response, request)
     
 @app.get("/entreprise/{entreprise_id}")
-def read_entreprise(entreprise_id: int) -> Entreprise:
-    with Session(engine) as session:
-        entreprise = session.get(Entreprise, entreprise_id)
-        if not entreprise: 
-            raise HTTPException(status_code=404, detail="Entreprise not found")
-        return entreprise
+async def read_entreprise(entreprise_id: int) -> Entreprise:
+    entreprise = await cache.table("entreprise").get_or_load_async(entreprise_id,
+                                                                    lambda: _load(Entreprise, entreprise_id))
+    if not entreprise: 
+        raise HTTPException(status_code=404, detail="Entreprise not found")
+    return entreprise
 
 @app.post("/entreprise")
-def create_entreprise(entreprise: Entreprise) -> Entreprise:
-    with Session(engine) as session:
+async def create_entreprise(entreprise: Entreprise) -> Entreprise:
+    async with AsyncSession(async_engine) as session:
         session.add(entreprise)
-        session.commit()
-        session.refresh(entreprise)
+        await session.commit()
+        cache.invalidate("entreprise")
+        await session.refresh(entreprise)
         return entreprise
 """
 @app.post("/entreprise")
@@ -188,182 +355,329 @@ def create_entreprise(dico: dict) -> Entreprise:
         return entreprise"""
     
 @app.delete("/entreprise/{entreprise_id}")
-def delete_entreprise(entreprise_id: int) -> dict:
-    with Session(engine) as session:
-        entreprise = session.get(Entreprise, entreprise_id)
+async def delete_entreprise(entreprise_id: int) -> dict:
+    async with AsyncSession(async_engine) as session:
+        entreprise = await session.get(Entreprise, entreprise_id)
         if not entreprise: 
             raise HTTPException(status_code=404, detail="Entreprise not found")
-        session.delete(entreprise)
-        session.commit()
+        await session.delete(entreprise)
+        await session.commit()
+        cache.invalidate("entreprise")
         return {"ok": True}
     
-def update_entreprise(entreprise_id: int, updated_entreprise: Entreprise):
-    with Session(engine) as session:
-        entreprise = session.get(Entreprise, entreprise_id)
+async def update_entreprise(entreprise_id: int, updated_entreprise: Entreprise):
+    async with AsyncSession(async_engine) as session:
+        entreprise = await session.get(Entreprise, entreprise_id)
         if not entreprise:
             raise HTTPException(status_code=404, detail="Entreprise not found")
         entreprise.name = updated_entreprise.name
-        session.commit()
-        session.refresh(entreprise)
+        await session.commit()
+        cache.invalidate("entreprise")
+        await session.refresh(entreprise)
         return entreprise
 
 
-def run_cmd(cmd):
-    try:
-        result = subprocess.check_output(cmd, shell=True, text=True)
-        return result.strip()
-    except Exception as e:
-        return f"Erreur: {e}"
-    
 @app.get("/mon_pc")
 def recup_info():
-    os_info = platform.platform()
-    system = platform.system()
-    if system == "Linux":
-        cpu = run_cmd("lscpu | grep 'Model name' || lscpu")
-        ram = run_cmd("free -h | grep Mem || free -h")
-    elif system == "Windows":
-        cpu = run_cmd("wmic cpu get Name")
-        ram = run_cmd("wmic computersystem get TotalPhysicalMemory")
-    else:
-        cpu = "OS non supporté"
-        ram = "OS non supporté"
+    # Lecture directe de /proc et /sys, sans sous-processus (voir telemetry.py)
+    current = telemetry_sampler.current()
+    return {"os": current["os"], "cpu": {"model": current["cpu_model"], "count": current["cpu_count"],
+                                         **(current["cpu"]["percent"] or {})},
+            "ram": current["memory"], "load": current["load"], "uptime": current["uptime"]}
 
-    return {"os": os_info, "cpu": cpu, "ram": ram}
+
+@app.get("/telemetry")
+def get_telemetry(history: int = 60):
+    if history < 0:
+        raise HTTPException(status_code=400, detail="history doit être positif")
+    return {"current": telemetry_sampler.current(), "history": telemetry_sampler.history(history) if history else [],
+            "sampler": telemetry_sampler.stats()}
 
 @app.get("/ping/{ip}")
-def ping(ip: str):
-    reachable = False
-    print("1")
+async def ping(ip: str, count: int = probe.DEFAULT_COUNT, timeout: float = probe.DEFAULT_TIMEOUT,
+               method: str = "auto", ports: str = "1-1024", fingerprint: bool = False):
+    if method not in ("auto", "icmp", "tcp"):
+        raise HTTPException(status_code=400, detail="method doit valoir auto, icmp ou tcp")
+    if not 1 <= count <= probe.MAX_COUNT:
+        raise HTTPException(status_code=400, detail=f"count doit être compris entre 1 et {probe.MAX_COUNT}")
+    if not 0 < timeout <= probe.MAX_TIMEOUT:
+        raise HTTPException(status_code=400, detail=f"timeout doit être > 0 et <= {probe.MAX_TIMEOUT:g}")
     try:
-        try:
-            response = subprocess.run(ip, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=3)
-            reachable = response.returncode == 0
-        except subprocess.TimeoutExpired:
-            reachable = False
-        except FileNotFoundError:
-            reachable = False
+        address = await scanner.resolve_async(ip)
+        port_list = scanner.parse_ports(ports)
+    except socket.gaierror:
+        raise HTTPException(status_code=400, detail="IP non valide")
+    except scanner.PortRangeError:
+        raise HTTPException(status_code=400, detail="Port range invalide")
+    try:
+        reachability = await probe.probe(address, count=count, timeout=timeout, method=method)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    try:
+        open_ports = (await scanner.PortScanner().scan(address, port_list))["open_ports"]
     except Exception:
-        return {"ping impossible": "ping command not found"}
-    print("2")
-    with Session(engine) as session:
-        host = session.exec(select(Host).where(Host.ip == ip)).first()
-        host_id = host.id if host else None
-        try:
-            ports = scan_ports(ip)["open_ports"]
-        except Exception:
-            ports = []
-        scan = ScanResult(host_id=host_id, date=datetime.datetime.now(), open_ports={"ports": ports})
-        session.add(scan)
-        session.commit()
-        session.refresh(scan)
-        print("3")
-    return {"reachable": reachable, "scan_id": scan.id}
-
-@app.get("/scan/{ip}")
-def scan_reseau(ip: str):
+        open_ports = []
+    services = await fingerprints.fingerprint_ports(address, open_ports) if fingerprint and open_ports else None
+    future = await run_in_threadpool(jobs.submit_scan, ip, open_ports, services)
+    reachability["scan_id"] = await asyncio.wrap_future(future)
+    if services is not None:
+        reachability["services"] = services
+    return reachability
+
+@app.get("/scan/{ip:path}")
+async def scan_reseau(ip: str, ports: str = "1-1024", format: str = "ndjson", include_dead: bool = False,
+                      host_workers: int = sweep.HOST_WORKERS, liveness_ports: str = "22,80,443,445,3389",
+                      fingerprint: bool = False, known: str = "all"):
     try:
         network = ipaddress.ip_network(ip if "/" in ip else ip + "/24", strict=False)
     except ValueError:
         raise HTTPException(status_code=400, detail="IP réseau non valide")
-    results = []
-    for host in network.hosts():
-        host_ip = str(host)
-        results.append({host_ip: ping(host_ip)})
-    return {"network": str(network), "results": results}
+    try:
+        port_list = scanner.parse_ports(ports)
+        live_list = scanner.parse_ports(liveness_ports)
+    except scanner.PortRangeError:
+        raise HTTPException(status_code=400, detail="Port range invalide")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    if known not in sweep.KNOWN_MODES:
+        raise HTTPException(status_code=400, detail=f"known doit valoir {', '.join(sweep.KNOWN_MODES)}")
+    if known != "only":
+        try:
+            sweep.check_size(network)
+        except sweep.NetworkTooLarge as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    index = await run_in_threadpool(host_index.get)
+
+    async def record(result):
+        result["host_id"] = index.get(result["ip"])
+        try:
+            services = await jobs.fingerprint_result(result, fingerprint)
+            future = await run_in_threadpool(jobs.submit_scan, result["ip"], result["open_ports"], services)
+            return {"scan_id": await asyncio.wrap_future(future), **({"services": services} if services else {})}
+        except Exception as e:
+            return {"scan_id": None, "error": str(e)}
+
+    job = sweep.Sweep(network, port_list, liveness_ports=live_list, host_workers=max(1, host_workers),
+                      include_dead=include_dead, on_result=record, hosts=sweep.targets(network, index, known))
+
+    async def stream():
+        async for item in job.run():
+            line = json.dumps(item)
+            yield f"data: {line}\n\n" if format == "sse" else line + "\n"
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type)
 
 @app.get("/scan_ports/{ip}")
-def scan_ports(ip: str, ports: str = "1-1024"):
-    open_ports = []
+async def scan_ports(ip: str, ports: str = "1-1024", concurrency: int = scanner.DEFAULT_CONCURRENCY,
+                     timeout: float = scanner.DEFAULT_TIMEOUT, rate: Optional[float] = None,
+                     deadline: Optional[float] = None, fingerprint: bool = False):
+    # Scan sur la boucle du serveur : les autres requêtes continuent d'être servies pendant l'attente
     try:
-        start, end = map(int, ports.split("-"))
-    except Exception:
+        port_list = scanner.parse_ports(ports)
+        address = await scanner.resolve_async(ip)
+        result = await scanner.PortScanner(concurrency=concurrency, timeout=timeout, rate=rate,
+                                           deadline=deadline).scan(address, port_list)
+        if fingerprint:
+            result["services"] = await fingerprints.fingerprint_ports(address, result["open_ports"])
+        return result
+    except scanner.PortRangeError:
         raise HTTPException(status_code=400, detail="Port range invalide")
-    for port in range(start, end + 1):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(0.3)
-        try:
-            if sock.connect_ex((ip, port)) == 0:
-                open_ports.append(port)
-        finally:
-            sock.close()
-    return {"ip": ip, "open_ports": open_ports}
+    except scanner.ScanOptionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except socket.gaierror:
+        raise HTTPException(status_code=400, detail="IP non valide")
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "time": datetime.datetime.now().isoformat()}
+    return {"status": "ok", "time": datetime.datetime.now().isoformat(), "scan_writer": scan_writer.stats(),
+            "cache": cache.stats(), "fingerprints": fingerprints.stats(), "ip_index": host_index.stats()}
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.get("/hosts/by_ip/{ip}")
-def get_host_by_ip(ip: str):
-    with Session(engine) as session:
-        host = session.exec(select(Host).where(Host.ip == ip)).first()
-        if not host:
-            raise HTTPException(status_code=404, detail="Host not found")
-        return host
+async def get_host_by_ip(ip: str):
+    host = await _host_by_ip_async(ip)
+    if not host:
+        raise HTTPException(status_code=404, detail="Host not found")
+    return host
+
+
+def _caller(request: Request) -> str:
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "")
 
 
-def _run_port_scan_sync(ip: str, ports_range: str):
-    return scan_ports(ip, ports_range)
+def _submit_task(request: Request, type: str, fn, *args, meta: dict, host: Optional[str], priority: int = 0) -> str:
+    try:
+        return tasks.submit(type, fn, *args, meta=meta, host=host, priority=priority, caller=_caller(request))
+    except QueueFull:
+        raise HTTPException(status_code=429, detail=f"File {type} pleine, réessayez plus tard",
+                            headers={"Retry-After": "5"})
 
 
 @app.post("/scan_ports_async/{ip}")
-def scan_ports_async(ip: str, ports: str = "1-1024"):
-    task_id = str(uuid.uuid4())
-    future = executor.submit(_run_port_scan_sync, ip, ports)
-    tasks[task_id] = {"future": future, "type": "port_scan", "created": time.time(), "meta": {"ip": ip, "ports": ports}}
+def scan_ports_async(ip: str, request: Request, ports: str = "1-1024", priority: int = 0, fingerprint: bool = False):
+    task_id = _submit_task(request, "port_scan", "port_scan", ip, ports, fingerprint,
+                           meta={"ip": ip, "ports": ports, "fingerprint": fingerprint}, host=ip, priority=priority)
     return {"task_id": task_id}
 
 
+@app.post("/scan_async/{ip:path}")
+def scan_reseau_async(ip: str, request: Request, ports: str = "1-1024", priority: int = 0, fingerprint: bool = False):
+    try:
+        network = ipaddress.ip_network(ip if "/" in ip else ip + "/24", strict=False)
+        scanner.parse_ports(ports)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="IP réseau ou port range non valide")
+    try:
+        sweep.check_size(network)
+    except sweep.NetworkTooLarge as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    network = str(network)
+    parts = jobs.split_network(network) if tasks.distributed else [network]
+    task_ids = [_submit_task(request, "sweep", "sweep", part, ports, fingerprint,
+                             meta={"network": part, "ports": ports, "fingerprint": fingerprint}, host=part,
+                             priority=priority)
+                for part in parts]
+    if len(task_ids) == 1:
+        return {"task_id": task_ids[0]}
+    # Grand réseau en mode db : un sous-réseau par tâche, réparties entre les workers
+    return {"task_ids": task_ids, "networks": parts}
+
+
+@app.get("/scheduler")
+def scheduler_stats():
+    return {"pools": scheduler.stats(), "tasks": tasks.stats()}
+
+
+@app.get("/scheduler/recurring")
+def recurring_stats():
+    return recurring_scans.stats()
+
+
+@app.get("/retention")
+def retention_stats():
+    return retention_job.stats()
+
+
+@app.post("/retention/run")
+async def run_retention(dry_run: bool = False):
+    if dry_run:
+        # Simulation synchrone : compte ce qu'une passe archiverait, sans rien modifier
+        report = await run_in_threadpool(retention_job.run, True)
+    else:
+        report = {"started": retention_job.trigger()}
+    if report is None or not report.get("started"):
+        raise HTTPException(status_code=409, detail="Passe de rétention déjà en cours")
+    return report
+
+
+@app.get("/tasks")
+async def list_tasks(request: Request, response: Response, type: Optional[str] = None, status: Optional[str] = None,
+                     limit: int = pagination.DEFAULT_LIMIT, after: Optional[str] = None):
+    async with AsyncSession(async_engine) as session:
+        rows = await session.run_sync(pagination.page_by_date_desc, Task, limit, after, response, request,
+                                      tasks.query(type, status), date_field="created")
+        return [task_status(t) for t in rows]
+
+
 @app.get("/tasks/{task_id}")
-def get_task_status(task_id: str):
-    info = tasks.get(task_id)
-    if not info:
+async def get_task_status(task_id: str):
+    async with AsyncSession(async_engine) as session:
+        task = await session.get(Task, task_id)
+    if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    future = info["future"]
-    status = {"task_id": task_id, "type": info.get("type"), "created": info.get("created"), "done": future.done()}
-    if future.done():
-        try:
-            result = future.result()
-            status["result"] = result
-        except Exception as e:
-            status["error"] = str(e)
-    return status
+    return task_status(task)
+
+
+@app.post("/tasks/{task_id}/cancel")
+def cancel_task(task_id: str):
+    try:
+        return task_status(tasks.cancel(task_id))
+    except TaskNotFound:
+        raise HTTPException(status_code=404, detail="Task not found")
+    except TaskNotCancellable:
+        raise HTTPException(status_code=409, detail="Task already running")
+
+
+def _changes_query(host_id: Optional[int], since: Optional[datetime.datetime], port: Optional[int],
+                   change: Optional[str]):
+    query = select(PortChange)
+    if host_id is not None:
+        query = query.where(PortChange.host_id == host_id)
+    if since is not None:
+        query = query.where(PortChange.date >= since)
+    if port is not None:
+        query = query.where(PortChange.port == port)
+    if change:
+        query = query.where(PortChange.change == change)
+    return query
+
+
+@app.get("/changes")
+async def read_changes(request: Request, response: Response, since: Optional[datetime.datetime] = None,
+                       host_id: Optional[int] = None, port: Optional[int] = None, change: Optional[str] = None,
+                       limit: int = pagination.DEFAULT_LIMIT, after: Optional[int] = None) -> List[PortChange]:
+    async with AsyncSession(async_engine) as session:
+        query = _changes_query(host_id, since, port, change)
+        return await session.run_sync(pagination.page_by_id, PortChange, limit, after, response, request, query)
+
+
+@app.get("/hosts/{host_id}/changes")
+async def read_host_changes(host_id: int, request: Request, response: Response,
+                            since: Optional[datetime.datetime] = None, port: Optional[int] = None,
+                            change: Optional[str] = None, limit: int = pagination.DEFAULT_LIMIT,
+                            after: Optional[int] = None) -> List[PortChange]:
+    async with AsyncSession(async_engine) as session:
+        query = _changes_query(host_id, since, port, change)
+        return await session.run_sync(pagination.page_by_id, PortChange, limit, after, response, request, query)
+
+
+@app.get("/hosts/{host_id}/ports")
+async def read_host_ports(host_id: int) -> HostPortState:
+    async with AsyncSession(async_engine) as session:
+        state = await session.get(HostPortState, host_id)
+        if not state:
+            raise HTTPException(status_code=404, detail="Aucun scan pour ce host")
+        return state
 
 
 @app.get("/scans/recent")
-def recent_scans(n: int = 10):
-    with Session(engine) as session:
-        scans = session.exec(select(ScanResult)).all()
-        scans_sorted = sorted(scans, key=lambda s: s.date or datetime.datetime.min, reverse=True)
-        return scans_sorted[:n]
+async def recent_scans(request: Request, response: Response, n: int = 10, after: Optional[str] = None,
+                       host_id: Optional[int] = None):
+    async with AsyncSession(async_engine) as session:
+        query = select(ScanResult)
+        if host_id is not None:
+            query = query.where(ScanResult.host_id == host_id)
+        return await session.run_sync(pagination.page_by_date_desc, ScanResult, n, after, response, request,
+                                      query, limit_param="n")
 
 
 @app.get("/stats")
-def stats():
-    with Session(engine) as session:
-        hosts = session.exec(select(Host)).all()
-        scans = session.exec(select(ScanResult)).all()
-    total_hosts = len(hosts)
-    total_scans = len(scans)
-    counter = Counter()
-    for s in scans:
-        try:
-            ports = s.open_ports.get("ports") if isinstance(s.open_ports, dict) else s.open_ports
-            if isinstance(ports, list):
-                counter.update(ports)
-            elif isinstance(ports, dict):
-                counter.update(ports.keys())
-        except Exception:
-            continue
-    top_ports = counter.most_common(10)
-    return {"total_hosts": total_hosts, "total_scans": total_scans, "top_ports": top_ports}
+async def stats():
+    async with AsyncSession(async_engine) as session:
+        return await session.run_sync(scan_stats.read_stats)
+
+
+@app.get("/export/scans")
+def export_scans(format: str = "csv", host_id: Optional[int] = None, since: Optional[datetime.datetime] = None,
+                 until: Optional[datetime.datetime] = None, port: Optional[int] = None, archives: bool = True):
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    media_type, extension = export.FORMATS[format]
+    filters = export.ExportFilters(host_id=host_id, since=since, until=until, port=port, archives=archives)
+    return StreamingResponse(export.export_stream(engine, filters, format), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="scans.{extension}"'})
 
 
 @app.get("/export/scan/{scan_id}")
-def export_scan(scan_id: int, format: str = "json"):
-    with Session(engine) as session:
-        scan = session.get(ScanResult, scan_id)
+async def export_scan(scan_id: int, format: str = "json"):
+    async with AsyncSession(async_engine) as session:
+        scan = await session.get(ScanResult, scan_id)
         if not scan:
             raise HTTPException(status_code=404, detail="ScanResult not found")
     if format == "json":
@@ -378,80 +692,159 @@ def export_scan(scan_id: int, format: str = "json"):
                 writer.writerow([scan.id, scan.host_id, scan.date.isoformat() if scan.date else "", p])
         else:
             writer.writerow([scan.id, scan.host_id, scan.date.isoformat() if scan.date else "", ""]) 
-        output.seek(0)
-        return FileResponse(output, media_type="text/csv")
+        return Response(content=output.getvalue(), media_type="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="scan-{scan.id}.csv"'})
     else:
         raise HTTPException(status_code=400, detail="Unsupported format")
 
 
 @app.post("/action/{action_id}/run_on_host/{host_id}")
-def run_action_on_host(action_id: int, host_id: int):
-    with Session(engine) as session:
-        action = session.get(Action, action_id)
-        host = session.get(Host, host_id)
+async def run_action_on_host(action_id: int, host_id: int, request: Request, priority: int = 0):
+    async with AsyncSession(async_engine) as session:
+        action = await session.get(Action, action_id)
+        host = await session.get(Host, host_id)
         if not action or not host:
             raise HTTPException(status_code=404, detail="Action or Host not found")
     if not getattr(action, "script_path", None):
         raise HTTPException(status_code=400, detail="Action has no script_path configured")
-    def _run_action(script, target_ip):
-        try:
-            proc = subprocess.run([script, target_ip], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=60)
-            return {"returncode": proc.returncode, "output": proc.stdout}
-        except Exception as e:
-            return {"error": str(e)}
-    task_id = str(uuid.uuid4())
-    future = executor.submit(_run_action, action.script_path, host.ip)
-    tasks[task_id] = {"future": future, "type": "action_run", "created": time.time(), "meta": {"action_id": action_id, "host_id": host_id}}
+    log_path = fanout.single_log_path(host.id)
+    task_id = await run_in_threadpool(_submit_task, request, "action_run", "action_run", action.script_path, host.ip,
+                                      log_path, meta={"action_id": action_id, "host_id": host_id}, host=host.ip,
+                                      priority=priority)
     return {"task_id": task_id}
 
+
+class RunTargets(BaseModel):
+    host_ids: List[int] = []
+    cidr: Optional[str] = None
+    entreprise_id: Optional[int] = None
+
+
+async def _resolve_targets(targets: RunTargets) -> List[Host]:
+    async with AsyncSession(async_engine) as session:
+        hosts = {}
+        if targets.host_ids:
+            for host in (await session.exec(select(Host).where(Host.id.in_(targets.host_ids)))).all():
+                hosts[host.id] = host
+        if targets.entreprise_id is not None:
+            for host in (await session.exec(select(Host).where(Host.entreprise_id == targets.entreprise_id))).all():
+                hosts[host.id] = host
+        if targets.cidr:
+            network = _network(targets.cidr)
+            rows = (await session.exec(select(Host).where(ipindex.in_network_clause(Host, network)))).all()
+            for host in ipindex.filter_network(rows, network):
+                hosts[host.id] = host
+        return list(hosts.values())
+
+
+@app.post("/action/{action_id}/run")
+async def run_action_batch(action_id: int, targets: RunTargets, request: Request, concurrency: int = 10,
+                           timeout: int = fanout.ACTION_TIMEOUT, priority: int = 0):
+    async with AsyncSession(async_engine) as session:
+        action = await session.get(Action, action_id)
+        if not action:
+            raise HTTPException(status_code=404, detail="Action not found")
+    if not getattr(action, "script_path", None):
+        raise HTTPException(status_code=400, detail="Action has no script_path configured")
+    hosts = await _resolve_targets(targets)
+    if not hosts:
+        raise HTTPException(status_code=404, detail="Aucun host ciblé")
+    run = fanout.ActionRun(tasks, action_id, action.script_path, [(h.id, h.ip) for h in hosts],
+                           concurrency=concurrency, timeout=timeout, caller=_caller(request), priority=priority)
+    manifest = await run_in_threadpool(run.start)
+    return {"run_id": run.run_id, "targets": manifest["targets"]}
+
+
+@app.get("/runs/{run_id}")
+def read_run(run_id: str):
+    try:
+        return fanout.run_status(run_id, tasks.states)
+    except fanout.RunNotFound:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+
+@app.get("/runs/{run_id}/stream")
+def stream_run(run_id: str):
+    try:
+        fanout.run_status(run_id)
+    except fanout.RunNotFound:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    async def events():
+        async for item in fanout.stream_run(run_id, tasks.states):
+            yield f"data: {json.dumps(item)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/runs/{run_id}/hosts/{host_id}/log")
+def read_run_log(run_id: str, host_id: int):
+    try:
+        path = os.path.join(fanout.run_dir(run_id), f"{host_id}.log")
+    except fanout.RunNotFound:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Log not found")
+    return FileResponse(path, media_type="text/plain")
+
 @app.get("/dns/{domain}")
-def dns_lookup(domain: str):
+async def dns_lookup(domain: str):
     try:
-        ip = socket.gethostbyname(domain)
+        ip = await scanner.resolve_async(domain)
         return {"domain": domain, "ip": ip}
     except:
         raise HTTPException(400, "Domain could not be resolved")
 
 @app.get("/scans/{scan_id}")
-def read_scans(scan_id: int):
-    with Session(engine) as session:
-        scan = session.get(ScanResult, scan_id)
+async def read_scans(scan_id: int):
+    async with AsyncSession(async_engine) as session:
+        scan = await session.get(ScanResult, scan_id)
         if not scan:
             raise HTTPException(status_code=404, detail="ScanResult not found")
         return scan
 
 @app.get("/host/{host_id}/indicators")
-def get_host_indicators(host_id: int) -> List[Indicator]:
-    with Session(engine) as session:
-        indicators = session.exec(select(Indicator).where(Indicator.host_id == host_id)).all()
-        return indicators
+async def get_host_indicators(host_id: int, request: Request, response: Response, limit: int = pagination.DEFAULT_LIMIT,
+                        after: Optional[int] = None) -> List[Indicator]:
+    async with AsyncSession(async_engine) as session:
+        query = select(Indicator).where(Indicator.host_id == host_id)
+        return await session.run_sync(pagination.page_by_id, Indicator, limit, after, response, request, query)
     
 @app.post("/host/{host_id}/indicator")
-def create_host_indicator(host_id: int, indicator: Indicator) -> Indicator:
-    with Session(engine) as session:
+async def create_host_indicator(host_id: int, indicator: Indicator) -> Indicator:
+    async with AsyncSession(async_engine) as session:
         indicator.host_id = host_id
         session.add(indicator)
-        session.commit()
-        session.refresh(indicator)
+        await session.commit()
+        await session.refresh(indicator)
         return indicator
     
+@app.post("/indicators/bulk")
+async def bulk_indicators(request: Request, all_or_nothing: bool = False) -> dict:
+    return await _bulk_upsert(request, "indicator", all_or_nothing)
+
+
+@app.delete("/indicators/bulk")
+async def bulk_delete_indicators(targets: BulkDelete) -> dict:
+    return await _bulk_delete("indicator", targets)
+
 @app.delete("/indicator/{indicator_id}")
-def delete_indicator(indicator_id: int) -> dict:
-    with Session(engine) as session:
-        indicator = session.get(Indicator, indicator_id)
+async def delete_indicator(indicator_id: int) -> dict:
+    async with AsyncSession(async_engine) as session:
+        indicator = await session.get(Indicator, indicator_id)
         if not indicator:
             raise HTTPException(status_code=404, detail="Indicator not found")
-        session.delete(indicator)
-        session.commit()
+        await session.delete(indicator)
+        await session.commit()
         return {"ok": True}
 
 
 @app.delete("/host/{host_id}/indicator/{indicator_id}")
-def delete_host_indicator(host_id: int, indicator_id: int) -> dict:
-    with Session(engine) as session:
-        indicator = session.get(Indicator, indicator_id)
+async def delete_host_indicator(host_id: int, indicator_id: int) -> dict:
+    async with AsyncSession(async_engine) as session:
+        indicator = await session.get(Indicator, indicator_id)
         if not indicator or indicator.host_id != host_id:
             raise HTTPException(status_code=404, detail="Indicator not found")
-        session.delete(indicator)
-        session.commit()
+        await session.delete(indicator)
+        await session.commit()
         return {"ok": True}
\ No newline at end of file
@@ -0,0 +1,221 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bornes en secondes : de la requête SQL (< 1 ms) au scan complet (plusieurs secondes)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+INF_LABEL = 'le="+Inf"'
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += self.samples()
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Valeur instantanée ; `function` est appelée à chaque lecture de /metrics."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], Dict[Tuple, float]]] = None):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple, float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], Dict[Tuple, float]]):
+        self.function = function
+
+    def samples(self) -> List[str]:
+        if self.function:
+            try:
+                items = list(self.function().items())
+            except Exception:
+                items = []
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Par jeu de labels : [compteurs par bucket (non cumulés)..., total, somme]
+        self.values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            if index < len(self.buckets):
+                row[index] += 1
+            row[-2] += 1
+            row[-1] += value
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            items = [(k, list(v)) for k, v in self.values.items()]
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, INF_LABEL)} {row[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {row[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(row[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, help, labels))
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = (), function=None) -> Gauge:
+    return registry.register(Gauge(name, help, labels, function))
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, help, labels, buckets))
+
+
+def render() -> str:
+    return registry.render()
+
+
+HTTP_REQUESTS = counter("http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status"))
+HTTP_LATENCY = histogram("http_request_duration_seconds", "Durée des requêtes HTTP par route", ("method", "route"))
+
+DB_STATEMENT = histogram("db_statement_duration_seconds", "Durée d'exécution des requêtes SQL", ("operation",))
+DB_TRANSACTION = histogram("db_transaction_duration_seconds", "Durée des transactions (begin -> fin)", ("outcome",))
+DB_COMMIT = histogram("db_session_commit_duration_seconds", "Durée des Session.commit() (flush compris)")
+
+SCAN_PROBES = counter("scanner_probes_total", "Sondes de ports par état final", ("state",))
+SCAN_RETRIES = counter("scanner_retries_total", "Ports re-sondés après un délai dépassé")
+SCAN_DURATION = histogram("scanner_scan_duration_seconds", "Durée d'un scan de ports d'un hôte", ("complete",))
+SCAN_PORTS = histogram("scanner_ports_per_scan", "Nombre de ports sondés par scan",
+                       buckets=(1, 10, 100, 1000, 10000, 65535))
+SCAN_TIMEOUT_RATIO = histogram("scanner_timeout_ratio", "Part des sondes sans réponse (filtered) par scan",
+                               buckets=(0, 0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 1))
+
+SCHED_QUEUE = gauge("scheduler_queue_depth", "Tâches en attente par pool", ("pool",))
+SCHED_ACTIVE = gauge("scheduler_active_workers", "Workers occupés par pool", ("pool",))
+SCHED_WAIT = histogram("scheduler_job_wait_seconds", "Attente en file avant exécution", ("pool",))
+SCHED_RUN = histogram("scheduler_job_run_seconds", "Durée d'exécution des tâches", ("pool",))
+
+TASK_DURATION = histogram("task_completion_seconds", "Durée soumission -> fin des tâches de fond", ("type", "status"))
+
+WRITER_QUEUE = gauge("scan_writer_queue_depth", "ScanResult en attente d'écriture")
+WRITER_FLUSH = histogram("scan_writer_flush_seconds", "Durée d'écriture d'un lot de ScanResult")
+
+
+class MetricsMiddleware:
+    """Middleware ASGI : latence et statut par route (le modèle de chemin, pas l'URL brute)."""
+
+    def __init__(self, app, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_LATENCY.observe(time.perf_counter() - started, method=method, route=path)
+            HTTP_REQUESTS.inc(method=method, route=path, status=status[0])
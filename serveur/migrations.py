@@ -0,0 +1,225 @@
+import logging
+
+from sqlalchemy import bindparam, delete, func, inspect, select, text, tuple_, update
+from sqlmodel import SQLModel
+
+from changes import record_changes
+from ipindex import ip_to_int
+from models.host import Host
+from models.port_change import HostPortState, PortChange
+from models.port_hit import PortHit
+from models.resultats_scans import ScanResult
+from models.serveur import Serveur
+from models.stats import PortCount, StatCounter
+from stats import SCANS, record_port_hits
+
+logger = logging.getLogger(__name__)
+
+
+def _duplicates(db_engine, index, sample: int = 5) -> list:
+    columns = list(index.columns)
+    with db_engine.connect() as conn:
+        return conn.execute(select(*columns, func.count()).group_by(*columns)
+                            .having(func.count() > 1).limit(sample)).all()
+
+
+def create_missing_indexes(db_engine):
+    # create_all ignore les tables existantes : on rattrape leurs nouveaux index
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=db_engine, checkfirst=True)
+            except Exception as e:
+                if not index.unique:
+                    logger.warning("Index %s non créé : %s", index.name, e)
+                    continue
+                # Sans l'index unique, les upserts (bulk, _commit_unique_ip) dupliqueraient l'inventaire :
+                # on refuse de démarrer plutôt que de continuer sans la contrainte
+                duplicates = _duplicates(db_engine, index)
+                if duplicates:
+                    values = ", ".join(str(tuple(row[:-1]) if len(row) > 2 else row[0]) for row in duplicates)
+                    raise RuntimeError(f"Index unique {index.name} impossible : valeurs en double dans "
+                                       f"{table.name} ({values}…). Dédoublonner avant de redémarrer.") from e
+                raise
+
+
+def add_missing_columns(db_engine):
+    # Colonnes nullables ajoutées aux modèles après la création de la table
+    inspector = inspect(db_engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present or not column.nullable or column.primary_key:
+                continue
+            ddl = column.type.compile(dialect=db_engine.dialect)
+            with db_engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}'))
+            logger.info("Colonne %s.%s ajoutée", table.name, column.name)
+
+
+def relax_scanresult_host_id(db_engine):
+    # Les anciennes bases déclarent scanresult.host_id NOT NULL, ce qui rejette
+    # les scans d'IP absentes de l'inventaire. SQLite impose de reconstruire la table.
+    if db_engine.dialect.name != "sqlite":
+        return
+    columns = {c["name"]: c for c in inspect(db_engine).get_columns("scanresult")}
+    if columns.get("host_id", {}).get("nullable", True):
+        return
+    table = ScanResult.__table__
+    names = ", ".join(c.name for c in table.columns if c.name in columns)
+    with db_engine.begin() as conn:
+        for index in inspect(conn).get_indexes("scanresult"):
+            conn.execute(text(f"DROP INDEX {index['name']}"))
+        conn.execute(text("ALTER TABLE scanresult RENAME TO scanresult_old"))
+        table.create(conn)
+        conn.execute(text(f"INSERT INTO scanresult ({names}) SELECT {names} FROM scanresult_old"))
+        conn.execute(text("DROP TABLE scanresult_old"))
+    logger.info("scanresult.host_id est désormais nullable")
+
+
+# Marqueurs de migration, rangés dans statcounter à côté des compteurs de /stats
+PORT_STATS_AFTER = "backfill_port_stats"
+PORT_STATS_UNTIL = "backfill_port_stats_until"
+CHANGES_DONE = "backfill_changes"
+
+
+def _marker(conn, name: str):
+    return conn.execute(select(StatCounter.value).where(StatCounter.name == name)).scalar()
+
+
+def _set_markers(conn, **values):
+    conn.execute(delete(StatCounter).where(StatCounter.name.in_(list(values))))
+    rows = [{"name": name, "value": value} for name, value in values.items() if value is not None]
+    if rows:
+        conn.execute(StatCounter.__table__.insert(), rows)
+
+
+def backfill_port_stats(db_engine, batch_size: int = 1000, force: bool = False):
+    # Remplit porthit et les compteurs de /stats à partir de la colonne JSON open_ports.
+    # Terminé quand le compteur "scans" existe sans marqueur de progression ; un arrêt en
+    # cours de route reprend au dernier lot validé (marqueur écrit dans la transaction du lot).
+    with db_engine.connect() as conn:
+        done = conn.execute(select(StatCounter.value).where(StatCounter.name == SCANS)).first()
+        after, last_id = _marker(conn, PORT_STATS_AFTER), _marker(conn, PORT_STATS_UNTIL)
+        if done is not None and after is None and not force:
+            return 0
+        resume = after is not None and not force
+        if not resume:
+            last_id = conn.execute(select(func.max(ScanResult.id))).scalar()
+    if resume:
+        logger.info("Backfill porthit/compteurs : reprise après le scan %d", after)
+    else:
+        after = 0
+        with db_engine.begin() as conn:
+            conn.execute(delete(PortHit))
+            conn.execute(delete(PortCount))
+            conn.execute(delete(StatCounter).where(StatCounter.name == SCANS))
+            conn.execute(StatCounter.__table__.insert(), {"name": SCANS, "value": 0})
+            # Les scans postérieurs à last_id sont comptés par le scan_writer, pas par le backfill
+            _set_markers(conn, **{PORT_STATS_AFTER: 0, PORT_STATS_UNTIL: last_id})
+    table = ScanResult.__table__
+    total = 0
+    while True:
+        with db_engine.begin() as conn:
+            rows = []
+            if last_id is not None:
+                rows = conn.execute(select(table.c.id, table.c.host_id, table.c.open_ports)
+                                    .where(table.c.id > after, table.c.id <= last_id)
+                                    .order_by(table.c.id).limit(batch_size)).all()
+                record_port_hits(conn, rows)
+            finished = len(rows) < batch_size or rows[-1].id >= last_id
+            # Progression (ou fin) validée avec le lot lui-même
+            _set_markers(conn, **{PORT_STATS_AFTER: None if finished else rows[-1].id,
+                                  PORT_STATS_UNTIL: None if finished else last_id})
+        total += len(rows)
+        if finished:
+            break
+        after = rows[-1].id
+    if total:
+        logger.info("Backfill porthit/compteurs : %d scans", total)
+    return total
+
+
+def backfill_changes(db_engine, batch_size: int = 1000, force: bool = False):
+    # Rejoue l'historique host par host pour produire portchange et hostportstate.
+    # Le marqueur de fin est écrit avec le dernier lot : un arrêt en cours de route fait tout rejouer.
+    with db_engine.connect() as conn:
+        if _marker(conn, CHANGES_DONE) is not None and not force:
+            return 0
+    with db_engine.begin() as conn:
+        conn.execute(delete(PortChange))
+        conn.execute(delete(HostPortState))
+        _set_markers(conn, **{CHANGES_DONE: None})
+    table = ScanResult.__table__
+    order = (table.c.host_id, table.c.date, table.c.id)
+    last, total = None, 0
+    while True:
+        query = (select(table.c.id, table.c.host_id, table.c.date, table.c.open_ports)
+                 .where(table.c.host_id.is_not(None)).order_by(*order).limit(batch_size))
+        if last is not None:
+            query = query.where(tuple_(*order) > tuple_(*last))
+        with db_engine.begin() as conn:
+            rows = conn.execute(query).all()
+            record_changes(conn, rows)
+            finished = len(rows) < batch_size
+            if finished:
+                _set_markers(conn, **{CHANGES_DONE: 1})
+        total += len(rows)
+        if finished:
+            break
+        last = (rows[-1].host_id, rows[-1].date, rows[-1].id)
+    if total:
+        logger.info("Backfill portchange : %d scans", total)
+    return total
+
+
+def backfill_ip_int(db_engine, batch_size: int = 1000):
+    # ip_int des lignes antérieures à la colonne ; les IPv6 et valeurs invalides restent à NULL
+    total = 0
+    for model in (Host, Serveur):
+        table = model.__table__
+        after = 0
+        while True:
+            with db_engine.begin() as conn:
+                rows = conn.execute(select(table.c.id, table.c.ip)
+                                    .where(table.c.ip_int.is_(None), table.c.id > after)
+                                    .order_by(table.c.id).limit(batch_size)).all()
+                if not rows:
+                    break
+                params = [{"_id": row.id, "ip_int": ip_to_int(row.ip)} for row in rows]
+                params = [p for p in params if p["ip_int"] is not None]
+                if params:
+                    conn.execute(update(table).where(table.c.id == bindparam("_id")), params)
+            after = rows[-1].id
+            total += len(params)
+    if total:
+        logger.info("Backfill ip_int : %d lignes", total)
+    return total
+
+
+def run_migrations(db_engine):
+    add_missing_columns(db_engine)
+    relax_scanresult_host_id(db_engine)
+    create_missing_indexes(db_engine)
+    backfill_port_stats(db_engine)
+    backfill_changes(db_engine)
+    backfill_ip_int(db_engine)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    SQLModel.metadata.create_all(engine)
+    add_missing_columns(engine)
+    relax_scanresult_host_id(engine)
+    create_missing_indexes(engine)
+    force = "--force" in sys.argv
+    print(f"{backfill_port_stats(engine, force=force)} scans traités (compteurs)")
+    print(f"{backfill_changes(engine, force=force)} scans traités (changements)")
+    print(f"{backfill_ip_int(engine)} adresses converties (ip_int)")
@@ -1,19 +1,35 @@
 from typing import Optional
+from pydantic import field_validator
+from sqlalchemy import event
 from sqlmodel import Field, SQLModel, Relationship
 from models.entreprise import *
+from ipindex import ip_to_int, normalize_ip
 
 class Host(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True,index=True)
     name: str
-    ip: str
-    #entreprise_id: Optional[int] = Field(default=None, foreign_key="entreprise.id")
+    ip: str = Field(index=True, unique=True)
+    entreprise_id: Optional[int] = Field(default=None, foreign_key="entreprise.id", index=True)
+    # IPv4 sous forme entière, tenue à jour à chaque écriture : requêtes par CIDR sur l'index
+    ip_int: Optional[int] = Field(default=None, index=True)
     #entreprise: Optional[Entreprise] = Relationship(back_populates="host")
+
+    @field_validator("ip")
+    @classmethod
+    def check_ip(cls, value: str) -> str:
+        return normalize_ip(value)
+
     def __str__(self):
         return f"#{self.id} | Host {self.name} d'ip {self.ip}"
     
     def __repr__(self):
         return f"<Host(id='{self.id}', name='{self.name}', ip='{self.ip}')>"
 
+@event.listens_for(Host, "before_insert")
+@event.listens_for(Host, "before_update")
+def set_ip_int(mapper, connection, target):
+    target.ip_int = ip_to_int(target.ip)
+
 def main():
     h1 = Host(name="PC", ip="127.0.0.1")
     print(h1)
@@ -5,7 +5,7 @@ from sqlmodel import Field, SQLModel
 
 class Indicator(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    host_id: Optional[int] = Field(default=None, foreign_key="host.id")
+    host_id: Optional[int] = Field(default=None, foreign_key="host.id", index=True)
     name: str
     action_id: Optional[int] = Field(default=None, foreign_key="action.id")
 
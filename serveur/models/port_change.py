@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Any, List, Optional
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, Index, JSON
+
+OPENED, CLOSED = "opened", "closed"
+
+
+class PortChange(SQLModel, table=True):
+    __table_args__ = (Index("ix_portchange_host_id_date", "host_id", "date"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    host_id: int
+    scan_id: int = Field(foreign_key="scanresult.id")
+    date: datetime = Field(index=True)
+    port: int = Field(index=True)
+    change: str
+
+    def __str__(self):
+        return f"PortChange(host_id={self.host_id}, port={self.port}, {self.change} at {self.date})"
+
+
+class HostPortState(SQLModel, table=True):
+    # Dernier ensemble de ports ouverts connu par host, base du calcul des deltas
+    host_id: int = Field(primary_key=True)
+    ports: List[int] = Field(default_factory=list, sa_column=Column(JSON))
+    scan_id: Optional[int] = None
+    updated: Optional[datetime] = None
+
+    def __str__(self):
+        return f"HostPortState(host_id={self.host_id}, ports={self.ports})"
@@ -0,0 +1,14 @@
+from typing import Optional
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Index
+
+
+class PortHit(SQLModel, table=True):
+    # Un port ouvert vu par un scan : forme normalisée de ScanResult.open_ports
+    __table_args__ = (Index("ix_porthit_host_id_port", "host_id", "port"),)
+    scan_id: int = Field(foreign_key="scanresult.id", primary_key=True)
+    port: int = Field(primary_key=True, index=True)
+    host_id: Optional[int] = None
+
+    def __str__(self):
+        return f"PortHit(scan_id={self.scan_id}, host_id={self.host_id}, port={self.port})"
@@ -1,14 +1,15 @@
 from datetime import datetime
 from typing import Optional, Dict, Any
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, Index, JSON
 
 
 
 class ScanResult(SQLModel, table=True):
+    __table_args__ = (Index("ix_scanresult_host_id_date", "host_id", "date"),)
     id: Optional[int] = Field(default=None, primary_key=True)
-    host_id: int
-    date: datetime = Field(default_factory=datetime.utcnow)
+    host_id: Optional[int] = None
+    date: datetime = Field(default_factory=datetime.utcnow, index=True)
     open_ports: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
     def __str__(self):
         return f"ScanResult(id={self.id}, host_id={self.host_id}, date={self.date}, open_ports={self.open_ports})"
\ No newline at end of file
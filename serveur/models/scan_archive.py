@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+
+class ScanArchive(SQLModel, table=True):
+    # Fichier NDJSON gzip de ScanResult retirés de la base par la rétention (retention.py)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    path: str = Field(index=True)
+    rows: int = 0
+    first_id: int
+    last_id: int
+    first_date: datetime = Field(index=True)
+    last_date: datetime = Field(index=True)
+    created: datetime = Field(default_factory=datetime.now)
+
+    def __str__(self):
+        return f"ScanArchive(path={self.path}, rows={self.rows}, {self.first_date} -> {self.last_date})"
@@ -1,16 +1,31 @@
 from typing import Optional
+from pydantic import field_validator
+from sqlalchemy import event
 from sqlmodel import Field, SQLModel,Relationship
 from .entreprise import *
+from ipindex import ip_to_int, normalize_ip
 
 class Serveur(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True,index=True)
     name: str
     ip: str
+    ip_int: Optional[int] = Field(default=None, index=True)
     #entreprise_id: Optional[int] = Field(default=None, foreign_key="entreprise.id")
     #entreprise: Optional[Entreprise] = Relationship(back_populates="serveur")
 
+    @field_validator("ip")
+    @classmethod
+    def check_ip(cls, value: str) -> str:
+        return normalize_ip(value)
+
     def __str__(self):
         return f"#{self.id} | Host {self.name} d'ip {self.ip}"
     
     def __repr__(self):
-        return f"<Host(id='{self.id}', name='{self.name}', ip='{self.ip}')>"
\ No newline at end of file
+        return f"<Host(id='{self.id}', name='{self.name}', ip='{self.ip}')>"
+
+
+@event.listens_for(Serveur, "before_insert")
+@event.listens_for(Serveur, "before_update")
+def set_ip_int(mapper, connection, target):
+    target.ip_int = ip_to_int(target.ip)
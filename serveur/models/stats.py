@@ -0,0 +1,17 @@
+from sqlmodel import Field, SQLModel
+
+
+class StatCounter(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    value: int = 0
+
+    def __str__(self):
+        return f"StatCounter({self.name}={self.value})"
+
+
+class PortCount(SQLModel, table=True):
+    port: int = Field(primary_key=True)
+    hits: int = Field(default=0, index=True)
+
+    def __str__(self):
+        return f"PortCount(port={self.port}, hits={self.hits})"
@@ -0,0 +1,10 @@
+from sqlmodel import Field, SQLModel
+
+
+class TableVersion(SQLModel, table=True):
+    # Version d'une table d'inventaire, incrémentée dans la transaction de chaque écriture (cache.py)
+    name: str = Field(primary_key=True)
+    version: int = 0
+
+    def __str__(self):
+        return f"TableVersion({self.name}={self.version})"
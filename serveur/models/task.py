@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlmodel import Field, SQLModel
+from sqlalchemy import Column, JSON
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED, INTERRUPTED = "pending", "running", "done", "failed", "cancelled", "interrupted"
+FINISHED = (DONE, FAILED, CANCELLED, INTERRUPTED)
+
+
+class Task(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    type: str = Field(index=True)
+    status: str = Field(default=PENDING, index=True)
+    created: datetime = Field(default_factory=datetime.now, index=True)
+    started: Optional[datetime] = None
+    finished: Optional[datetime] = Field(default=None, index=True)
+    meta: Dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSON))
+    result: Optional[Any] = Field(default=None, sa_column=Column(JSON))
+    error: Optional[str] = None
+    truncated: bool = False
+    # File partagée (TASK_BACKEND=db) : tâche nommée, réclamée par un worker sous bail renouvelé
+    handler: Optional[str] = None
+    args: Optional[List[Any]] = Field(default=None, sa_column=Column(JSON))
+    priority: Optional[int] = Field(default=0, index=True)
+    worker: Optional[str] = None
+    lease_until: Optional[datetime] = Field(default=None, index=True)
+    attempts: Optional[int] = 0
+
+    def __str__(self):
+        return f"Task(id={self.id}, type={self.type}, status={self.status})"
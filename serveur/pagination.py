@@ -0,0 +1,75 @@
+import datetime
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import Integer, and_, or_
+from sqlmodel import select
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def clamp_limit(limit: int) -> int:
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit doit être >= 1")
+    return min(limit, MAX_LIMIT)
+
+
+def set_next_cursor(response: Response, request: Request, cursor: Optional[str], limit: int,
+                    limit_param: str = "limit"):
+    if cursor is None:
+        return
+    response.headers["X-Next-Cursor"] = cursor
+    # Même requête (filtres compris), seuls le curseur et la limite effective changent
+    url = request.url.include_query_params(after=cursor, **{limit_param: limit})
+    response.headers["Link"] = f'<{url.path}?{url.query}>; rel="next"'
+
+
+def page_by_id(session, model, limit: int, after: Optional[int], response: Response, request: Request, query=None,
+               keep: Optional[Callable[[List], List]] = None):
+    # Pagination par curseur (keyset) : WHERE id > after ORDER BY id LIMIT n.
+    # keep : filtre Python des lignes que la base ne sait pas sélectionner (CIDR IPv6), appliqué
+    # avant le curseur ; les lots suivants sont lus jusqu'à remplir la page ou épuiser la table
+    limit = clamp_limit(limit)
+    query = query if query is not None else select(model)
+    rows, last, cursor = [], after, None
+    while True:
+        batch_query = query.where(model.id > last) if last is not None else query
+        batch = session.exec(batch_query.order_by(model.id).limit(limit)).all()
+        rows += (keep(batch) if keep else batch)[:limit - len(rows)]
+        if len(rows) == limit:
+            cursor = str(rows[-1].id)
+            break
+        if len(batch) < limit:
+            break
+        last = batch[-1].id
+    set_next_cursor(response, request, cursor, limit)
+    return rows
+
+
+def encode_date_cursor(date: datetime.datetime, row_id: int) -> str:
+    return f"{date.isoformat()}_{row_id}"
+
+
+def decode_date_cursor(cursor: str, id_type=int) -> Tuple[datetime.datetime, int]:
+    try:
+        date, row_id = cursor.split("_", 1)
+        return datetime.datetime.fromisoformat(date), id_type(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
+def page_by_date_desc(session, model, limit: int, after: Optional[str], response: Response, request: Request,
+                      query=None, limit_param: str = "limit", date_field: str = "date"):
+    # Du plus récent au plus ancien ; (date, id) départage les lignes de même date
+    limit = clamp_limit(limit)
+    query = query if query is not None else select(model)
+    date_col = getattr(model, date_field)
+    if after:
+        date, row_id = decode_date_cursor(after, int if isinstance(model.id.type, Integer) else str)
+        query = query.where(or_(date_col < date, and_(date_col == date, model.id < row_id)))
+    rows = session.exec(query.order_by(date_col.desc(), model.id.desc()).limit(limit)).all()
+    last = rows[-1] if len(rows) == limit else None
+    cursor = encode_date_cursor(getattr(last, date_field), last.id) if last else None
+    set_next_cursor(response, request, cursor, limit, limit_param)
+    return rows
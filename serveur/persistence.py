@@ -0,0 +1,157 @@
+import datetime
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from config import env_int
+from database import engine
+from models.resultats_scans import ScanResult
+from changes import record_changes
+from stats import record_port_hits
+
+BATCH_SIZE = env_int("SCAN_WRITER_BATCH", 500)
+FLUSH_INTERVAL_MS = env_int("SCAN_WRITER_FLUSH_MS", 200)
+MAX_QUEUE = env_int("SCAN_WRITER_MAX_QUEUE", 50000)
+
+_STOP = object()
+
+
+def _deliver(future: Future, result: Any = None, exception: Optional[BaseException] = None):
+    # Future annulée par l'appelant (client déconnecté, wrap_future annulé) : la ligne est écrite,
+    # le résultat n'intéresse plus personne. set_result lèverait InvalidStateError et tuerait le thread.
+    if future.done():
+        return
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class ScanWriter:
+    """File d'écriture différée : les ScanResult sont insérés par lots dans une seule transaction."""
+
+    def __init__(self, engine, batch_size: int = BATCH_SIZE, flush_interval_ms: int = FLUSH_INTERVAL_MS,
+                 max_queue: int = MAX_QUEUE):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name="scan-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: Optional[float] = 10):
+        if not self.thread:
+            return
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def submit(self, host_id: Optional[int], open_ports: Dict[str, Any],
+               date: Optional[datetime.datetime] = None) -> Future:
+        # Bloque si la file est pleine : contre-pression naturelle sur les scanners
+        future = Future()
+        row = {"host_id": host_id, "date": date or datetime.datetime.now(), "open_ports": open_ports}
+        if not self.thread:
+            self._write([(row, future)])
+        else:
+            self.queue.put((row, future))
+        return future
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[dict, Future]] = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+        # Vide ce qui a pu arriver après la demande d'arrêt
+        leftover = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        for i in range(0, len(leftover), self.batch_size):
+            self._write(leftover[i:i + self.batch_size])
+
+    def _insert(self, conn, rows: List[dict]) -> List[int]:
+        table = ScanResult.__table__
+        if self.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+            stmt = table.insert().returning(table.c.id, sort_by_parameter_order=True)
+            ids = list(conn.execute(stmt, rows).scalars())
+        else:
+            ids = [conn.execute(table.insert(), row).inserted_primary_key[0] for row in rows]
+        # Ports normalisés, compteurs de /stats et deltas de ports dans la même transaction
+        record_port_hits(conn, ((i, row["host_id"], row["open_ports"]) for i, row in zip(ids, rows)))
+        record_changes(conn, ((i, row["host_id"], row["date"], row["open_ports"]) for i, row in zip(ids, rows)))
+        return ids
+
+    def _write(self, batch: List[Tuple[dict, Future]]):
+        started = time.perf_counter()
+        rows = [row for row, _ in batch]
+        try:
+            with self.engine.begin() as conn:
+                ids = self._insert(conn, rows)
+        except Exception:
+            # Un lot en échec est rejoué ligne par ligne pour isoler la ligne fautive
+            for row, future in batch:
+                try:
+                    with self.engine.begin() as conn:
+                        scan_id = self._insert(conn, [row])[0]
+                except Exception as e:
+                    self.errors += 1
+                    _deliver(future, exception=e)
+                else:
+                    self.written += 1
+                    _deliver(future, scan_id)
+        else:
+            # Lot validé : les résultats ne sont remis qu'après le commit, hors du try
+            self.written += len(batch)
+            for (_, future), scan_id in zip(batch, ids):
+                _deliver(future, scan_id)
+        self.batches += 1
+        elapsed = time.perf_counter() - started
+        self.last_flush_ms = elapsed * 1000
+        metrics.WRITER_FLUSH.observe(elapsed)
+
+
+scan_writer = ScanWriter(engine)
@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import os
+import socket
+import struct
+import time
+from typing import Iterable, List, Optional, Sequence
+
+from scanner import CLOSED, OPEN, probe_port
+
+TCP_PORTS = (80, 443, 22)
+ICMP_ECHO_REQUEST, ICMP_ECHO_REPLY = 8, 0
+DEFAULT_COUNT = 3
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_INTERVAL = 0.2
+# Bornes de /ping : au pire MAX_COUNT * MAX_TIMEOUT secondes de sondes par requête
+MAX_COUNT = 20
+MAX_TIMEOUT = 10.0
+
+_icmp_mode = None
+_sequence = itertools.count(1)
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _open_icmp_socket(kind: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+    sock.setblocking(False)
+    return sock
+
+
+def icmp_mode() -> Optional[str]:
+    # "raw" (CAP_NET_RAW/root), "dgram" (ping non privilégié de Linux, net.ipv4.ping_group_range) ou None
+    global _icmp_mode
+    if _icmp_mode is None:
+        _icmp_mode = ""
+        for mode, kind in (("raw", socket.SOCK_RAW), ("dgram", socket.SOCK_DGRAM)):
+            try:
+                _open_icmp_socket(kind).close()
+                _icmp_mode = mode
+                break
+            except (PermissionError, OSError):
+                continue
+    return _icmp_mode or None
+
+
+async def icmp_echo(ip: str, timeout: float = DEFAULT_TIMEOUT) -> Optional[float]:
+    # Un écho ICMP ; renvoie le RTT en secondes ou None si pas de réponse
+    mode = icmp_mode()
+    if mode is None:
+        raise PermissionError("ICMP indisponible")
+    loop = asyncio.get_running_loop()
+    sock = _open_icmp_socket(socket.SOCK_RAW if mode == "raw" else socket.SOCK_DGRAM)
+    ident = (os.getpid() ^ id(sock)) & 0xFFFF
+    seq = next(_sequence) & 0xFFFF
+    payload = struct.pack("!d", time.monotonic()) + b"supervision"
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, _checksum(header + payload), ident, seq) + payload
+    try:
+        start = time.monotonic()
+        await loop.sock_sendto(sock, packet, (ip, 0))
+        async with asyncio.timeout(timeout):
+            while True:
+                data, addr = await loop.sock_recvfrom(sock, 1024)
+                if mode == "raw":
+                    data = data[(data[0] & 0x0F) * 4:]
+                if len(data) < 8 or addr[0] != ip:
+                    continue
+                kind, _, _, reply_id, reply_seq = struct.unpack("!BBHHH", data[:8])
+                # En mode dgram le noyau réécrit l'identifiant : seule la séquence fait foi
+                if kind == ICMP_ECHO_REPLY and reply_seq == seq and (mode == "dgram" or reply_id == ident):
+                    return time.monotonic() - start
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        sock.close()
+
+
+async def tcp_echo(ip: str, ports: Sequence[int] = TCP_PORTS, timeout: float = DEFAULT_TIMEOUT) -> Optional[float]:
+    # Une connexion acceptée ou refusée (RST) prouve que l'hôte répond
+    probes = [asyncio.create_task(probe_port(ip, port, timeout)) for port in ports]
+    try:
+        for probe in asyncio.as_completed(probes):
+            state, rtt = await probe
+            if state in (OPEN, CLOSED):
+                return rtt
+        return None
+    finally:
+        for probe in probes:
+            probe.cancel()
+
+
+def _is_ipv4(ip: str) -> bool:
+    try:
+        socket.inet_aton(ip)
+        return ip.count(".") == 3
+    except OSError:
+        return False
+
+
+def resolve_method(ip: str, method: str = "auto") -> str:
+    if method == "auto":
+        return "icmp" if icmp_mode() and _is_ipv4(ip) else "tcp"
+    if method == "icmp" and not icmp_mode():
+        raise PermissionError("ICMP indisponible (droits insuffisants)")
+    return method
+
+
+async def probe(ip: str, count: int = DEFAULT_COUNT, timeout: float = DEFAULT_TIMEOUT,
+                interval: float = DEFAULT_INTERVAL, method: str = "auto",
+                ports: Sequence[int] = TCP_PORTS) -> dict:
+    method = resolve_method(ip, method)
+    rtts: List[float] = []
+    for attempt in range(count):
+        if attempt:
+            await asyncio.sleep(interval)
+        if method == "icmp":
+            rtt = await icmp_echo(ip, timeout)
+        else:
+            rtt = await tcp_echo(ip, ports, timeout)
+        if rtt is not None:
+            rtts.append(rtt)
+    result = {
+        "ip": ip,
+        "reachable": bool(rtts),
+        "method": method,
+        "sent": count,
+        "received": len(rtts),
+        "loss": round(1 - len(rtts) / count, 3) if count else 1.0,
+        "rtt_ms": None,
+    }
+    if rtts:
+        result["rtt_ms"] = {
+            "min": round(min(rtts) * 1000, 3),
+            "avg": round(sum(rtts) / len(rtts) * 1000, 3),
+            "max": round(max(rtts) * 1000, 3),
+        }
+    return result
+
+
+async def probe_many(ips: Iterable[str], concurrency: int = 256, **options) -> List[dict]:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(ip):
+        async with sem:
+            return await probe(ip, **options)
+
+    return await asyncio.gather(*(one(ip) for ip in ips))
+
+
+async def is_alive(ip: str, ports: Sequence[int] = TCP_PORTS, timeout: float = DEFAULT_TIMEOUT):
+    # Détection d'hôte : ICMP (si disponible) et TCP en parallèle, la première réponse l'emporte
+    checks = [asyncio.create_task(tcp_echo(ip, ports, timeout))]
+    if icmp_mode() and _is_ipv4(ip):
+        checks.append(asyncio.create_task(icmp_echo(ip, timeout)))
+    try:
+        for check in asyncio.as_completed(checks):
+            rtt = await check
+            if rtt is not None:
+                return True, rtt
+        return False, None
+    finally:
+        for check in checks:
+            check.cancel()
@@ -0,0 +1,209 @@
+import logging
+import math
+import random
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select
+
+import scanner
+from config import env_bool, env_float, env_int, env_str
+from models.host import Host
+from models.port_change import HostPortState
+import tasks as task_registry
+from scheduler import QueueFull
+
+logger = logging.getLogger(__name__)
+
+RECURRING_SCANS = env_bool("RECURRING_SCANS", False)
+SCAN_INTERVAL = env_int("SCAN_INTERVAL", 3600)
+SCAN_JITTER = env_float("SCAN_JITTER", 0.1)
+FULL_SCAN_EVERY = env_int("FULL_SCAN_EVERY", 6)
+SCAN_PORTS = env_str("SCAN_PORTS", "1-1024")
+SCAN_SLICE = env_int("SCAN_SLICE", 128)
+SCAN_TICK = env_float("SCAN_TICK", 5)
+HOSTS_REFRESH = 60
+PRIORITY = -10
+
+# Compteurs des passes exécutées dans ce processus (API en mode local, worker.py en mode db)
+COUNTERS = {"full": 0, "incremental": 0, "written": 0, "skipped_unchanged": 0, "probes": 0}
+_COUNTERS_LOCK = threading.Lock()
+
+
+def _count(**increments):
+    with _COUNTERS_LOCK:
+        for name, value in increments.items():
+            COUNTERS[name] += value
+
+
+def _known_ports(engine, host_id: int) -> Optional[List[int]]:
+    with Session(engine) as session:
+        state = session.get(HostPortState, host_id)
+        return None if state is None else list(state.ports or [])
+
+
+def scan_host(engine, writer, host_id: int, mode: str, ports: str = SCAN_PORTS, slice_start: int = 0,
+              slice_size: int = SCAN_SLICE) -> dict:
+    # Passe d'un host, exécutée par la tâche recurring_scan (jobs.py) : tout l'état utile est en base
+    with Session(engine) as session:
+        host = session.get(Host, host_id)
+    if host is None:
+        return {}
+    port_list = scanner.parse_ports(ports)
+    # Les ports connus ouverts sont toujours re-vérifiés : l'état écrit reste complet
+    # et la détection de changements (changes.record_changes) s'applique telle quelle.
+    known = _known_ports(engine, host_id)
+    if known is None:
+        mode = "full"
+    if mode == "full":
+        probed = port_list
+    else:
+        start = slice_start % len(port_list)
+        probed = sorted(set(known) | set(port_list[start:start + slice_size]))
+    result = scanner.scan(host.ip, ",".join(map(str, probed)))
+    opened = result["open_ports"]
+    if mode == "incremental" and not result["complete"]:
+        # Passe tronquée par la deadline : on ne déclare pas fermé un port non vérifié
+        opened = sorted(set(opened) | set(known))
+    _count(**{mode: 1, "probes": len(probed)})
+    # Une passe incrémentale sans changement ne produit aucune écriture
+    if mode == "full" or set(opened) != set(known):
+        writer.submit(host_id, {"ports": opened, "mode": mode, "checked": len(probed)})
+        _count(written=1)
+    else:
+        _count(skipped_unchanged=1)
+    return dict(result, mode=mode, checked=len(probed))
+
+
+class _HostSchedule:
+    __slots__ = ("ip", "phase", "slot")
+
+    def __init__(self, ip: str, phase: float):
+        self.ip = ip
+        self.phase = phase
+        self.slot = None
+
+
+class RecurringScanner:
+    """Rescans périodiques des hosts de l'inventaire : passe complète tous les
+    FULL_SCAN_EVERY passages, sinon re-vérification des ports connus ouverts plus
+    une tranche tournante de la plage.
+
+    Le calendrier est déterministe (créneaux de `interval` secondes décalés par host) et
+    chaque passe est une tâche d'identifiant recurring-<host>-<créneau> : avec plusieurs
+    processus API, un seul inscrit la passe, les autres reçoivent TaskExists."""
+
+    def __init__(self, engine, tasks, ports: str = SCAN_PORTS, interval: int = SCAN_INTERVAL,
+                 jitter: float = SCAN_JITTER, full_every: int = FULL_SCAN_EVERY, slice_size: int = SCAN_SLICE,
+                 tick: float = SCAN_TICK):
+        self.engine = engine
+        self.tasks = tasks
+        self.interval = max(1, interval)
+        self.jitter = min(max(0.0, jitter), 1.0)
+        self.full_every = max(1, full_every)
+        self.ports_spec = ports
+        self.ports = scanner.parse_ports(ports)
+        self.slice_size = max(1, slice_size)
+        self.tick = tick
+        self.hosts: Dict[int, _HostSchedule] = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.refreshed = 0.0
+        self.dispatched = self.taken = 0
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="recurring-scans", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _phase(self, host_id: int) -> float:
+        # Décalage propre au host, identique dans tous les processus : la charge est lissée sur l'intervalle
+        return zlib.crc32(str(host_id).encode()) / 2 ** 32 * self.interval
+
+    def _due(self, host_id: int, state: _HostSchedule, slot: int) -> float:
+        # Gigue tirée du couple (host, créneau) : elle aussi identique d'un processus à l'autre
+        jitter = random.Random(f"{host_id}:{slot}").uniform(0, self.jitter) * self.interval
+        return slot * self.interval + state.phase + jitter
+
+    def _slot(self, state: _HostSchedule, now: float) -> int:
+        return math.floor((now - state.phase) / self.interval)
+
+    def refresh_hosts(self):
+        with Session(self.engine) as session:
+            rows = session.exec(select(Host.id, Host.ip)).all()
+        with self.lock:
+            current = {host_id: ip for host_id, ip in rows}
+            for host_id in list(self.hosts):
+                if host_id not in current:
+                    del self.hosts[host_id]
+            for host_id, ip in current.items():
+                state = self.hosts.get(host_id)
+                if state is None:
+                    self.hosts[host_id] = _HostSchedule(ip, self._phase(host_id))
+                else:
+                    state.ip = ip
+        self.refreshed = time.monotonic()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                if time.monotonic() - self.refreshed > HOSTS_REFRESH:
+                    self.refresh_hosts()
+                self.dispatch()
+            except Exception as e:
+                logger.warning("Rescans périodiques : %s", e)
+            self.stop_event.wait(self.tick)
+
+    def dispatch(self, now: Optional[float] = None):
+        # Horloge murale : les processus doivent tomber sur les mêmes créneaux
+        now = time.time() if now is None else now
+        with self.lock:
+            states = list(self.hosts.items())
+        for host_id, state in states:
+            slot = self._slot(state, now)
+            if state.slot == slot or now < self._due(host_id, state, slot):
+                continue
+            mode = "full" if slot % self.full_every == 0 else "incremental"
+            try:
+                self.tasks.submit("port_scan", "recurring_scan", host_id, mode, self.ports_spec,
+                                  slot * self.slice_size, self.slice_size, task_id=f"recurring-{host_id}-{slot}",
+                                  meta={"host_id": host_id, "mode": mode, "recurring": True}, host=state.ip,
+                                  caller="recurring", priority=PRIORITY)
+                self.dispatched += 1
+            except task_registry.TaskExists:
+                # Inscrite par un autre processus API
+                self.taken += 1
+            except QueueFull:
+                return
+            state.slot = slot
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self.lock:
+            states = list(self.hosts.items())
+        upcoming = [self._due(host_id, state, state.slot + 1 if state.slot == self._slot(state, now)
+                              else self._slot(state, now)) for host_id, state in states]
+        with _COUNTERS_LOCK:
+            counters = dict(COUNTERS)
+        return {
+            "enabled": bool(self.thread and self.thread.is_alive()),
+            "interval": self.interval,
+            "jitter": self.jitter,
+            "full_every": self.full_every,
+            "slice": self.slice_size,
+            "ports": len(self.ports),
+            "hosts": len(states),
+            "due": sum(1 for due in upcoming if due <= now),
+            "dispatched": self.dispatched,
+            "taken_by_other": self.taken,
+            "next_in": round(max(0.0, min(upcoming) - now), 1) if upcoming else None,
+            "counters": counters,
+        }
@@ -0,0 +1,294 @@
+"""Rétention de l'historique ScanResult.
+
+Trois paliers selon l'âge d'un scan :
+- moins de RETENTION_RAW_DAYS jours : tout est gardé ;
+- jusqu'à RETENTION_DAILY_DAYS jours : un scan par host et par jour ;
+- au-delà : seulement les points de changement (scans référencés par portchange)
+  et le dernier état connu de chaque host.
+
+Les scans retirés sont d'abord écrits dans des archives NDJSON gzip (RETENTION_ARCHIVE_DIR),
+enregistrées dans la table scanarchive, puis supprimés par petits lots : /export/scans les relit.
+Les compteurs de /stats (statcounter, portcount) ne sont pas décrémentés : comme l'export,
+ils couvrent tout l'historique, archives comprises.
+
+Usage manuel (depuis serveur/) : python -m retention [--dry-run] [--vacuum]
+"""
+import datetime
+import gzip
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Iterator, List, Optional
+
+from sqlalchemy import delete, func, select, text
+
+import metrics
+from config import env_bool, env_float, env_int, env_str
+from models.port_change import HostPortState, PortChange
+from models.port_hit import PortHit
+from models.resultats_scans import ScanResult
+from models.scan_archive import ScanArchive
+
+logger = logging.getLogger(__name__)
+
+RETENTION_ENABLED = env_bool("RETENTION_ENABLED", False)
+RETENTION_RAW_DAYS = env_int("RETENTION_RAW_DAYS", 7)
+RETENTION_DAILY_DAYS = env_int("RETENTION_DAILY_DAYS", 90)
+RETENTION_INTERVAL = env_int("RETENTION_INTERVAL", 6 * 3600)
+RETENTION_BATCH = env_int("RETENTION_BATCH", 500)
+RETENTION_PAUSE = env_float("RETENTION_PAUSE", 0.05)
+RETENTION_ARCHIVE_ROWS = env_int("RETENTION_ARCHIVE_ROWS", 20000)
+RETENTION_ARCHIVE_DIR = env_str("RETENTION_ARCHIVE_DIR", "archives")
+ARCHIVE_PREFIX, ARCHIVE_SUFFIX = "scans-", ".ndjson.gz"
+
+RETENTION_SCANS = metrics.counter("retention_scans_total", "Scans examinés par la rétention, par décision",
+                                  ("decision",))
+
+
+def read_archive(path: str) -> Iterator[tuple]:
+    # Lignes (scan_id, host_id, date, open_ports), dans l'ordre des id
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            yield row["id"], row["host_id"], datetime.datetime.fromisoformat(row["date"]), row["open_ports"]
+
+
+def iter_archived(engine, since: Optional[datetime.datetime] = None, until: Optional[datetime.datetime] = None,
+                  archive_dir: str = RETENTION_ARCHIVE_DIR) -> Iterator[tuple]:
+    # Archives qui recoupent [since, until), relues triées par scan_id
+    query = select(ScanArchive.path, ScanArchive.first_id, ScanArchive.last_id).order_by(ScanArchive.first_id)
+    if since is not None:
+        query = query.where(ScanArchive.last_date >= since)
+    if until is not None:
+        query = query.where(ScanArchive.first_date < until)
+    with engine.connect() as conn:
+        archives = [row for row in conn.execute(query).all()
+                    if os.path.exists(os.path.join(archive_dir, row.path))]
+    # Une passe écrit des archives aux plages d'id disjointes ; seules celles de passes différentes
+    # peuvent se chevaucher. Chaque groupe de plages qui se recoupent est fusionné à part et les
+    # groupes sont lus l'un après l'autre : quelques fichiers ouverts à la fois, pas tous.
+    groups, end = [], None
+    for archive in archives:
+        if end is None or archive.first_id > end:
+            groups.append([])
+            end = archive.last_id
+        groups[-1].append(os.path.join(archive_dir, archive.path))
+        end = max(end, archive.last_id)
+    for paths in groups:
+        if len(paths) == 1:
+            yield from read_archive(paths[0])
+        else:
+            yield from heapq.merge(*(read_archive(path) for path in paths), key=lambda row: row[0])
+
+
+class RetentionJob:
+    """Compactage périodique de scanresult : archive puis supprime les scans hors politique, par lots."""
+
+    def __init__(self, engine, raw_days: int = RETENTION_RAW_DAYS, daily_days: int = RETENTION_DAILY_DAYS,
+                 interval: int = RETENTION_INTERVAL, batch: int = RETENTION_BATCH, pause: float = RETENTION_PAUSE,
+                 archive_rows: int = RETENTION_ARCHIVE_ROWS, archive_dir: str = RETENTION_ARCHIVE_DIR):
+        self.engine = engine
+        self.raw_days = max(0, raw_days)
+        self.daily_days = max(self.raw_days, daily_days)
+        self.interval = interval
+        self.batch = max(1, batch)
+        self.pause = pause
+        self.archive_rows = max(self.batch, archive_rows)
+        self.archive_dir = archive_dir
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.last_run: Optional[dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self.lock.locked()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wakeup.set()
+
+    def trigger(self) -> bool:
+        # Passe immédiate : réveille la boucle, ou un thread ponctuel si la rétention périodique est coupée
+        if self.running:
+            return False
+        if self.thread and self.thread.is_alive():
+            self.wakeup.set()
+        else:
+            threading.Thread(target=self._run_logged, name="retention-once", daemon=True).start()
+        return True
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            self._run_logged()
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def _run_logged(self):
+        try:
+            self.run()
+        except Exception as e:
+            logger.warning("Rétention : %s", e)
+
+    def run(self, dry_run: bool = False) -> Optional[dict]:
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            return self._run(dry_run)
+        finally:
+            self.lock.release()
+
+    def _run(self, dry_run: bool) -> dict:
+        started = time.perf_counter()
+        now = datetime.datetime.now()
+        raw_cutoff = now - datetime.timedelta(days=self.raw_days)
+        daily_cutoff = now - datetime.timedelta(days=self.daily_days)
+        report = {"started": now.isoformat(timespec="seconds"), "dry_run": dry_run, "examined": 0,
+                  "kept_changes": 0, "kept_daily": 0, "archived": 0, "deleted": 0, "files": 0}
+        if not dry_run:
+            self._remove_orphans()
+        table = ScanResult.__table__
+        with self.engine.connect() as conn:
+            # Borne haute par l'index sur date : la fin de table (scans récents) n'est jamais parcourue
+            last_id = conn.execute(select(func.max(table.c.id)).where(table.c.date < raw_cutoff)).scalar()
+        seen_days, pending, after = set(), [], 0
+        while last_id is not None and not self.stop_event.is_set():
+            with self.engine.connect() as conn:
+                rows = conn.execute(select(table.c.id, table.c.host_id, table.c.date, table.c.open_ports)
+                                    .where(table.c.id > after, table.c.id <= last_id, table.c.date < raw_cutoff)
+                                    .order_by(table.c.id).limit(self.batch)).all()
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                protected = set(conn.execute(select(PortChange.scan_id).where(PortChange.scan_id.in_(ids))).scalars())
+                protected |= set(conn.execute(select(HostPortState.scan_id)
+                                              .where(HostPortState.scan_id.in_(ids))).scalars())
+            after = ids[-1]
+            for row in rows:
+                report["examined"] += 1
+                day = (row.host_id, row.date.date())
+                if row.id in protected:
+                    seen_days.add(day)
+                    report["kept_changes"] += 1
+                elif row.date >= daily_cutoff and day not in seen_days:
+                    # Palier journalier : le premier scan du jour (ordre des id) est gardé
+                    seen_days.add(day)
+                    report["kept_daily"] += 1
+                else:
+                    pending.append(row)
+            if len(pending) >= self.archive_rows:
+                self._compact(pending, report, dry_run)
+                pending = []
+        if pending and not self.stop_event.is_set():
+            self._compact(pending, report, dry_run)
+        report["duration_s"] = round(time.perf_counter() - started, 3)
+        if not dry_run:
+            RETENTION_SCANS.inc(report["kept_changes"], decision="change")
+            RETENTION_SCANS.inc(report["kept_daily"], decision="daily")
+            RETENTION_SCANS.inc(report["archived"], decision="archived")
+        if report["archived"]:
+            logger.info("Rétention : %d scans archivés en %d fichier(s)", report["archived"], report["files"])
+        if not dry_run:
+            self.last_run = report
+        return report
+
+    def _compact(self, rows: List, report: dict, dry_run: bool):
+        if dry_run:
+            report["archived"] += len(rows)
+            return
+        # Archive écrite et enregistrée avant toute suppression : un arrêt en cours de route
+        # laisse au pire des scans présents deux fois, dédoublonnés à la lecture par l'export.
+        archive = self._write_archive(rows)
+        with self.engine.begin() as conn:
+            conn.execute(ScanArchive.__table__.insert(), archive)
+        report["files"] += 1
+        report["archived"] += len(rows)
+        ids = [row.id for row in rows]
+        for start in range(0, len(ids), self.batch):
+            chunk = ids[start:start + self.batch]
+            # Transactions courtes : le scan_writer reprend la main entre deux lots.
+            # Les compteurs de /stats restent tels quels (historique complet, voir en tête de module).
+            with self.engine.begin() as conn:
+                conn.execute(delete(PortHit).where(PortHit.scan_id.in_(chunk)))
+                deleted = conn.execute(delete(ScanResult).where(ScanResult.id.in_(chunk))).rowcount
+            report["deleted"] += deleted
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _write_archive(self, rows: List) -> dict:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        first, last = min(row.date for row in rows), max(row.date for row in rows)
+        name = f"{ARCHIVE_PREFIX}{first:%Y%m%d}-{last:%Y%m%d}-{uuid.uuid4().hex[:8]}{ARCHIVE_SUFFIX}"
+        path = os.path.join(self.archive_dir, name)
+        with open(path + ".tmp", "wb") as raw:
+            with gzip.open(raw, "wt", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({"id": row.id, "host_id": row.host_id, "date": row.date.isoformat(),
+                                        "open_ports": row.open_ports}) + "\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(path + ".tmp", path)
+        return {"path": name, "rows": len(rows), "first_id": rows[0].id, "last_id": rows[-1].id,
+                "first_date": first, "last_date": last, "created": datetime.datetime.now()}
+
+    def _remove_orphans(self):
+        # Fichiers écrits par une passe interrompue avant leur enregistrement dans scanarchive
+        if not os.path.isdir(self.archive_dir):
+            return
+        with self.engine.connect() as conn:
+            known = set(conn.execute(select(ScanArchive.path)).scalars())
+        for name in os.listdir(self.archive_dir):
+            if not name.startswith(ARCHIVE_PREFIX) or name in known:
+                continue
+            if name.endswith(ARCHIVE_SUFFIX) or name.endswith(ARCHIVE_SUFFIX + ".tmp"):
+                os.remove(os.path.join(self.archive_dir, name))
+                logger.info("Rétention : archive orpheline %s supprimée", name)
+
+    def stats(self) -> dict:
+        with self.engine.connect() as conn:
+            files, rows = conn.execute(select(func.count(ScanArchive.id), func.sum(ScanArchive.rows))).one()
+        return {
+            "enabled": bool(self.thread and self.thread.is_alive()),
+            "running": self.running,
+            "policy": {"raw_days": self.raw_days, "daily_days": self.daily_days, "interval": self.interval,
+                       "batch": self.batch, "archive_dir": self.archive_dir},
+            "archives": {"files": files, "rows": rows or 0},
+            "last_run": self.last_run,
+        }
+
+
+def vacuum(engine):
+    # SQLite ne rend pas l'espace libéré au système sans VACUUM (bloquant : à lancer hors charge)
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from sqlmodel import SQLModel
+
+    from database import engine
+
+    parser = argparse.ArgumentParser(description="Passe de rétention sur scanresult")
+    parser.add_argument("--dry-run", action="store_true", help="compte les scans à archiver sans rien modifier")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM SQLite après la passe")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    SQLModel.metadata.create_all(engine)
+    print(RetentionJob(engine).run(dry_run=args.dry_run))
+    if args.vacuum and not args.dry_run:
+        vacuum(engine)
@@ -0,0 +1,232 @@
+import asyncio
+import socket
+import threading
+import time
+from typing import Iterable, List, Optional
+
+import metrics
+
+DEFAULT_CONCURRENCY = 500
+DEFAULT_TIMEOUT = 0.3
+MIN_TIMEOUT = 0.1
+MAX_TIMEOUT = 1.0
+
+
+class PortRangeError(ValueError):
+    pass
+
+
+class ScanOptionError(ValueError):
+    pass
+
+
+def parse_ports(spec: str) -> List[int]:
+    # "1-1024", "22,80,443" ou "22,8000-8100"
+    ports = set()
+    try:
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                start, end = map(int, part.split("-"))
+            else:
+                start = end = int(part)
+            if start < 1 or end > 65535 or start > end:
+                raise PortRangeError(spec)
+            ports.update(range(start, end + 1))
+    except ValueError:
+        raise PortRangeError(spec)
+    if not ports:
+        raise PortRangeError(spec)
+    return sorted(ports)
+
+
+class RateLimiter:
+    """Token bucket partagé entre tous les scans visant une même IP."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def host_limiter(ip: str, rate: float) -> RateLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(ip)
+        if limiter is None or limiter.rate != rate:
+            limiter = _limiters[ip] = RateLimiter(rate)
+        return limiter
+
+
+class AdaptiveTimeout:
+    # Estimation type TCP (RFC 6298) : srtt + 4 * rttvar, bornée
+    def __init__(self, initial: float, minimum: float = MIN_TIMEOUT, maximum: float = MAX_TIMEOUT):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None
+        self.rttvar = None
+
+    def observe(self, rtt: float):
+        if self.srtt is None:
+            self.srtt, self.rttvar = rtt, rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    @property
+    def value(self) -> float:
+        if self.srtt is None:
+            return self.initial
+        return max(self.minimum, min(self.maximum, self.srtt + 4 * self.rttvar))
+
+
+OPEN, CLOSED, FILTERED = "open", "closed", "filtered"
+
+
+async def probe_port(ip: str, port: int, timeout: float):
+    loop = asyncio.get_running_loop()
+    sock = None
+    start = time.monotonic()
+    try:
+        # Création dans le try : EMFILE sous forte concurrence compte comme une sonde sans réponse
+        sock = socket.socket(socket.AF_INET6 if ":" in ip else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        async with asyncio.timeout(timeout):
+            await loop.sock_connect(sock, (ip, port))
+        return OPEN, time.monotonic() - start
+    except asyncio.TimeoutError:
+        return FILTERED, None
+    except ConnectionRefusedError:
+        return CLOSED, time.monotonic() - start
+    except OSError:
+        return FILTERED, None
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+class PortScanner:
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 rate: Optional[float] = None, adaptive: bool = True, deadline: Optional[float] = None,
+                 retries: int = 1):
+        if concurrency < 1:
+            raise ScanOptionError("concurrency doit être >= 1")
+        if timeout <= 0:
+            raise ScanOptionError("timeout doit être > 0")
+        if rate is not None and rate <= 0:
+            raise ScanOptionError("rate doit être > 0")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.rate = rate
+        self.adaptive = adaptive
+        self.deadline = deadline
+
+    async def scan(self, ip: str, ports: Iterable[int]) -> dict:
+        ports = list(ports)
+        timeout = AdaptiveTimeout(self.timeout) if self.adaptive else None
+        limiter = host_limiter(ip, self.rate) if self.rate else None
+        counts = {OPEN: 0, CLOSED: 0, FILTERED: 0}
+        retried = [0]
+        open_ports = []
+        started = time.monotonic()
+        end = started + self.deadline if self.deadline else None
+
+        async def worker(queue, retry, attempt):
+            for port in queue:
+                if limiter:
+                    await limiter.acquire()
+                wait = timeout.value if timeout else self.timeout
+                if attempt:
+                    # Les délais dépassés sous charge sont re-sondés avec un délai plus large
+                    wait = max(wait * 2, self.timeout)
+                state, rtt = await probe_port(ip, port, wait)
+                if rtt is not None and timeout:
+                    timeout.observe(rtt)
+                if state == FILTERED and attempt < self.retries:
+                    retry.append(port)
+                    retried[0] += 1
+                    continue
+                counts[state] += 1
+                if state == OPEN:
+                    open_ports.append(port)
+
+        complete = True
+        attempt = 0
+        while ports and complete:
+            queue, retry = iter(ports), []
+            workers = [asyncio.create_task(worker(queue, retry, attempt))
+                       for _ in range(min(self.concurrency, len(ports)))]
+            try:
+                done, pending = await asyncio.wait(workers, timeout=max(0, end - time.monotonic()) if end else None)
+                if pending:
+                    complete = False
+                    for w in pending:
+                        w.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                for w in done:
+                    w.result()
+            finally:
+                for w in workers:
+                    w.cancel()
+            ports, attempt = retry, attempt + 1
+        duration = time.monotonic() - started
+        _observe_scan(counts, retried[0], complete, duration)
+        return {
+            "ip": ip,
+            "open_ports": sorted(open_ports),
+            "probes": counts,
+            "complete": complete,
+            "duration": round(duration, 3),
+        }
+
+
+def _observe_scan(counts: dict, retried: int, complete: bool, duration: float):
+    # Une mise à jour par scan et non par sonde : coût négligeable sur les gros balayages
+    for state, count in counts.items():
+        if count:
+            metrics.SCAN_PROBES.inc(count, state=state)
+    if retried:
+        metrics.SCAN_RETRIES.inc(retried)
+    total = sum(counts.values())
+    metrics.SCAN_PORTS.observe(total)
+    if total:
+        metrics.SCAN_TIMEOUT_RATIO.observe(counts[FILTERED] / total)
+    metrics.SCAN_DURATION.observe(duration, complete=str(complete).lower())
+
+
+def resolve(ip: str) -> str:
+    return socket.gethostbyname(ip)
+
+
+async def resolve_async(ip: str) -> str:
+    # Équivalent non bloquant de gethostbyname (IPv4)
+    infos = await asyncio.get_running_loop().getaddrinfo(ip, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+    return infos[0][4][0]
+
+
+def scan(ip: str, ports: str = "1-1024", **options) -> dict:
+    # Point d'entrée synchrone (threads de FastAPI / executor)
+    port_list = parse_ports(ports)
+    return asyncio.run(PortScanner(**options).scan(resolve(ip), port_list))
@@ -0,0 +1,193 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+import metrics
+from config import env_int
+
+POOL_SIZES = {
+    "port_scan": env_int("SCHED_PORT_SCAN_WORKERS", 8),
+    "action_run": env_int("SCHED_ACTION_RUN_WORKERS", 4),
+    "sweep": env_int("SCHED_SWEEP_WORKERS", 2),
+}
+MAX_QUEUE = env_int("SCHED_MAX_QUEUE", 1000)
+PER_HOST_LIMIT = env_int("SCHED_PER_HOST", 2)
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class _Job:
+    __slots__ = ("fn", "args", "future", "host", "submitted")
+
+    def __init__(self, fn, args, future, host):
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.host = host
+        self.submitted = time.monotonic()
+
+
+class _Timing:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def as_dict(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "avg": round(avg, 4), "max": round(self.max, 4), "total": round(self.total, 3)}
+
+
+class JobPool:
+    """Pool de threads d'un type de tâche : priorités, partage équitable entre appelants,
+    limite de tâches simultanées par hôte et file bornée."""
+
+    def __init__(self, name: str, workers: int, max_queue: int = MAX_QUEUE, per_host: int = PER_HOST_LIMIT):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_host = per_host
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.running_by_host: Dict[str, int] = defaultdict(int)
+        self.active = 0
+        # Start-time fair queuing : chaque appelant avance sa propre horloge virtuelle
+        self.vtime = 0
+        self.finish: Dict[str, int] = {}
+        self.submitted = self.completed = self.failed = self.rejected = 0
+        self.wait = _Timing()
+        self.run = _Timing()
+        self.closed = False
+        self.threads = [threading.Thread(target=self._worker, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, fn: Callable, *args, priority: int = 0, host: Optional[str] = None,
+               caller: Optional[str] = None) -> Future:
+        future = Future()
+        with self.cond:
+            if self.closed:
+                raise RuntimeError(f"pool {self.name} arrêté")
+            if len(self.heap) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(self.name)
+            caller = caller or ""
+            start = max(self.vtime, self.finish.get(caller, 0))
+            self.finish[caller] = start + 1
+            if len(self.finish) > 10 * self.max_queue:
+                self.finish = {c: f for c, f in self.finish.items() if f > self.vtime}
+            # Priorité haute d'abord, puis horloge virtuelle de l'appelant, puis ordre d'arrivée
+            heapq.heappush(self.heap, (-priority, start, next(self.seq), _Job(fn, args, future, host)))
+            self.submitted += 1
+            self.cond.notify()
+        return future
+
+    def _next_job(self):
+        # Appelé sous verrou : premier job dont l'hôte n'a pas atteint sa limite
+        skipped, found = [], None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            job = entry[3]
+            if job.future.cancelled():
+                continue
+            if job.host is None or self.running_by_host.get(job.host, 0) < self.per_host:
+                found = entry
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return found
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                entry = self._next_job()
+                while entry is None:
+                    if self.closed:
+                        return
+                    self.cond.wait()
+                    entry = self._next_job()
+                job = entry[3]
+                self.vtime = entry[1]
+                if job.host is not None:
+                    self.running_by_host[job.host] += 1
+                self.active += 1
+            started = time.monotonic()
+            failed = False
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.fn(*job.args))
+                    except BaseException as e:
+                        failed = True
+                        job.future.set_exception(e)
+            finally:
+                waited, ran = started - job.submitted, time.monotonic() - started
+                metrics.SCHED_WAIT.observe(waited, pool=self.name)
+                metrics.SCHED_RUN.observe(ran, pool=self.name)
+                with self.cond:
+                    self.wait.add(waited)
+                    self.run.add(ran)
+                    if failed:
+                        self.failed += 1
+                    else:
+                        self.completed += 1
+                    self.active -= 1
+                    if job.host is not None:
+                        self.running_by_host[job.host] -= 1
+                        if not self.running_by_host[job.host]:
+                            del self.running_by_host[job.host]
+                    self.cond.notify_all()
+
+    def shutdown(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "queued": len(self.heap),
+                "max_queue": self.max_queue,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "busy_hosts": len(self.running_by_host),
+                "wait_seconds": self.wait.as_dict(),
+                "run_seconds": self.run.as_dict(),
+            }
+
+
+class Scheduler:
+    def __init__(self, pool_sizes: Dict[str, int] = None, max_queue: int = MAX_QUEUE, per_host: int = PER_HOST_LIMIT):
+        self.pools = {name: JobPool(name, size, max_queue, per_host)
+                      for name, size in (pool_sizes or POOL_SIZES).items()}
+
+    def submit(self, type: str, fn: Callable, *args, **options) -> Future:
+        try:
+            pool = self.pools[type]
+        except KeyError:
+            raise ValueError(f"type de tâche inconnu : {type}")
+        return pool.submit(fn, *args, **options)
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown()
+
+    def stats(self) -> dict:
+        return {name: pool.stats() for name, pool in self.pools.items()}
@@ -0,0 +1,70 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models.port_hit import PortHit
+from models.stats import PortCount, StatCounter
+
+SCANS = "scans"
+
+
+def extract_ports(open_ports: Any) -> List[int]:
+    # Formats rencontrés : {"ports": [22, 80]}, {"ports": {"22": ...}} ou directement une liste
+    ports = open_ports.get("ports") if isinstance(open_ports, dict) else open_ports
+    if isinstance(ports, dict):
+        ports = list(ports.keys())
+    if not isinstance(ports, list):
+        return []
+    result = []
+    for port in ports:
+        try:
+            result.append(int(port))
+        except (TypeError, ValueError):
+            continue
+    return result
+
+
+def _increment(conn, table, key, value, increments: Dict[Any, int]):
+    # UPSERT "value = value + n" ; repli select/update/insert pour les autres backends
+    if not increments:
+        return
+    rows = [{key.name: k, value.name: n} for k, n in increments.items()]
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(conn.dialect.name)
+    if dialect:
+        stmt = dialect.insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[key], set_={value.name: value + stmt.excluded[value.name]})
+        conn.execute(stmt, rows)
+        return
+    existing = set(conn.execute(select(key).where(key.in_(list(increments)))).scalars())
+    for row in rows:
+        if row[key.name] in existing:
+            conn.execute(update(table).where(key == row[key.name]).values({value.name: value + row[value.name]}))
+        else:
+            conn.execute(table.insert(), row)
+
+
+def record_port_hits(conn, scans: Iterable[Tuple[int, Any, Any]]):
+    # scans : (scan_id, host_id, open_ports), écrits dans la transaction de l'appelant
+    hits, counts, total = [], Counter(), 0
+    for scan_id, host_id, open_ports in scans:
+        total += 1
+        ports = set(extract_ports(open_ports))
+        counts.update(ports)
+        hits.extend({"scan_id": scan_id, "host_id": host_id, "port": p} for p in ports)
+    if hits:
+        conn.execute(PortHit.__table__.insert(), hits)
+    ports, counters = PortCount.__table__, StatCounter.__table__
+    _increment(conn, ports, ports.c.port, ports.c.hits, counts)
+    _increment(conn, counters, counters.c.name, counters.c.value, {SCANS: total} if total else {})
+
+
+def read_stats(session, top: int = 10) -> Dict[str, Any]:
+    from models.host import Host
+
+    total_hosts = session.execute(select(func.count()).select_from(Host)).scalar_one()
+    total_scans = session.execute(select(StatCounter.value).where(StatCounter.name == SCANS)).scalar() or 0
+    top_ports = session.execute(select(PortCount.port, PortCount.hits)
+                                .order_by(PortCount.hits.desc(), PortCount.port).limit(top)).all()
+    return {"total_hosts": total_hosts, "total_scans": total_scans, "top_ports": [list(r) for r in top_ports]}
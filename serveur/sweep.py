@@ -0,0 +1,146 @@
+import asyncio
+import ipaddress
+import itertools
+import time
+from typing import AsyncIterator, Callable, Iterable, Optional, Sequence
+
+from config import env_int
+from probe import is_alive
+from scanner import PortScanner
+
+LIVENESS_PORTS = (22, 80, 443, 445, 3389)
+LIVENESS_TIMEOUT = 0.5
+LIVENESS_CONCURRENCY = 128
+HOST_WORKERS = 16
+SOCKET_BUDGET = 512
+# Au-delà (un /16 par défaut), un balayage est refusé : un /8 ou un /64 IPv6 ne finirait jamais
+SWEEP_MAX_HOSTS = env_int("SWEEP_MAX_HOSTS", 65536)
+# Traitement des adresses déjà présentes dans l'inventaire : toutes, ignorées, en premier, seules
+KNOWN_MODES = ("all", "skip", "first", "only")
+
+
+class NetworkTooLarge(ValueError):
+    pass
+
+
+def check_size(network: ipaddress._BaseNetwork, max_hosts: int = SWEEP_MAX_HOSTS):
+    if network.num_addresses > max_hosts:
+        raise NetworkTooLarge(f"{network} : {network.num_addresses} adresses, au plus {max_hosts} par balayage")
+
+
+def targets(network: ipaddress._BaseNetwork, index, known: str = "all") -> Optional[Iterable[str]]:
+    # index : ipindex.IPIndex de l'inventaire ; None = ordre naturel du réseau
+    if known == "all":
+        return None
+    listed = [ip for ip, _ in index.items(network)]
+    if known == "only":
+        return listed
+    others = (str(host) for host in network.hosts() if int(host) not in index)
+    return others if known == "skip" else itertools.chain(listed, others)
+
+
+class Sweep:
+    def __init__(self, network: ipaddress._BaseNetwork, ports: Iterable[int],
+                 liveness_ports: Sequence[int] = LIVENESS_PORTS, liveness_timeout: float = LIVENESS_TIMEOUT,
+                 liveness_concurrency: int = LIVENESS_CONCURRENCY, host_workers: int = HOST_WORKERS,
+                 socket_budget: int = SOCKET_BUDGET, include_dead: bool = False,
+                 on_result: Optional[Callable] = None, hosts: Optional[Iterable[str]] = None, **scan_options):
+        if hosts is None:
+            check_size(network)
+        self.network = network
+        self.hosts = hosts
+        self.ports = list(ports)
+        self.liveness_ports = liveness_ports
+        self.liveness_timeout = liveness_timeout
+        self.liveness_concurrency = liveness_concurrency
+        self.host_workers = host_workers
+        self.include_dead = include_dead
+        self.on_result = on_result
+        scan_options.setdefault("concurrency", max(1, socket_budget // host_workers))
+        self.scanner = PortScanner(**scan_options)
+        self.stats = {"hosts": 0, "alive": 0, "scanned": 0}
+
+    async def _liveness(self, alive: asyncio.Queue, out: asyncio.Queue):
+        async def check(ip):
+            up, rtt = await is_alive(ip, self.liveness_ports, self.liveness_timeout)
+            if up:
+                self.stats["alive"] += 1
+                await alive.put((ip, rtt))
+            elif self.include_dead:
+                await out.put({"ip": ip, "reachable": False})
+
+        # Adresses produites au fil de l'eau : au plus liveness_concurrency tâches en vol
+        slots = asyncio.Semaphore(self.liveness_concurrency)
+        pending = set()
+
+        async def run(ip):
+            try:
+                await check(ip)
+            finally:
+                slots.release()
+
+        hosts = self.hosts if self.hosts is not None else (str(host) for host in self.network.hosts())
+        try:
+            for host in hosts:
+                await slots.acquire()
+                self.stats["hosts"] += 1
+                task = asyncio.create_task(run(host))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            # Producteur annulé : les tests de présence en vol partent avec lui
+            in_flight = list(pending)
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        for _ in range(self.host_workers):
+            await alive.put(None)
+
+    async def _scan_worker(self, alive: asyncio.Queue, out: asyncio.Queue):
+        while True:
+            item = await alive.get()
+            if item is None:
+                return
+            ip, rtt = item
+            result = await self.scanner.scan(ip, self.ports)
+            result["reachable"] = True
+            result["rtt"] = round(rtt, 4) if rtt is not None else None
+            if self.on_result:
+                result.update(await self.on_result(result) or {})
+            self.stats["scanned"] += 1
+            await out.put(result)
+
+    async def run(self) -> AsyncIterator[dict]:
+        started = time.monotonic()
+        alive = asyncio.Queue(maxsize=self.host_workers * 4)
+        out = asyncio.Queue()
+        stages = [asyncio.create_task(self._liveness(alive, out))]
+        stages += [asyncio.create_task(self._scan_worker(alive, out)) for _ in range(self.host_workers)]
+        pipeline = asyncio.gather(*stages)
+        getter, error = None, None
+        try:
+            while not (pipeline.done() and out.empty()):
+                getter = asyncio.ensure_future(out.get())
+                await asyncio.wait({getter, pipeline}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            pipeline.result()
+        except Exception as e:
+            # Une étape en échec : le flux se termine quand même par la ligne summary
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            # Étape en échec ou client parti : toutes les étapes restantes (sondes de présence,
+            # autres workers) sont annulées et attendues, pas seulement le gather
+            if getter is not None:
+                getter.cancel()
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(pipeline, *stages, return_exceptions=True)
+        summary = dict(self.stats, network=str(self.network), duration=round(time.monotonic() - started, 3))
+        if error:
+            summary["error"] = error
+        yield {"summary": summary}
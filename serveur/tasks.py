@@ -0,0 +1,325 @@
+import datetime
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import and_, delete, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+import jobs
+import metrics
+from config import env_int, env_str
+from models.task import CANCELLED, DONE, FAILED, FINISHED, INTERRUPTED, PENDING, RUNNING, Task
+from scheduler import MAX_QUEUE, QueueFull
+
+logger = logging.getLogger(__name__)
+
+TASK_TTL = env_int("TASK_TTL", 24 * 3600)
+TASK_MAX_FINISHED = env_int("TASK_MAX_FINISHED", 1000)
+TASK_MAX_OUTPUT = env_int("TASK_MAX_OUTPUT", 64 * 1024)
+# local : pools de threads du processus API ; db : l'API inscrit les tâches, worker.py les exécute
+TASK_BACKEND = env_str("TASK_BACKEND", "local")
+TASK_LEASE = env_int("TASK_LEASE", 30)
+TASK_MAX_ATTEMPTS = env_int("TASK_MAX_ATTEMPTS", 3)
+
+
+class TaskNotFound(KeyError):
+    pass
+
+
+class TaskNotCancellable(RuntimeError):
+    pass
+
+
+class TaskExists(RuntimeError):
+    pass
+
+
+def cap_output(value: Any, limit: int):
+    # Tronque les longues chaînes (stdout des actions) en gardant la fin, la plus utile
+    if isinstance(value, str) and len(value) > limit:
+        return "[...]\n" + value[-limit:], True
+    if isinstance(value, dict):
+        truncated = False
+        capped = {}
+        for key, item in value.items():
+            capped[key], cut = cap_output(item, limit)
+            truncated = truncated or cut
+        return capped, truncated
+    if isinstance(value, list):
+        items = [cap_output(item, limit) for item in value]
+        return [i for i, _ in items], any(cut for _, cut in items)
+    return value, False
+
+
+def task_status(task: Task) -> Dict[str, Any]:
+    status = {
+        "task_id": task.id,
+        "type": task.type,
+        "status": task.status,
+        "created": task.created,
+        "started": task.started,
+        "finished": task.finished,
+        "done": task.status in FINISHED,
+        "meta": task.meta,
+    }
+    if task.status == DONE:
+        status["result"] = task.result
+        status["truncated"] = task.truncated
+    elif task.error:
+        status["error"] = task.error
+    return status
+
+
+class TaskRegistry:
+    """Suivi des tâches de fond persisté en base ; seuls les Future en cours restent en mémoire."""
+
+    def __init__(self, engine, scheduler, ttl: int = TASK_TTL, max_finished: int = TASK_MAX_FINISHED,
+                 max_output: int = TASK_MAX_OUTPUT, backend: str = TASK_BACKEND, lease: int = TASK_LEASE,
+                 max_attempts: int = TASK_MAX_ATTEMPTS, max_pending: int = MAX_QUEUE):
+        if backend not in ("local", "db"):
+            raise ValueError(f"TASK_BACKEND inconnu : {backend}")
+        self.engine = engine
+        self.scheduler = scheduler
+        self.distributed = backend == "db"
+        self.lease = lease
+        self.max_attempts = max(1, max_attempts)
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.max_output = max_output
+        self.futures: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def recover(self):
+        # Les tâches d'un processus précédent ne reprendront pas (en mode db, les workers les reprennent)
+        if self.distributed:
+            self.evict()
+            return
+        error = "Interrompue par un redémarrage du serveur"
+        with Session(self.engine) as session:
+            interrupted = session.exec(select(Task.id, Task.type, Task.meta)
+                                       .where(Task.status.in_((PENDING, RUNNING)))).all()
+            session.execute(update(Task).where(Task.status.in_((PENDING, RUNNING)))
+                            .values(status=INTERRUPTED, finished=datetime.datetime.now(), error=error))
+            session.commit()
+        for row in interrupted:
+            self._aborted(row.type, row.meta, INTERRUPTED, error)
+        self.evict()
+
+    def _aborted(self, type: str, meta: Optional[dict], status: str, error: Optional[str] = None):
+        # Le handler n'a pas tourné jusqu'au bout : jobs.py laisse à son type de quoi constater la fin (marqueur .exit)
+        try:
+            jobs.aborted(type, meta, status, error)
+        except Exception as e:
+            logger.warning("Fin de la tâche %s non signalée : %s", type, e)
+
+    def _insert(self, task: Task):
+        # Identifiant imposé par l'appelant : la clé primaire fait de l'inscription une opération unique
+        with Session(self.engine) as session:
+            session.add(task)
+            try:
+                session.commit()
+            except IntegrityError:
+                raise TaskExists(task.id)
+
+    def submit(self, type: str, handler: Union[str, Callable], *args, meta: Optional[dict] = None,
+               task_id: Optional[str] = None, **options) -> str:
+        # handler : nom enregistré dans jobs.py, ou fonction (mode local uniquement)
+        # task_id : identifiant déterministe pour dédoublonner entre processus (TaskExists si déjà inscrite)
+        # options : priority, host, caller (voir scheduler.JobPool.submit)
+        task_id = task_id or str(uuid.uuid4())
+        if self.distributed:
+            if not isinstance(handler, str):
+                raise TypeError("TASK_BACKEND=db : seules les tâches nommées de jobs.py sont acceptées")
+            jobs.get(handler)
+            # Même plafond que la file d'un pool local : au-delà, 429 plutôt qu'une file sans fin
+            with Session(self.engine) as session:
+                pending = session.exec(select(func.count()).select_from(Task).where(
+                    Task.type == type, Task.status == PENDING, Task.handler.is_not(None))).one()
+            if pending >= self.max_pending:
+                raise QueueFull(type)
+            self._insert(Task(id=task_id, type=type, meta=meta or {}, handler=handler, args=list(args),
+                              priority=options.get("priority", 0)))
+            return task_id
+        fn = jobs.get(handler) if isinstance(handler, str) else handler
+        self._insert(Task(id=task_id, type=type, meta=meta or {}))
+        try:
+            with self.lock:
+                self.futures[task_id] = self.scheduler.submit(type, self._run, task_id, type, time.monotonic(),
+                                                              fn, *args, **options)
+        except Exception:
+            with Session(self.engine) as session:
+                session.execute(delete(Task).where(Task.id == task_id))
+                session.commit()
+            raise
+        return task_id
+
+    def _set(self, task_id: str, **values):
+        with Session(self.engine) as session:
+            session.execute(update(Task).where(Task.id == task_id).values(**values))
+            session.commit()
+
+    def _run(self, task_id: str, type: str, submitted: float, fn: Callable, *args):
+        self._set(task_id, status=RUNNING, started=datetime.datetime.now())
+        try:
+            result, truncated = cap_output(fn(*args), self.max_output)
+            values = {"status": DONE, "result": result, "truncated": truncated}
+        except Exception as e:
+            values = {"status": FAILED, "error": str(e)}
+        metrics.TASK_DURATION.observe(time.monotonic() - submitted, type=type, status=values["status"])
+        try:
+            self._set(task_id, finished=datetime.datetime.now(), **values)
+        finally:
+            with self.lock:
+                self.futures.pop(task_id, None)
+        self.evict()
+
+    def get(self, task_id: str) -> Task:
+        with Session(self.engine) as session:
+            task = session.get(Task, task_id)
+            if not task:
+                raise TaskNotFound(task_id)
+            return task
+
+    def states(self, task_ids: Sequence[str]) -> Dict[str, tuple]:
+        # (status, error) par tâche, en une requête ; les tâches purgées sont absentes
+        with Session(self.engine) as session:
+            rows = session.exec(select(Task.id, Task.status, Task.error).where(Task.id.in_(task_ids))).all()
+        return {row.id: (row.status, row.error) for row in rows}
+
+    def query(self, type: Optional[str] = None, status: Optional[str] = None):
+        query = select(Task)
+        if type:
+            query = query.where(Task.type == type)
+        if status:
+            query = query.where(Task.status == status)
+        return query
+
+    def cancel(self, task_id: str) -> Task:
+        with self.lock:
+            future = self.futures.get(task_id)
+            cancelled = future is not None and future.cancel()
+            if cancelled:
+                self.futures.pop(task_id, None)
+        if cancelled:
+            self._set(task_id, status=CANCELLED, finished=datetime.datetime.now())
+            task = self.get(task_id)
+            self._aborted(task.type, task.meta, CANCELLED, "Annulée")
+            return task
+        if self.distributed:
+            # Pas encore réclamée par un worker : l'annulation est une simple transition d'état
+            with Session(self.engine) as session:
+                cancelled = session.execute(update(Task).where(Task.id == task_id, Task.status == PENDING)
+                                            .values(status=CANCELLED, finished=datetime.datetime.now())).rowcount
+                session.commit()
+        task = self.get(task_id)
+        if cancelled:
+            self._aborted(task.type, task.meta, CANCELLED, "Annulée")
+        if task.status not in FINISHED:
+            raise TaskNotCancellable(task_id)
+        return task
+
+    def evict(self):
+        # TTL sur les tâches terminées, puis plafond : on garde les plus récentes
+        limit = datetime.datetime.now() - datetime.timedelta(seconds=self.ttl)
+        try:
+            with Session(self.engine) as session:
+                session.execute(delete(Task).where(Task.status.in_(FINISHED), Task.finished < limit))
+                keep = (select(Task.id).where(Task.status.in_(FINISHED))
+                        .order_by(Task.finished.desc()).offset(self.max_finished).limit(1000))
+                session.execute(delete(Task).where(Task.id.in_(keep)))
+                session.commit()
+        except Exception as e:
+            logger.warning("Nettoyage des tâches impossible : %s", e)
+        try:
+            jobs.purge_files(self.ttl)
+        except Exception as e:
+            logger.warning("Nettoyage des logs impossible : %s", e)
+
+    def _claimable(self, types: Sequence[str], now: datetime.datetime):
+        # En attente, ou en cours sous un bail expiré (worker arrêté ou planté)
+        return and_(Task.handler.is_not(None), Task.type.in_(types),
+                    or_(Task.status == PENDING, and_(Task.status == RUNNING, Task.lease_until < now)),
+                    func.coalesce(Task.attempts, 0) < self.max_attempts)
+
+    def claim(self, worker: str, types: Sequence[str], limit: int = 1) -> List[Task]:
+        now = datetime.datetime.now()
+        error = f"Abandonnée après {self.max_attempts} workers perdus"
+        with Session(self.engine) as session:
+            # Bail expiré après TASK_MAX_ATTEMPTS essais : la tâche fait tomber les workers, on abandonne
+            lost = and_(Task.handler.is_not(None), Task.status == RUNNING, Task.lease_until < now,
+                        func.coalesce(Task.attempts, 0) >= self.max_attempts)
+            abandoned = session.exec(select(Task.id, Task.type, Task.meta).where(lost)).all()
+            if abandoned:
+                session.execute(update(Task).where(Task.id.in_([row.id for row in abandoned]), lost)
+                                .values(status=FAILED, finished=now, error=error))
+                session.commit()
+            for row in abandoned:
+                self._aborted(row.type, row.meta, FAILED, error)
+            candidates = session.exec(select(Task.id).where(self._claimable(types, now))
+                                      .order_by(Task.priority.desc(), Task.created).limit(limit * 4)).all()
+            session.commit()
+            claimed = []
+            for task_id in candidates:
+                if len(claimed) >= limit:
+                    break
+                # Compare-and-set : un seul worker gagne la ligne, sans verrou applicatif
+                result = session.execute(
+                    update(Task).where(Task.id == task_id, self._claimable(types, now))
+                    .values(status=RUNNING, worker=worker, started=now,
+                            lease_until=now + datetime.timedelta(seconds=self.lease),
+                            attempts=func.coalesce(Task.attempts, 0) + 1))
+                session.commit()
+                if result.rowcount == 1:
+                    claimed.append(task_id)
+            rows = session.exec(select(Task).where(Task.id.in_(claimed))).all() if claimed else []
+            order = {task_id: i for i, task_id in enumerate(claimed)}
+            return sorted(rows, key=lambda t: order[t.id])
+
+    def extend(self, worker: str, task_ids: Sequence[str]) -> int:
+        # Battement de cœur : renouvelle le bail des tâches que ce worker détient encore
+        if not task_ids:
+            return 0
+        until = datetime.datetime.now() + datetime.timedelta(seconds=self.lease)
+        with Session(self.engine) as session:
+            result = session.execute(update(Task).where(Task.id.in_(task_ids), Task.worker == worker,
+                                                        Task.status == RUNNING).values(lease_until=until))
+            session.commit()
+            return result.rowcount
+
+    def complete(self, worker: str, task: Task, fn_result: Any = None, error: Optional[str] = None) -> bool:
+        if error is None:
+            result, truncated = cap_output(fn_result, self.max_output)
+            values = {"status": DONE, "result": result, "truncated": truncated}
+        else:
+            values = {"status": FAILED, "error": error}
+        now = datetime.datetime.now()
+        metrics.TASK_DURATION.observe((now - task.created).total_seconds(), type=task.type, status=values["status"])
+        with Session(self.engine) as session:
+            # Bail perdu entre-temps : la tâche appartient à un autre worker, on n'écrase rien
+            updated = session.execute(update(Task).where(Task.id == task.id, Task.worker == worker,
+                                                         Task.status == RUNNING)
+                                      .values(finished=now, lease_until=None, **values)).rowcount
+            session.commit()
+        return updated == 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {"in_flight": len(self.futures), "backend": "db" if self.distributed else "local"}
+        if not self.distributed:
+            return stats
+        now = datetime.datetime.now()
+        with Session(self.engine) as session:
+            rows = session.exec(select(Task.type, Task.status, func.count()).where(
+                Task.handler.is_not(None), Task.status.in_((PENDING, RUNNING))).group_by(Task.type, Task.status)).all()
+            workers = session.exec(select(Task.worker, func.count()).where(
+                Task.status == RUNNING, Task.lease_until >= now).group_by(Task.worker)).all()
+        for type, status, count in rows:
+            stats.setdefault(status, {})[type] = count
+        stats["workers"] = {worker: count for worker, count in workers}
+        return stats
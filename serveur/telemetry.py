@@ -0,0 +1,333 @@
+"""Télémétrie de la machine qui héberge l'API, lue directement dans /proc et /sys (Linux).
+
+Aucun sous-processus : une lecture complète coûte quelques dizaines de microsecondes.
+Hors Linux, psutil est utilisé s'il est installé ; à défaut, sous Windows, wmic fournit
+le modèle de CPU et la mémoire (un sous-processus par lecture), le reste est absent.
+Un thread échantillonne les compteurs toutes les TELEMETRY_INTERVAL secondes dans un
+tampon circulaire de TELEMETRY_HISTORY points (débits et taux calculés entre deux points).
+"""
+import collections
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import env_bool, env_float, env_int, env_str
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_ENABLED = env_bool("TELEMETRY_ENABLED", True)
+TELEMETRY_INTERVAL = env_float("TELEMETRY_INTERVAL", 5)
+TELEMETRY_HISTORY = env_int("TELEMETRY_HISTORY", 720)
+TELEMETRY_DISK_PATHS = env_str("TELEMETRY_DISK_PATHS", "/")
+
+PROC, SYS_BLOCK = "/proc", "/sys/block"
+CPU_FIELDS = ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal")
+MEMINFO_FIELDS = {"MemTotal": "total", "MemAvailable": "available", "MemFree": "free", "Buffers": "buffers",
+                  "Cached": "cached", "SwapTotal": "swap_total", "SwapFree": "swap_free"}
+NET_FIELDS = ("rx_bytes", "rx_packets", "rx_errors", "rx_dropped", "tx_bytes", "tx_packets", "tx_errors",
+              "tx_dropped")
+# Périphériques virtuels sans intérêt pour la supervision
+SKIPPED_DISKS = ("loop", "ram", "zram", "dm-", "sr")
+SECTOR = 512
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _wmic(*args: str) -> Dict[str, str]:
+    # Sortie « /value » de wmic (Windows sans psutil) : lignes Nom=Valeur
+    try:
+        output = subprocess.run(["wmic", *args, "/value"], capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.SubprocessError):
+        return {}
+    values = {}
+    for line in output.splitlines():
+        name, sep, value = line.partition("=")
+        if sep and value.strip():
+            values[name.strip()] = value.strip()
+    return values
+
+
+def read_cpu() -> Optional[Dict[str, int]]:
+    # Première ligne de /proc/stat : temps cumulés de tous les cœurs, en jiffies
+    content = _read(f"{PROC}/stat")
+    if not content:
+        if psutil is None:
+            return None
+        # Secondes de psutil ramenées au centième, comme des jiffies
+        times = psutil.cpu_times()._asdict()
+        return {name: int(times[name] * 100) for name in CPU_FIELDS if name in times}
+    values = content.split("\n", 1)[0].split()[1:]
+    return {name: int(value) for name, value in zip(CPU_FIELDS, values)}
+
+
+def read_memory() -> Optional[Dict[str, int]]:
+    content = _read(f"{PROC}/meminfo")
+    if not content:
+        return _fallback_memory()
+    memory = {}
+    for line in content.splitlines():
+        name, _, value = line.partition(":")
+        if name in MEMINFO_FIELDS:
+            memory[MEMINFO_FIELDS[name]] = int(value.split()[0]) * 1024
+    if "total" in memory:
+        memory["used"] = memory["total"] - memory.get("available", memory.get("free", 0))
+    return memory
+
+
+def _fallback_memory() -> Optional[Dict[str, int]]:
+    if psutil is not None:
+        memory, swap = psutil.virtual_memory(), psutil.swap_memory()
+        return {"total": memory.total, "available": memory.available, "free": memory.free,
+                "used": memory.total - memory.available, "swap_total": swap.total, "swap_free": swap.free}
+    if platform.system() == "Windows":
+        values = _wmic("OS", "get", "FreePhysicalMemory,TotalVisibleMemorySize")
+        try:
+            total, free = int(values["TotalVisibleMemorySize"]) * 1024, int(values["FreePhysicalMemory"]) * 1024
+        except (KeyError, ValueError):
+            return None
+        return {"total": total, "available": free, "free": free, "used": total - free}
+    return None
+
+
+def read_load() -> Optional[dict]:
+    content = _read(f"{PROC}/loadavg")
+    if content:
+        load1, load5, load15, procs = content.split()[:4]
+        running, total = procs.split("/")
+        return {"load1": float(load1), "load5": float(load5), "load15": float(load15),
+                "running": int(running), "processes": int(total)}
+    if hasattr(os, "getloadavg"):
+        load1, load5, load15 = os.getloadavg()
+        return {"load1": load1, "load5": load5, "load15": load15}
+    return None
+
+
+def read_uptime() -> Optional[float]:
+    content = _read(f"{PROC}/uptime")
+    if content:
+        return float(content.split()[0])
+    return round(time.time() - psutil.boot_time(), 2) if psutil is not None else None
+
+
+def _block_devices() -> set:
+    try:
+        names = os.listdir(SYS_BLOCK)
+    except OSError:
+        return set()
+    return {name for name in names if not name.startswith(SKIPPED_DISKS)}
+
+
+_DISKS: Optional[set] = None
+
+
+def read_disks() -> Dict[str, dict]:
+    # /proc/diskstats, disques entiers seulement (les partitions n'ont pas d'entrée dans /sys/block)
+    global _DISKS
+    if _DISKS is None:
+        _DISKS = _block_devices()
+    content = _read(f"{PROC}/diskstats")
+    if content is None and psutil is not None:
+        return {name: {"reads": d.read_count, "read_bytes": d.read_bytes, "writes": d.write_count,
+                       "write_bytes": d.write_bytes, "io_ms": getattr(d, "busy_time", 0)}
+                for name, d in (psutil.disk_io_counters(perdisk=True) or {}).items()}
+    disks = {}
+    for line in (content or "").splitlines():
+        fields = line.split()
+        if len(fields) < 14 or fields[2] not in _DISKS:
+            continue
+        disks[fields[2]] = {"reads": int(fields[3]), "read_bytes": int(fields[5]) * SECTOR,
+                            "writes": int(fields[7]), "write_bytes": int(fields[9]) * SECTOR,
+                            "io_ms": int(fields[12])}
+    return disks
+
+
+def read_filesystems(paths: str = TELEMETRY_DISK_PATHS) -> Dict[str, dict]:
+    usage = {}
+    for path in (p.strip() for p in paths.split(",")):
+        if not path:
+            continue
+        try:
+            if not hasattr(os, "statvfs"):
+                # Windows : pas de statvfs, shutil passe par GetDiskFreeSpaceEx
+                disk = shutil.disk_usage(path)
+                usage[path] = {"total": disk.total, "free": disk.free, "used": disk.used}
+                continue
+            st = os.statvfs(path)
+        except OSError:
+            continue
+        total, free = st.f_blocks * st.f_frsize, st.f_bavail * st.f_frsize
+        usage[path] = {"total": total, "free": free, "used": total - st.f_bfree * st.f_frsize}
+    return usage
+
+
+def read_network() -> Dict[str, dict]:
+    content = _read(f"{PROC}/net/dev")
+    if content is None and psutil is not None:
+        return {name: dict(zip(NET_FIELDS, (n.bytes_recv, n.packets_recv, n.errin, n.dropin,
+                                            n.bytes_sent, n.packets_sent, n.errout, n.dropout)))
+                for name, n in psutil.net_io_counters(pernic=True).items()}
+    interfaces = {}
+    # Deux lignes d'en-tête, puis « iface: rx(8 champs) tx(8 champs) »
+    for line in (content or "").splitlines()[2:]:
+        name, _, values = line.partition(":")
+        fields = values.split()
+        if len(fields) < 16:
+            continue
+        counters = [int(v) for v in fields[0:4] + fields[8:12]]
+        interfaces[name.strip()] = dict(zip(NET_FIELDS, counters))
+    return interfaces
+
+
+def read_counters() -> dict:
+    return {"time": time.time(), "cpu": read_cpu(), "memory": read_memory(), "load": read_load(),
+            "disks": read_disks(), "network": read_network()}
+
+
+def _cpu_model() -> Optional[str]:
+    for line in (_read(f"{PROC}/cpuinfo") or "").splitlines():
+        name, _, value = line.partition(":")
+        if name.strip() in ("model name", "Hardware", "cpu model"):
+            return value.strip()
+    if platform.system() == "Windows":
+        name = _wmic("cpu", "get", "Name").get("Name")
+        if name:
+            return name
+    return platform.processor() or None
+
+
+_SYSTEM: Optional[dict] = None
+
+
+def system_info() -> dict:
+    # Valeurs fixes pour la durée de vie du processus, lues une seule fois
+    global _SYSTEM
+    if _SYSTEM is None:
+        _SYSTEM = {"os": platform.platform(), "hostname": platform.node(), "cpu_model": _cpu_model(),
+                   "cpu_count": os.cpu_count()}
+    return _SYSTEM
+
+
+def _cpu_percent(before: Optional[dict], after: Optional[dict]) -> Optional[dict]:
+    if not before or not after:
+        return None
+    deltas = {name: after[name] - before.get(name, 0) for name in after}
+    total = sum(deltas.values())
+    if total <= 0:
+        return None
+    idle = deltas.get("idle", 0) + deltas.get("iowait", 0)
+    return {"busy": round(100 * (total - idle) / total, 1),
+            **{name: round(100 * deltas[name] / total, 1) for name in ("user", "system", "iowait", "steal")
+               if name in deltas}}
+
+
+def _rates(before: Dict[str, dict], after: Dict[str, dict], fields, elapsed: float) -> dict:
+    totals = dict.fromkeys(fields, 0.0)
+    for name, counters in after.items():
+        previous = before.get(name)
+        if previous is None:
+            continue
+        for field in fields:
+            # Compteur remis à zéro (interface recréée) : pas de débit négatif
+            totals[field] += max(0, counters[field] - previous[field]) / elapsed
+    return {field: round(value, 1) for field, value in totals.items()}
+
+
+def derive(before: Optional[dict], after: dict) -> dict:
+    # Point d'historique : instantanés mémoire/charge et taux calculés depuis `before`
+    memory, load = after["memory"] or {}, after["load"] or {}
+    point = {"time": round(after["time"], 3), "load1": load.get("load1"),
+             "memory_used": memory.get("used"), "memory_available": memory.get("available")}
+    if before is None:
+        return point
+    elapsed = after["time"] - before["time"]
+    if elapsed <= 0:
+        return point
+    cpu = _cpu_percent(before["cpu"], after["cpu"])
+    point["cpu_busy"] = cpu["busy"] if cpu else None
+    point.update({f"disk_{k}_per_s": v for k, v in
+                  _rates(before["disks"], after["disks"], ("read_bytes", "write_bytes"), elapsed).items()})
+    point.update({f"net_{k}_per_s": v for k, v in
+                  _rates(before["network"], after["network"], ("rx_bytes", "tx_bytes"), elapsed).items()})
+    return point
+
+
+class TelemetrySampler:
+    """Échantillonnage périodique des compteurs dans un tampon circulaire borné."""
+
+    def __init__(self, interval: float = TELEMETRY_INTERVAL, history: int = TELEMETRY_HISTORY):
+        self.interval = max(0.1, interval)
+        self.samples = collections.deque(maxlen=max(1, history))
+        self.last: Optional[dict] = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                logger.warning("Télémétrie : %s", e)
+            self.stop_event.wait(self.interval)
+
+    def sample(self) -> dict:
+        counters = read_counters()
+        with self.lock:
+            point = derive(self.last, counters)
+            self.last = counters
+            self.samples.append(point)
+        return point
+
+    def history(self, limit: Optional[int] = None) -> List[dict]:
+        with self.lock:
+            points = list(self.samples)
+        return points[-limit:] if limit else points
+
+    def current(self) -> dict:
+        # Valeurs brutes lues maintenant ; les taux sont calculés depuis le dernier échantillon
+        counters = read_counters()
+        with self.lock:
+            last = self.last
+        cpu = _cpu_percent(last["cpu"], counters["cpu"]) if last else None
+        return {
+            **system_info(),
+            "time": round(counters["time"], 3),
+            "uptime": read_uptime(),
+            "cpu": {"percent": cpu, "times": counters["cpu"]},
+            "memory": counters["memory"],
+            "load": counters["load"],
+            "filesystems": read_filesystems(),
+            "disks": counters["disks"],
+            "network": counters["network"],
+            "rates": derive(last, counters) if last else None,
+        }
+
+    def stats(self) -> dict:
+        return {"enabled": bool(self.thread and self.thread.is_alive()), "interval": self.interval,
+                "history": len(self.samples), "capacity": self.samples.maxlen}
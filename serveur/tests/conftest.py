@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Les modules de l'API s'importent à plat depuis serveur/ ; base jetable pour les moteurs créés à l'import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_TMP = tempfile.mkdtemp(prefix="supervision-tests-")
+os.environ.setdefault("SQLITE_FILE", os.path.join(_TMP, "supervision.db"))
+os.environ.setdefault("ACTION_LOG_DIR", os.path.join(_TMP, "actions"))
+
+from sqlmodel import SQLModel  # noqa: E402
+
+import models.host, models.port_change, models.port_hit, models.resultats_scans, models.stats  # noqa: E402,F401
+import models.table_version, models.task  # noqa: E402,F401
+from database import make_engine  # noqa: E402
+
+
+@pytest.fixture
+def engine(tmp_path):
+    db_engine = make_engine(f"sqlite:///{tmp_path / 'supervision.db'}", echo=False)
+    SQLModel.metadata.create_all(db_engine)
+    yield db_engine
+    db_engine.dispose()
@@ -0,0 +1,55 @@
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+import bulk
+import ipindex
+from models.host import Host
+
+SPEC = bulk.BulkSpec(Host, "ip", prepare=ipindex.with_ip_int, normalize=ipindex.normalize_ip)
+
+
+def _hosts(engine):
+    with Session(engine) as session:
+        return {host.ip: (host.name, host.ip_int) for host in session.exec(select(Host))}
+
+
+def test_validate_reports_row_errors_in_one_pass():
+    rows = [{"name": "a", "ip": " 10.0.0.1 "}, {"name": "b", "ip": "10.0.0.01"}, ["pas", "un", "objet"],
+            ValueError("JSON invalide : ligne 4"), {"name": "c", "ip": "10.0.0.1"}, {"ip": "10.0.0.2"}]
+    valid, errors = bulk.validate(SPEC, rows)
+    assert valid == [(0, {"name": "a", "ip": "10.0.0.1", "ip_int": 167772161})]
+    assert sorted(errors) == [1, 2, 3, 4, 5]
+    assert errors[2]["error"] == "objet JSON attendu"
+    assert errors[3]["error"] == "JSON invalide : ligne 4"
+    assert errors[4]["error"] == "ip en double dans le lot (ligne 0)"
+    assert all(errors[i]["status"] == "error" for i in errors)
+
+
+def test_upsert_creates_then_updates_only_given_fields(engine):
+    created = bulk.upsert(engine, SPEC, [{"name": "a", "ip": "10.0.0.1"}, {"name": "b", "ip": "2001:DB8::1"},
+                                         {"name": "c", "ip": "pas une ip"}])
+    assert (created["created"], created["updated"], created["errors"]) == (2, 0, 1)
+    assert [r["status"] for r in created["results"]] == ["created", "created", "error"]
+
+    updated = bulk.upsert(engine, SPEC, [{"name": "a2", "ip": "10.0.0.1"}, {"name": "d", "ip": "10.0.0.4"}])
+    assert (updated["created"], updated["updated"], updated["errors"]) == (1, 1, 0)
+    assert updated["results"][0]["id"] == created["results"][0]["id"]
+    assert _hosts(engine) == {"10.0.0.1": ("a2", 167772161), "2001:db8::1": ("b", None),
+                              "10.0.0.4": ("d", 167772164)}
+
+
+def test_upsert_all_or_nothing_writes_nothing_on_error(engine):
+    with pytest.raises(HTTPException) as raised:
+        bulk.upsert(engine, SPEC, [{"name": "a", "ip": "10.0.0.1"}, {"name": "b"}], all_or_nothing=True)
+    assert raised.value.status_code == 422 and [r["index"] for r in raised.value.detail] == [1]
+    assert _hosts(engine) == {}
+
+
+def test_delete_normalizes_ips_and_reports_invalid_ones(engine):
+    bulk.upsert(engine, SPEC, [{"name": "a", "ip": "10.0.0.1"}, {"name": "b", "ip": "2001:db8::1"},
+                               {"name": "c", "ip": "10.0.0.3"}])
+    result = bulk.delete_rows(engine, SPEC, keys=[" 10.0.0.1", "2001:DB8:0:0::1", "10.0.0.03"])
+    assert (result["deleted"], result["errors"]) == (2, 1)
+    assert result["results"] == [{"ip": "10.0.0.03", "status": "error", "error": "IP non valide : '10.0.0.03'"}]
+    assert list(_hosts(engine)) == ["10.0.0.3"]
@@ -0,0 +1,51 @@
+from sqlalchemy import delete, select
+from sqlmodel import Session
+
+import cache
+from models.host import Host
+from models.table_version import TableVersion
+
+
+def _version(engine, name: str = "host") -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(TableVersion.version).where(TableVersion.name == name)).scalar() or 0
+
+
+def test_writes_bump_the_database_version(engine):
+    cache.track_writes(engine)
+    with Session(engine) as session:
+        session.add(Host(name="a", ip="10.0.0.1"))
+        session.commit()
+    assert _version(engine) == 1
+    # Écritures hors ORM (bulk.py, migrations) comprises
+    with engine.begin() as conn:
+        conn.execute(Host.__table__.insert(), [{"name": "b", "ip": "10.0.0.2"}, {"name": "c", "ip": "10.0.0.3"}])
+        conn.execute(delete(Host).where(Host.ip == "10.9.9.9"))
+    assert _version(engine) == 2
+    assert _version(engine, "serveur") == 0
+
+
+def test_etag_depends_only_on_version_and_parameters():
+    table = cache.TableCache("host")
+    assert table.etag(3, 100, None) == cache.TableCache("host").etag(3, 100, None)
+    assert table.etag(3, 100, None) != table.etag(4, 100, None)
+    assert table.etag(3, 100, None) != table.etag(3, 50, None)
+
+
+def test_entries_follow_writes_from_other_processes(engine, monkeypatch):
+    cache.track_writes(engine)
+    table = cache.TableCache("host", version_check=0)
+    loads = []
+
+    def load():
+        loads.append(1)
+        with engine.connect() as conn:
+            return conn.execute(select(Host.name).where(Host.ip == "10.0.0.1")).scalar()
+
+    assert table.get_or_load("10.0.0.1", load) is None
+    assert table.get_or_load("10.0.0.1", load) is None and len(loads) == 1
+    # Écriture d'un autre processus : aucune invalidation locale, seule tableversion a bougé
+    with engine.begin() as conn:
+        conn.execute(Host.__table__.insert(), {"name": "a", "ip": "10.0.0.1"})
+    assert table.get_or_load("10.0.0.1", load) == "a" and len(loads) == 2
+    assert table.get_or_load("10.0.0.1", load) == "a" and len(loads) == 2
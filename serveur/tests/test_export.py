@@ -0,0 +1,18 @@
+import datetime
+
+import export
+from models.resultats_scans import ScanResult
+
+
+def test_aware_bounds_filter_database_rows_on_the_same_instant(engine):
+    noon = datetime.datetime(2026, 1, 1, 12, 0)
+    with engine.begin() as conn:
+        conn.execute(ScanResult.__table__.insert(), [
+            {"id": 1, "host_id": 1, "date": noon - datetime.timedelta(hours=1), "open_ports": {"ports": [22]}},
+            {"id": 2, "host_id": 1, "date": noon, "open_ports": {"ports": [80]}},
+        ])
+    # Même instant que 11:59 en heure locale, écrit avec un autre fuseau : « 16:59+05:00 » > « 12:00 » en texte
+    since = (noon - datetime.timedelta(minutes=1)).astimezone(datetime.timezone(datetime.timedelta(hours=5)))
+    filters = export.ExportFilters(since=since, until=since + datetime.timedelta(hours=1), archives=False)
+    assert [row[0] for row in export.iter_scans(engine, filters)] == [2]
+    assert filters.matches(1, noon, [80]) and not filters.matches(1, noon - datetime.timedelta(hours=1), [22])
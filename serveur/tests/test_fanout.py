@@ -0,0 +1,35 @@
+import os
+import time
+import uuid
+
+import fanout
+
+
+def _touch(path: str, age: float = 0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("sortie\n")
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+
+
+def test_purge_removes_logs_older_than_ttl(tmp_path, monkeypatch):
+    monkeypatch.setattr(fanout, "ACTION_LOG_DIR", str(tmp_path))
+    old_single, new_single = fanout.single_log_path(1), fanout.single_log_path(2)
+    _touch(old_single, age=7200)
+    _touch(old_single[:-len(".log")] + ".exit", age=7200)
+    _touch(new_single)
+    old_run, recent_run, other = str(uuid.uuid4()), str(uuid.uuid4()), "à-garder"
+    _touch(os.path.join(tmp_path, old_run, "1.log"), age=7200)
+    _touch(os.path.join(tmp_path, old_run, "manifest.json"), age=7200)
+    # Exécution encore active : un de ses logs vient d'être écrit
+    _touch(os.path.join(tmp_path, recent_run, "1.log"), age=7200)
+    _touch(os.path.join(tmp_path, recent_run, "2.log"))
+    _touch(os.path.join(tmp_path, other, "notes.txt"), age=7200)
+
+    assert fanout.purge_logs(3600, force=True) == 3
+    assert sorted(os.listdir(tmp_path)) == sorted([fanout.SINGLE_DIR, recent_run, other])
+    assert os.listdir(os.path.join(tmp_path, fanout.SINGLE_DIR)) == [os.path.basename(new_single)]
+    # Parcours espacés de PURGE_INTERVAL quand evict() est appelé à chaque tâche
+    _touch(os.path.join(tmp_path, old_run, "1.log"), age=7200)
+    assert fanout.purge_logs(3600) == 0
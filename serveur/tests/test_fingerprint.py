@@ -0,0 +1,32 @@
+import asyncio
+
+import fingerprint
+
+
+def test_failed_fingerprint_is_not_cached():
+    async def run():
+        banner = []
+
+        async def serve(reader, writer):
+            # Premier passage : connexion fermée sans rien dire, comme un reset passager
+            if banner:
+                writer.write(banner[0])
+                await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            options = {"timeout": 0.5, "banner_wait": 0.2}
+            first = await fingerprint.fingerprint_ports("127.0.0.1", [port], **options)
+            banner.append(b"SSH-2.0-OpenSSH_9.6\r\n")
+            second = await fingerprint.fingerprint_ports("127.0.0.1", [port], **options)
+            third = await fingerprint.fingerprint_ports("127.0.0.1", [port], **options)
+        return first[str(port)], second[str(port)], third[str(port)]
+
+    fingerprint._cache.clear()
+    first, second, third = asyncio.run(run())
+    assert first["service"] is None
+    assert (second["service"], second["product"], second["version"]) == ("ssh", "OpenSSH", "9.6")
+    assert "cached" not in second
+    assert third["cached"] is True and third["product"] == "OpenSSH"
@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+import migrations
+from models.port_change import HostPortState, PortChange
+from models.port_hit import PortHit
+from models.resultats_scans import ScanResult
+from models.stats import StatCounter
+from stats import SCANS
+
+
+def _seed(engine, count: int):
+    now = datetime.datetime.now()
+    with engine.begin() as conn:
+        conn.execute(ScanResult.__table__.insert(),
+                     [{"host_id": None, "date": now, "open_ports": {"ports": [22, 80]}} for _ in range(count)])
+
+
+def _counts(engine):
+    with engine.connect() as conn:
+        scans = conn.execute(select(StatCounter.value).where(StatCounter.name == SCANS)).scalar()
+        hits = conn.execute(select(func.count()).select_from(PortHit)).scalar()
+        markers = conn.execute(select(StatCounter.name).where(StatCounter.name != SCANS)).scalars().all()
+    return scans, hits, markers
+
+
+def test_port_stats_backfill_resumes_after_interruption(engine, monkeypatch):
+    _seed(engine, 25)
+    record = migrations.record_port_hits
+    calls = []
+
+    def failing(conn, rows):
+        calls.append(rows)
+        if len(calls) == 2:
+            raise RuntimeError("arrêt simulé")
+        record(conn, rows)
+
+    monkeypatch.setattr(migrations, "record_port_hits", failing)
+    with pytest.raises(RuntimeError):
+        migrations.backfill_port_stats(engine, batch_size=10)
+    # Premier lot validé, marqueur de progression en place : le backfill n'est pas considéré comme fait
+    assert _counts(engine)[:2] == (10, 20)
+
+    monkeypatch.setattr(migrations, "record_port_hits", record)
+    assert migrations.backfill_port_stats(engine, batch_size=10) == 15
+    assert _counts(engine) == (25, 50, [])
+    assert migrations.backfill_port_stats(engine, batch_size=10) == 0
+
+
+def test_changes_backfill_reruns_until_marked_done(engine, monkeypatch):
+    with engine.begin() as conn:
+        now = datetime.datetime.now()
+        conn.execute(ScanResult.__table__.insert(),
+                     [{"host_id": host_id, "date": now + datetime.timedelta(seconds=i), "open_ports": {"ports": [i]}}
+                      for host_id in (1, 2) for i in range(3)])
+    record = migrations.record_changes
+    calls = []
+
+    def failing(conn, rows):
+        calls.append(rows)
+        if len(calls) == 2:
+            raise RuntimeError("arrêt simulé")
+        record(conn, rows)
+
+    monkeypatch.setattr(migrations, "record_changes", failing)
+    with pytest.raises(RuntimeError):
+        migrations.backfill_changes(engine, batch_size=2)
+    # Des états existent déjà, mais sans marqueur de fin le backfill est rejoué en entier
+    monkeypatch.setattr(migrations, "record_changes", record)
+    assert migrations.backfill_changes(engine, batch_size=2) == 6
+    assert migrations.backfill_changes(engine, batch_size=2) == 0
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(PortChange)).scalar() == 10
+        assert conn.execute(select(func.count()).select_from(HostPortState)).scalar() == 2
@@ -0,0 +1,37 @@
+from fastapi import Request, Response
+from sqlmodel import Session, select
+
+import ipindex
+import pagination
+from models.host import Host
+
+
+def _request(query: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/hosts", "query_string": query.encode(),
+                    "headers": [], "scheme": "http", "server": ("testserver", 80)})
+
+
+def test_ipv6_cidr_pages_are_full_before_the_cursor(engine):
+    # Adresses du réseau noyées parmi d'autres IPv6 : la base ne sait sélectionner que « ip_int IS NULL »
+    with Session(engine) as session:
+        for i in range(30):
+            ip = f"2001:db8::{i:x}" if i % 3 == 0 else f"2001:db9::{i:x}"
+            session.add(Host(name=f"h{i}", ip=ip))
+        session.commit()
+    network = ipindex.parse_network("2001:db8::/64")
+    query = select(Host).where(ipindex.in_network_clause(Host, network))
+    pages, after = [], None
+    with Session(engine) as session:
+        while True:
+            response = Response()
+            rows = pagination.page_by_id(session, Host, 4, after, response, _request("cidr=2001:db8::/64"),
+                                         query, ipindex.network_filter(network))
+            pages.append([row.ip for row in rows])
+            after = response.headers.get("X-Next-Cursor")
+            if after is None:
+                break
+            assert "cidr=2001%3Adb8%3A%3A%2F64" in response.headers["Link"]
+            after = int(after)
+
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert [ip for page in pages for ip in page] == [f"2001:db8::{i:x}" for i in range(0, 30, 3)]
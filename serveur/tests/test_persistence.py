@@ -0,0 +1,51 @@
+import datetime
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import func, select
+
+from models.resultats_scans import ScanResult
+from persistence import ScanWriter
+
+
+def _count(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(ScanResult)).scalar()
+
+
+def test_cancelled_future_does_not_stop_writer(engine):
+    writer = ScanWriter(engine, batch_size=10, flush_interval_ms=50)
+    # Retient le thread d'écriture tant que la première future n'est pas annulée
+    gate = threading.Event()
+    insert = writer._insert
+
+    def gated_insert(conn, rows):
+        gate.wait(5)
+        return insert(conn, rows)
+
+    writer._insert = gated_insert
+    writer.start()
+    try:
+        cancelled = writer.submit(None, {"22": "ssh"})
+        assert cancelled.cancel()
+        gate.set()
+        # Le thread survit et l'écriture suivante aboutit
+        assert writer.submit(None, {"80": "http"}).result(timeout=5) > 0
+    finally:
+        writer.stop()
+    assert writer.written == 2
+    assert writer.errors == 0
+    assert _count(engine) == 2
+
+
+def test_cancelled_future_is_not_written_twice(engine):
+    writer = ScanWriter(engine)
+    cancelled, pending = Future(), Future()
+    cancelled.cancel()
+    now = datetime.datetime.now()
+    writer._write([({"host_id": None, "date": now, "open_ports": {"22": "ssh"}}, cancelled),
+                   ({"host_id": None, "date": now, "open_ports": {"80": "http"}}, pending)])
+    # Lot validé une seule fois : pas de rejeu ligne par ligne après le commit
+    assert pending.result(timeout=0) > 0
+    assert _count(engine) == 2
+    assert writer.errors == 0
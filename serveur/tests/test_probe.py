@@ -0,0 +1,24 @@
+import asyncio
+
+from bench.fixtures import ListenerFarm
+
+import probe
+
+
+def _tcp(port: int, count: int = 3) -> dict:
+    return asyncio.run(probe.probe("127.0.0.1", count=count, timeout=0.3, interval=0, method="tcp", ports=[port]))
+
+
+def test_tcp_probe_counts_answers_and_losses():
+    with ListenerFarm(open=1, closed=1, filtered=1) as farm:
+        listening = _tcp(farm.open_ports[0])
+        # Un RST prouve aussi que l'hôte répond
+        refused = _tcp(farm.closed_ports[0], count=2)
+        silent = _tcp(farm.filtered_ports[0], count=2)
+
+    assert listening["method"] == "tcp" and listening["reachable"]
+    assert (listening["sent"], listening["received"], listening["loss"]) == (3, 3, 0.0)
+    assert 0 <= listening["rtt_ms"]["min"] <= listening["rtt_ms"]["avg"] <= listening["rtt_ms"]["max"]
+    assert (refused["sent"], refused["received"], refused["loss"]) == (2, 2, 0.0)
+    assert not silent["reachable"]
+    assert (silent["sent"], silent["received"], silent["loss"], silent["rtt_ms"]) == (2, 0, 1.0, None)
@@ -0,0 +1,37 @@
+import datetime
+import gzip
+import json
+
+import retention
+from models.scan_archive import ScanArchive
+
+
+def _archive(engine, directory, name: str, ids):
+    day = datetime.datetime(2026, 1, 1)
+    with gzip.open(directory / name, "wt", encoding="utf-8") as f:
+        for scan_id in ids:
+            f.write(json.dumps({"id": scan_id, "host_id": 1, "date": day.isoformat(), "open_ports": {}}) + "\n")
+    with engine.begin() as conn:
+        conn.execute(ScanArchive.__table__.insert(), {"path": name, "rows": len(ids), "first_id": ids[0],
+                                                      "last_id": ids[-1], "first_date": day, "last_date": day})
+
+
+def test_archives_are_merged_by_overlapping_groups(engine, tmp_path, monkeypatch):
+    # Deux passes qui se chevauchent (1-50 et 10-30), puis une archive disjointe (100-120)
+    _archive(engine, tmp_path, "a.ndjson.gz", list(range(1, 51, 2)))
+    _archive(engine, tmp_path, "b.ndjson.gz", list(range(10, 31, 2)))
+    _archive(engine, tmp_path, "c.ndjson.gz", list(range(100, 121)))
+    opened, peak = set(), []
+    read = retention.read_archive
+
+    def tracking(path):
+        opened.add(path)
+        peak.append(len(opened))
+        yield from read(path)
+        opened.discard(path)
+
+    monkeypatch.setattr(retention, "read_archive", tracking)
+    ids = [row[0] for row in retention.iter_archived(engine, archive_dir=str(tmp_path))]
+    assert ids == sorted(ids) and len(ids) == 25 + 11 + 21
+    # c n'est ouverte qu'une fois a et b entièrement lues
+    assert max(peak) == 2
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+from bench.fixtures import ListenerFarm
+
+import scanner
+
+
+def test_parse_ports():
+    assert scanner.parse_ports("22,80,443") == [22, 80, 443]
+    assert scanner.parse_ports(" 8000-8003 ,22,8001,") == [22, 8000, 8001, 8002, 8003]
+    assert scanner.parse_ports("65535") == [65535]
+    for spec in ("", ",", "0", "65536", "10-5", "a-b", "1-2-3", "80,http"):
+        with pytest.raises(scanner.PortRangeError):
+            scanner.parse_ports(spec)
+
+
+def test_scan_options_are_checked():
+    for options in ({"concurrency": 0}, {"timeout": 0}, {"rate": -1}):
+        with pytest.raises(scanner.ScanOptionError):
+            scanner.PortScanner(**options)
+
+
+def test_scan_classifies_open_closed_and_filtered_ports():
+    with ListenerFarm(open=4, closed=3, filtered=2) as farm:
+        result = asyncio.run(scanner.PortScanner(concurrency=16, timeout=0.3).scan(farm.host, farm.ports()))
+    assert result["open_ports"] == sorted(farm.open_ports)
+    # Les ports filtrés sont re-sondés une fois avant d'être comptés
+    assert result["probes"] == {scanner.OPEN: 4, scanner.CLOSED: 3, scanner.FILTERED: 2}
+    assert result["complete"] is True
+
+
+def test_deadline_stops_the_scan_and_marks_it_incomplete():
+    with ListenerFarm(open=1, closed=0, filtered=4) as farm:
+        started = time.monotonic()
+        result = asyncio.run(scanner.PortScanner(concurrency=1, timeout=1.0, adaptive=False, deadline=0.3)
+                             .scan(farm.host, farm.filtered_ports + farm.open_ports))
+        elapsed = time.monotonic() - started
+    assert result["complete"] is False
+    assert elapsed < 1.0
+    assert result["open_ports"] == []
+
+
+def test_rate_limiter_spaces_acquisitions_after_the_burst():
+    async def acquire(limiter, count):
+        started = time.monotonic()
+        for _ in range(count):
+            await limiter.acquire()
+        return time.monotonic() - started
+
+    limiter = scanner.RateLimiter(rate=50, burst=5)
+    # 5 jetons d'avance, puis un toutes les 20 ms : 10 acquisitions de plus coûtent au moins 0,2 s
+    assert asyncio.run(acquire(limiter, 15)) >= 0.19
+    assert asyncio.run(acquire(scanner.RateLimiter(rate=1000, burst=20), 20)) < 0.05
+    assert scanner.host_limiter("10.0.0.1", 50) is scanner.host_limiter("10.0.0.1", 50)
+    assert scanner.host_limiter("10.0.0.1", 50) is not scanner.host_limiter("10.0.0.2", 50)
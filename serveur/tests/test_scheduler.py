@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from scheduler import JobPool, QueueFull
+
+
+@pytest.fixture
+def pools():
+    created = []
+
+    def make(*args, **kwargs) -> JobPool:
+        created.append(JobPool(*args, **kwargs))
+        return created[-1]
+
+    yield make
+    for pool in created:
+        pool.shutdown()
+
+
+def _drain(pool: JobPool) -> dict:
+    # Compteurs mis à jour après le résultat du Future : on attend la sortie des workers
+    pool.shutdown()
+    for thread in pool.threads:
+        thread.join(5)
+    return pool.stats()
+
+
+def _blocked(pool: JobPool, **options) -> threading.Event:
+    # Occupe un worker jusqu'à ce que l'événement soit levé
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+
+    pool.submit(hold, **options)
+    assert started.wait(5)
+    return release
+
+
+def test_higher_priority_then_fair_share_between_callers(pools):
+    pool = pools("test", 1)
+    release = _blocked(pool)
+    order = []
+    futures = [pool.submit(order.append, name, priority=priority, caller=caller)
+               for name, priority, caller in [("a1", 0, "a"), ("a2", 0, "a"), ("a3", 0, "a"),
+                                              ("b1", 0, "b"), ("urgent", 5, "c")]]
+    release.set()
+    for future in futures:
+        future.result(5)
+    # L'appelant b n'attend pas que a ait vidé sa file
+    assert order == ["urgent", "a1", "b1", "a2", "a3"]
+
+
+def test_per_host_limit_lets_other_hosts_through(pools):
+    pool = pools("test", 3, per_host=1)
+    lock, running, peak, finished = threading.Lock(), {}, {}, []
+    release = threading.Event()
+
+    def job(host):
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), running[host])
+        release.wait(0.2)
+        with lock:
+            running[host] -= 1
+            finished.append(host)
+
+    futures = [pool.submit(job, host, host=host) for host in ("10.0.0.1", "10.0.0.1", "10.0.0.1", "10.0.0.2")]
+    for future in futures:
+        future.result(5)
+    assert peak == {"10.0.0.1": 1, "10.0.0.2": 1}
+    # 10.0.0.2 passe devant les jobs de 10.0.0.1 qui attendent leur tour
+    assert finished.index("10.0.0.2") <= 1
+    stats = _drain(pool)
+    assert stats["completed"] == 4 and stats["busy_hosts"] == 0
+
+
+def test_full_queue_rejects_and_cancelled_jobs_are_skipped(pools):
+    pool = pools("test", 1, max_queue=2)
+    release = _blocked(pool)
+    ran = []
+    cancelled = pool.submit(ran.append, "annulée")
+    kept = pool.submit(ran.append, "gardée")
+    with pytest.raises(QueueFull):
+        pool.submit(ran.append, "refusée")
+    assert cancelled.cancel()
+    release.set()
+    kept.result(5)
+    assert ran == ["gardée"]
+    assert _drain(pool)["rejected"] == 1
+
+
+def test_failed_job_sets_the_future_exception(pools):
+    pool = pools("test", 1)
+    with pytest.raises(ZeroDivisionError):
+        pool.submit(lambda: 1 / 0).result(5)
+    assert _drain(pool)["failed"] == 1
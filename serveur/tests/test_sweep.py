@@ -0,0 +1,30 @@
+import asyncio
+import ipaddress
+
+from bench.fixtures import ListenerFarm
+
+import sweep
+
+
+def test_failing_worker_ends_stream_with_summary_and_cancels_stages():
+    async def failing(result):
+        raise RuntimeError("écriture impossible")
+
+    def endless():
+        # Sans annulation du producteur, les tests de présence continueraient indéfiniment
+        while True:
+            yield "127.0.0.1"
+
+    async def collect():
+        before = asyncio.all_tasks()
+        with ListenerFarm(open=1, closed=0, filtered=0) as farm:
+            job = sweep.Sweep(ipaddress.ip_network("127.0.0.1/32"), farm.open_ports,
+                              liveness_ports=farm.open_ports, host_workers=1, on_result=failing, hosts=endless())
+            items = [item async for item in job.run()]
+            await asyncio.sleep(0)
+            return items, asyncio.all_tasks() - before
+
+    items, others = asyncio.run(asyncio.wait_for(collect(), 10))
+    assert items == [{"summary": items[-1]["summary"]}]
+    assert items[-1]["summary"]["error"] == "RuntimeError: écriture impossible"
+    assert others == set()
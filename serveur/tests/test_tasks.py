@@ -0,0 +1,64 @@
+import datetime
+
+import pytest
+from sqlalchemy import update
+from sqlmodel import Session
+
+from models.task import DONE, PENDING, RUNNING, Task
+from scheduler import QueueFull
+from tasks import TaskExists, TaskRegistry
+
+
+def _registry(engine, **options) -> TaskRegistry:
+    return TaskRegistry(engine, None, backend="db", **options)
+
+
+def _expire(engine, task_id: str):
+    with Session(engine) as session:
+        session.execute(update(Task).where(Task.id == task_id)
+                        .values(lease_until=datetime.datetime.now() - datetime.timedelta(seconds=1)))
+        session.commit()
+
+
+def test_expired_lease_is_reclaimed_and_old_worker_rejected(engine):
+    registry = _registry(engine, lease=30)
+    task_id = registry.submit("port_scan", "port_scan", "127.0.0.1", "1-10")
+    [first] = registry.claim("w1", ["port_scan"])
+    assert first.id == task_id and first.attempts == 1
+    # Bail encore valide : aucun autre worker ne peut la prendre
+    assert registry.claim("w2", ["port_scan"]) == []
+
+    _expire(engine, task_id)
+    [second] = registry.claim("w2", ["port_scan"])
+    assert second.id == task_id and second.worker == "w2" and second.attempts == 2
+
+    # L'ancien worker a perdu la tâche : ni renouvellement ni résultat accepté
+    assert registry.extend("w1", [task_id]) == 0
+    assert registry.complete("w1", first, {"open_ports": [1]}) is False
+    assert registry.get(task_id).status == RUNNING
+
+    assert registry.extend("w2", [task_id]) == 1
+    assert registry.complete("w2", second, {"open_ports": [2]}) is True
+    task = registry.get(task_id)
+    assert task.status == DONE and task.result == {"open_ports": [2]}
+
+
+def test_db_backend_caps_pending_tasks(engine):
+    registry = _registry(engine, max_pending=2)
+    for _ in range(2):
+        registry.submit("port_scan", "port_scan", "127.0.0.1")
+    with pytest.raises(QueueFull):
+        registry.submit("port_scan", "port_scan", "127.0.0.1")
+    # Plafond par type : les autres files restent ouvertes
+    registry.submit("sweep", "sweep", "127.0.0.0/30")
+    # Une tâche réclamée libère une place
+    registry.claim("w1", ["port_scan"])
+    registry.submit("port_scan", "port_scan", "127.0.0.1")
+
+
+def test_explicit_task_id_is_registered_once(engine):
+    registry = _registry(engine)
+    registry.submit("port_scan", "port_scan", "127.0.0.1", task_id="recurring-1-42")
+    with pytest.raises(TaskExists):
+        registry.submit("port_scan", "port_scan", "127.0.0.1", task_id="recurring-1-42")
+    assert registry.get("recurring-1-42").status == PENDING
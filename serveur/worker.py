@@ -0,0 +1,152 @@
+"""Worker de tâches de fond pour TASK_BACKEND=db.
+
+Usage (depuis serveur/) : python -m worker [--types port_scan,sweep] [--concurrency 4]
+
+Plusieurs workers, sur une ou plusieurs machines, peuvent partager la même base : chacun
+réclame les tâches en attente sous un bail (TASK_LEASE) renouvelé tant qu'il tourne ; le bail
+d'un worker arrêté ou planté expire et ses tâches sont reprises par un autre.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Sequence
+
+import cache
+import jobs
+from config import env_float, env_int, env_str
+from database import configure_db, engine
+from models.task import Task
+from persistence import scan_writer
+from tasks import TaskRegistry
+
+logger = logging.getLogger("worker")
+
+WORKER_TYPES = env_str("WORKER_TYPES", "port_scan,sweep,action_run")
+WORKER_CONCURRENCY = env_int("WORKER_CONCURRENCY", 4)
+WORKER_POLL = env_float("WORKER_POLL", 1.0)
+EVICT_INTERVAL = 60
+
+
+class Worker:
+    """Boucle de réclamation : au plus `concurrency` tâches à la fois, bail renouvelé au tiers de sa durée."""
+
+    def __init__(self, registry: TaskRegistry, types: Sequence[str], concurrency: int = WORKER_CONCURRENCY,
+                 poll: float = WORKER_POLL):
+        self.registry = registry
+        self.types = list(types)
+        self.concurrency = max(1, concurrency)
+        self.poll = poll
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix="worker")
+        self.running: Dict[str, Task] = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.counters = {"claimed": 0, "done": 0, "failed": 0, "lost": 0}
+
+    def stop(self, *_):
+        self.stop_event.set()
+        self.wakeup.set()
+
+    def run(self):
+        logger.info("Worker %s : types %s, %d emplacements", self.id, ",".join(self.types), self.concurrency)
+        heartbeat = threading.Thread(target=self._heartbeat, name="worker-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while not self.stop_event.is_set():
+                self.wakeup.clear()
+                with self.lock:
+                    free = self.concurrency - len(self.running)
+                claimed = []
+                if free > 0:
+                    try:
+                        claimed = self.registry.claim(self.id, self.types, free)
+                    except Exception as e:
+                        logger.warning("Réclamation impossible : %s", e)
+                for task in claimed:
+                    with self.lock:
+                        self.running[task.id] = task
+                    self.counters["claimed"] += 1
+                    self.executor.submit(self._execute, task)
+                # File vide ou emplacements pleins : on attend une fin de tâche ou le prochain tour
+                if not claimed or free == len(claimed):
+                    self.wakeup.wait(self.poll)
+        finally:
+            # Arrêt propre : plus de réclamation, les tâches en cours vont jusqu'au bout
+            self.executor.shutdown(wait=True)
+            self.stop_event.set()
+            heartbeat.join()
+        logger.info("Worker %s arrêté : %s", self.id, self.counters)
+
+    def _execute(self, task: Task):
+        logger.info("Tâche %s (%s) : tentative %s", task.id, task.handler, task.attempts)
+        try:
+            try:
+                result = jobs.run(task.handler, task.args or [])
+                kept = self.registry.complete(self.id, task, result)
+                self.counters["done"] += 1
+            except Exception as e:
+                logger.warning("Tâche %s en échec : %s", task.id, e)
+                kept = self.registry.complete(self.id, task, error=str(e))
+                self.counters["failed"] += 1
+            if not kept:
+                logger.warning("Tâche %s : bail perdu, résultat ignoré", task.id)
+                self.counters["lost"] += 1
+        except Exception as e:
+            logger.error("Tâche %s : écriture du résultat impossible : %s", task.id, e)
+        finally:
+            with self.lock:
+                self.running.pop(task.id, None)
+            self.wakeup.set()
+
+    def _heartbeat(self):
+        evicted = time.monotonic()
+        while True:
+            with self.lock:
+                ids = list(self.running)
+            if self.stop_event.is_set() and not ids:
+                return
+            try:
+                if ids:
+                    self.registry.extend(self.id, ids)
+                if time.monotonic() - evicted > EVICT_INTERVAL:
+                    self.registry.evict()
+                    evicted = time.monotonic()
+            except Exception as e:
+                logger.warning("Renouvellement du bail impossible : %s", e)
+            time.sleep(max(1.0, self.registry.lease / 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de tâches de fond (TASK_BACKEND=db)")
+    parser.add_argument("--types", default=WORKER_TYPES, help="types de tâches acceptés, séparés par des virgules")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument("--poll", type=float, default=WORKER_POLL)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    unknown = [t for t in types if t not in jobs.HANDLERS]
+    if unknown:
+        parser.error(f"types inconnus : {', '.join(unknown)}")
+    configure_db()
+    # Versions en base : écritures d'inventaire signalées à l'API, cache host_by_ip validé
+    cache.track_writes(engine)
+    worker = Worker(TaskRegistry(engine, None, backend="db"), types, args.concurrency, args.poll)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    scan_writer.start()
+    try:
+        worker.run()
+    finally:
+        scan_writer.stop()
+
+
+if __name__ == "__main__":
+    main()